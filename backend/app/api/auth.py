@@ -1,46 +1,45 @@
+import hashlib
+import hmac
 import json
 import logging
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Any, Dict, Optional, Set
+from urllib.parse import urlencode, urlparse
 
-import spotipy
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
 from pydantic import BaseModel
-from spotipy.cache_handler import CacheHandler
-from spotipy.exceptions import SpotifyException
-from spotipy.oauth2 import SpotifyOAuth
 
-from app.core.config import settings
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+
+# spotipy and python-jose are imported inside the functions that use them so
+# that importing the app stays cheap on serverless cold starts.
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # OAuth2 scheme for token authentication
 oauth2_scheme = HTTPBearer()
+optional_oauth2_scheme = HTTPBearer(auto_error=False)
 
-# Secret key for JWT
-SECRET_KEY = settings.SECRET_KEY
+# JWT signing algorithm
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
 # Token blacklist to track invalidated tokens
 token_blacklist: Set[str] = set()
 
+# Cookie tying an OAuth state to the browser that started the login
+OAUTH_STATE_COOKIE = "spotifeye_oauth_state"
 
-class NoCacheHandler(CacheHandler):
-    """Custom cache handler that doesn't persist tokens."""
-
-    def get_cached_token(self):
-        return None
 
-    def save_token_to_cache(self, token_info):
-        pass
+@lru_cache()
+def get_token_claims_cache() -> TTLCache[Dict[str, Any]]:
+    """Return the cache of verified JWT claims, keyed by token digest."""
+    return TTLCache(maxsize=get_settings().TOKEN_CLAIMS_CACHE_SIZE)
 
 
 class CallbackRequest(BaseModel):
@@ -49,164 +48,278 @@ class CallbackRequest(BaseModel):
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a new JWT token."""
+    from jose import jwt
+
+    settings = get_settings()
     try:
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + expires_delta
         else:
-            expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            expire = datetime.utcnow() + timedelta(
+                minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
+            )
         to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
         return encoded_jwt
     except Exception as e:
-        logger.error(f"Error creating JWT token: {str(e)}")
+        logger.error("Error creating JWT token: %s", e)
         raise HTTPException(
             status_code=500, detail="Error creating authentication token"
         )
 
 
+def _token_digest(token: str) -> bytes:
+    """Return the cache key for a raw JWT."""
+    return hashlib.sha256(token.encode()).digest()
+
+
+def verify_token_claims(token: str) -> Dict[str, Any]:
+    """
+    Verify a JWT and return its claims.
+
+    Successfully verified claims are cached by token digest until the token
+    expires, so repeat requests from the same session skip ``jwt.decode``.
+    Blacklisted tokens are rejected before the cache is consulted.
+
+    Raises:
+        HTTPException: 401 if the token is revoked, malformed or expired
+    """
+    invalid_token = HTTPException(
+        status_code=401,
+        detail="Invalid token format",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if token in token_blacklist:
+        raise invalid_token
+
+    cache = get_token_claims_cache()
+    key = _token_digest(token)
+    claims = cache.get(key)
+    if claims is not None:
+        return claims
+
+    from jose import JWTError, jwt
+
+    try:
+        claims = jwt.decode(token, get_settings().SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise invalid_token
+
+    expires_at = claims.get("exp")
+    if isinstance(expires_at, (int, float)):
+        cache.set(key, claims, float(expires_at))
+    return claims
+
+
+async def get_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(
+        optional_oauth2_scheme
+    ),
+) -> Dict[str, Any]:
+    """Return the verified claims of the request's bearer token."""
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    return verify_token_claims(credentials.credentials)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme),
 ) -> str:
     """Validate JWT token and return Spotify access token."""
+    from app.services.activity import get_activity_tracker
+    from app.services.oauth import get_oauth_client
+    from app.services.spotify import SpotifyService
+
     credentials_exception = HTTPException(
         status_code=401,
         detail="Invalid authentication credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        token = credentials.credentials
-        # Check if token is blacklisted
-        if token in token_blacklist:
-            raise credentials_exception
-
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        spotify_token: str = payload.get("sub")
-        if spotify_token is None:
-            raise credentials_exception
+    payload = verify_token_claims(credentials.credentials)
+    spotify_token: Optional[str] = payload.get("sub")
+    if spotify_token is None:
+        raise credentials_exception
 
-        # Try to use the token
-        sp = spotipy.Spotify(auth=spotify_token)
-        try:
-            # Test the token with a simple API call
-            sp.current_user()
+    # Try to use the token
+    service = SpotifyService(spotify_token)
+    try:
+        # Test the token with a simple API call
+        profile = await service.get_profile(refresh=True)
+        if profile and profile.get("id"):
+            # Remember the session so background jobs can keep its data warm
+            get_activity_tracker().touch(
+                profile["id"], spotify_token, payload.get("refresh_token")
+            )
+        return spotify_token
+    except HTTPException as e:
+        if e.status_code >= 500 or e.status_code == 429:
+            # Spotify is failing or throttling: fail fast rather than logging
+            # the user out, unless it accepted this session before
+            if await service.last_known_profile() is None:
+                raise
             return spotify_token
-        except SpotifyException as e:
-            if e.http_status == 401:
-                # Token is expired, try to refresh
-                refresh_token = payload.get("refresh_token")
-                if refresh_token:
-                    try:
-                        sp_oauth = SpotifyOAuth(
-                            client_id=settings.SPOTIFY_CLIENT_ID,
-                            client_secret=settings.SPOTIFY_CLIENT_SECRET,
-                            redirect_uri=settings.SPOTIFY_REDIRECT_URI,
-                            scope=settings.SPOTIFY_SCOPES,
-                        )
-                        new_token_info = sp_oauth.refresh_access_token(refresh_token)
-                        # Create new JWT with refreshed token
-                        new_jwt = create_access_token(
-                            data={
-                                "sub": new_token_info["access_token"],
-                                "refresh_token": new_token_info["refresh_token"],
-                            }
-                        )
-                        raise HTTPException(
-                            status_code=401,
-                            detail="Token expired",
-                            headers={"X-New-Token": new_jwt},
-                        )
-                    except Exception as e:
-                        logger.error(f"Error refreshing token: {str(e)}")
-                        raise credentials_exception
-            logger.error(f"Spotify API error: {str(e)}")
-            raise credentials_exception
-    except JWTError:
+        if e.status_code == 401:
+            # Token is expired, try to refresh
+            refresh_token = payload.get("refresh_token")
+            if refresh_token:
+                try:
+                    new_token_info = await get_oauth_client().refresh_access_token(
+                        refresh_token
+                    )
+                    # Create new JWT with refreshed token
+                    new_jwt = create_access_token(
+                        data={
+                            "sub": new_token_info["access_token"],
+                            "refresh_token": new_token_info["refresh_token"],
+                        }
+                    )
+                    raise HTTPException(
+                        status_code=401,
+                        detail="Token expired",
+                        headers={"X-New-Token": new_jwt},
+                    )
+                except Exception as e:
+                    logger.error("Error refreshing token: %s", e)
+                    raise credentials_exception
+        logger.error("Spotify API error: %s", e.detail)
         raise credentials_exception
 
 
+async def get_current_user_id(current_user: str = Depends(get_current_user)) -> str:
+    """Return the Spotify user id of the authenticated session."""
+    from app.services.spotify import SpotifyService
+
+    profile = await SpotifyService(current_user).get_profile()
+    return profile["id"]
+
+
+async def get_stream_user(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(
+        optional_oauth2_scheme
+    ),
+) -> str:
+    """
+    Validate a streaming request and return Spotify access token.
+
+    Browsers cannot set headers on an ``EventSource``, so the JWT may also be
+    passed as the ``token`` query parameter.
+    """
+    if credentials is None:
+        if not token:
+            raise HTTPException(status_code=401, detail="Invalid authorization header")
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return await get_current_user(credentials)
+
+
+def _state_digest(state: str) -> str:
+    """Return the value of the OAuth state cookie for ``state``."""
+    return hashlib.sha256(state.encode()).hexdigest()
+
+
+def _state_cookie_path() -> str:
+    """Return the path of the OAuth callback, the only one sent the cookie."""
+    return urlparse(get_settings().SPOTIFY_REDIRECT_URI).path or "/"
+
+
+def _state_cookie_secure() -> bool:
+    """Return whether the OAuth state cookie is only sent over https."""
+    settings = get_settings()
+    if settings.OAUTH_STATE_COOKIE_SECURE is not None:
+        return settings.OAUTH_STATE_COOKIE_SECURE
+    return urlparse(settings.SPOTIFY_REDIRECT_URI).scheme == "https"
+
+
 @router.get("/login")
 async def login():
+    from app.services.oauth import get_oauth_client, get_oauth_state_store
+
+    settings = get_settings()
     # Clear any existing sessions
     token_blacklist.clear()
 
-    sp_oauth = SpotifyOAuth(
-        client_id=settings.SPOTIFY_CLIENT_ID,
-        client_secret=settings.SPOTIFY_CLIENT_SECRET,
-        redirect_uri=settings.SPOTIFY_REDIRECT_URI,
-        scope=settings.SPOTIFY_SCOPES,
-        cache_handler=NoCacheHandler(),
+    state = await get_oauth_state_store().issue()
+    response = RedirectResponse(url=get_oauth_client().authorize_url(state))
+    # The callback must come back to this browser, not one sent a crafted link
+    response.set_cookie(
+        OAUTH_STATE_COOKIE,
+        _state_digest(state),
+        max_age=settings.OAUTH_STATE_TTL_SECONDS,
+        path=_state_cookie_path(),
+        secure=_state_cookie_secure(),
+        httponly=True,
+        samesite="lax",
     )
-    auth_url = sp_oauth.get_authorize_url()
-    return RedirectResponse(url=auth_url)
+    return response
 
 
 @router.get("/callback")
-async def callback(code: str):
+async def callback(
+    code: str,
+    state: Optional[str] = None,
+    state_cookie: Optional[str] = Cookie(default=None, alias=OAUTH_STATE_COOKIE),
+):
+    from app.services.oauth import OAuthError, get_oauth_client, get_oauth_state_store
+
+    settings = get_settings()
     try:
-        logger.info(f"Received callback with code: {code[:10]}...")
-        
-        sp_oauth = SpotifyOAuth(
-            client_id=settings.SPOTIFY_CLIENT_ID,
-            client_secret=settings.SPOTIFY_CLIENT_SECRET,
-            redirect_uri=settings.SPOTIFY_REDIRECT_URI,
-            scope=settings.SPOTIFY_SCOPES,
-            cache_handler=NoCacheHandler(),
-        )
-        logger.info(f"Created SpotifyOAuth with redirect_uri: {settings.SPOTIFY_REDIRECT_URI}")
+        logger.info("Received OAuth callback")
+
+        # Only accept logins this server started, in this browser, each once
+        if (
+            not state
+            or not state_cookie
+            or not hmac.compare_digest(state_cookie, _state_digest(state))
+            or not await get_oauth_state_store().consume(state)
+        ):
+            raise OAuthError("Invalid or expired login state")
 
         # Exchange code for token
-        logger.info("Exchanging code for token...")
-        token_info = sp_oauth.get_access_token(code)
+        token_info = await get_oauth_client().exchange_code(code)
         logger.info("Successfully exchanged code for token")
 
         # Create a JWT token with the Spotify access token
-        logger.info("Creating JWT token...")
         jwt_token = create_access_token(
             data={
                 "sub": token_info["access_token"],
                 "refresh_token": token_info["refresh_token"],
             }
         )
-        logger.info("Successfully created JWT token")
 
         # Redirect to frontend with JWT token
-        frontend_url = f"{settings.FRONTEND_URL}/?token={jwt_token}"
-        logger.info(f"Redirecting to frontend: {frontend_url}")
-        return RedirectResponse(url=frontend_url)
+        logger.info("Redirecting to frontend with new session")
+        response = RedirectResponse(url=f"{settings.FRONTEND_URL}/?token={jwt_token}")
     except Exception as e:
-        logger.error(f"Error in callback: {str(e)}")
-        error_url = f"{settings.FRONTEND_URL}/?error={str(e)}"
-        logger.info(f"Redirecting to frontend with error: {error_url}")
-        return RedirectResponse(url=error_url)
+        logger.error("Error in callback: %s", e)
+        error_url = f"{settings.FRONTEND_URL}/?{urlencode({'error': str(e)})}"
+        response = RedirectResponse(url=error_url)
+    response.delete_cookie(
+        OAUTH_STATE_COOKIE,
+        path=_state_cookie_path(),
+        secure=_state_cookie_secure(),
+        httponly=True,
+        samesite="lax",
+    )
+    return response
 
 
 @router.get("/me")
-async def get_me(request: Request):
+async def get_me(claims: Dict[str, Any] = Depends(get_token_claims)):
+    import spotipy
+
+    spotify_token = claims.get("sub")
+    if not spotify_token:
+        raise HTTPException(status_code=401, detail="Invalid token format")
     try:
-        # Get the token from the Authorization header
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            raise HTTPException(status_code=401, detail="Invalid authorization header")
+        # Create a Spotify client with the token
+        sp = spotipy.Spotify(auth=spotify_token)
 
-        token = auth_header.split(" ")[1]
-        try:
-            # Decode the JWT token
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            spotify_token = payload.get("sub")
-            if not spotify_token:
-                raise HTTPException(status_code=401, detail="Invalid token format")
-
-            # Create a Spotify client with the token
-            sp = spotipy.Spotify(auth=spotify_token)
-
-            # Get user profile
-            user = sp.current_user()
-            return user
-        except JWTError:
-            raise HTTPException(status_code=401, detail="Invalid token format")
+        # Get user profile
+        user = sp.current_user()
+        return user
     except Exception as e:
-        logger.error(f"Error in /me endpoint: {str(e)}")
+        logger.error("Error in /me endpoint: %s", e)
         raise HTTPException(status_code=401, detail=str(e))
 
 
@@ -219,8 +332,9 @@ async def logout(request: Request):
             token = auth_header.split(" ")[1]
             # Add token to blacklist
             token_blacklist.add(token)
+            get_token_claims_cache().pop(_token_digest(token))
             logger.info("Token added to blacklist")
     except Exception as e:
-        logger.error(f"Error during logout: {str(e)}")
+        logger.error("Error during logout: %s", e)
 
     return {"message": "Logged out successfully"}
@@ -0,0 +1,49 @@
+from typing import TYPE_CHECKING
+
+from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi.responses import Response
+
+from app.core.config import get_settings
+
+if TYPE_CHECKING:
+    from app.services.thumbnails import ThumbnailService
+
+router = APIRouter()
+
+# Thumbnails never change for a given path, so browsers may keep them a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _thumbnail_service() -> "ThumbnailService":
+    """Return the thumbnail service, importing httpx on first use."""
+    from app.services.thumbnails import get_thumbnail_service
+
+    return get_thumbnail_service()
+
+
+@router.get("/{image_id}/{width}.{fmt}")
+async def get_thumbnail(
+    image_id: str = Path(pattern="^[0-9a-f]{40}$"),
+    width: int = Path(),
+    fmt: str = Path(pattern="^(webp|avif)$"),
+    service: "ThumbnailService" = Depends(_thumbnail_service),
+) -> Response:
+    """
+    Get a Spotify artwork image resized to ``width``.
+
+    Args:
+        image_id: Spotify CDN image id (40 hex characters)
+        width: Thumbnail width in pixels; one of ``THUMBNAIL_WIDTHS``
+        fmt: ``webp`` or ``avif``
+
+    Returns:
+        The encoded image, cacheable forever
+    """
+    from app.services.thumbnails import MEDIA_TYPES
+
+    if width not in get_settings().THUMBNAIL_WIDTHS:
+        raise HTTPException(status_code=404, detail="Unsupported thumbnail width")
+    body = await service.get(image_id, width, fmt)
+    return Response(
+        body, media_type=MEDIA_TYPES[fmt], headers={"Cache-Control": IMMUTABLE}
+    )
@@ -0,0 +1,66 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Request
+
+router = APIRouter()
+
+
+@router.get("/upstream")
+async def get_upstream_metrics() -> Dict[str, Any]:
+    """
+    Get the state of each Spotify endpoint's circuit breaker and hedging.
+
+    Returns:
+        Per endpoint: breaker state, consecutive failures, times opened,
+        calls, calls rejected while open, p95 latency and hedge win rate
+    """
+    from app.services.spotify import get_rate_limiter, get_upstreams
+
+    return {
+        "rate_limiter_pressure": round(get_rate_limiter().pressure, 4),
+        "endpoints": {
+            name: upstream.metrics() for name, upstream in get_upstreams().items()
+        },
+    }
+
+
+@router.get("/admission")
+async def get_admission_metrics() -> Dict[str, Any]:
+    """
+    Get the admission controller's load and rejection counts.
+
+    Returns:
+        Requests in flight and queued now, and counts of admitted, queued
+        and rejected (per-user limit or overload) requests since start
+    """
+    from app.core.admission import get_admission_controller
+
+    return get_admission_controller().metrics()
+
+
+@router.get("/logging")
+async def get_logging_metrics(request: Request) -> Dict[str, Any]:
+    """
+    Get the logging pipeline's backlog and discarded record counts.
+
+    Returns:
+        Records waiting to be written, and records dropped on a full queue
+        or sampled out since start; empty before startup has run
+    """
+    log_pipeline = getattr(request.app.state, "log_pipeline", None)
+    return log_pipeline.metrics() if log_pipeline is not None else {}
+
+
+@router.get("/cache")
+async def get_cache_metrics() -> Dict[str, Any]:
+    """
+    Get how the adaptive top list TTLs compare with the fixed TTL.
+
+    Returns:
+        Fetches that found the list changed or unchanged, upstream calls
+        saved and possibly stale responses served against the fixed TTL,
+        and the spread of the learned TTLs
+    """
+    from app.services.spotify import get_adaptive_ttl
+
+    return get_adaptive_ttl().metrics()
@@ -1,13 +1,34 @@
-from typing import Any, Dict, List
+import asyncio
+import json
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
-from app.api.auth import get_current_user
-from app.services.spotify import SpotifyService
+from app.api.auth import get_current_user, get_current_user_id, get_stream_user
+from app.core.config import get_settings
+
+if TYPE_CHECKING:
+    from app.services.spotify import SpotifyService
 
 router = APIRouter()
 
 
+def with_thumbnails(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Add thumbnail URLs to Spotify items (see ``app.services.thumbnails``)."""
+    from app.services import thumbnails
+
+    return thumbnails.with_thumbnails(items)
+
+
+def _spotify_service(access_token: str) -> "SpotifyService":
+    """Build a SpotifyService, importing spotipy on first use."""
+    from app.services.spotify import SpotifyService
+
+    return SpotifyService(access_token)
+
+
 @router.get("/top-tracks")
 async def get_top_tracks(
     current_user: str = Depends(get_current_user),
@@ -29,8 +50,9 @@ async def get_top_tracks(
     Returns:
         List of track objects
     """
-    spotify_service = SpotifyService(current_user)
-    return await spotify_service.get_top_tracks(limit=limit, time_range=time_range)
+    spotify_service = _spotify_service(current_user)
+    items = await spotify_service.get_top_tracks(limit=limit, time_range=time_range)
+    return with_thumbnails(items)
 
 
 @router.get("/top-artists")
@@ -54,8 +76,9 @@ async def get_top_artists(
     Returns:
         List of artist objects
     """
-    spotify_service = SpotifyService(current_user)
-    return await spotify_service.get_top_artists(limit=limit, time_range=time_range)
+    spotify_service = _spotify_service(current_user)
+    items = await spotify_service.get_top_artists(limit=limit, time_range=time_range)
+    return with_thumbnails(items)
 
 
 @router.get("/recently-played")
@@ -72,5 +95,454 @@ async def get_recently_played(
     Returns:
         List of recently played track objects
     """
-    spotify_service = SpotifyService(current_user)
-    return await spotify_service.get_recently_played(limit=limit)
+    spotify_service = _spotify_service(current_user)
+    items = await spotify_service.get_recently_played(limit=limit)
+    return with_thumbnails(items)
+
+
+@router.get("/stats/genres")
+async def get_genre_stats(
+    current_user: str = Depends(get_current_user),
+    time_range: Optional[str] = Query(
+        default=None, regex="^(short_term|medium_term|long_term)$"
+    ),
+    limit: int = Query(default=20, ge=1, le=100),
+) -> Dict[str, Any]:
+    """
+    Get rank-weighted genre statistics from the user's top artists.
+
+    Args:
+        time_range: Single time range to compute; all three plus a
+            ``combined`` entry when omitted
+        limit: Number of genres and genre pairs to return per range
+
+    Returns:
+        Per time range: genre distribution, diversity (entropy, effective
+        genre count), concentration (HHI) and genre co-occurrence pairs
+    """
+    from app.services import stats
+
+    return await stats.get_genre_stats(
+        _spotify_service(current_user), time_range=time_range, limit=limit
+    )
+
+
+@router.get("/stats/artists")
+async def get_artist_stats(
+    current_user: str = Depends(get_current_user),
+    time_range: Optional[str] = Query(
+        default=None, regex="^(short_term|medium_term|long_term)$"
+    ),
+    limit: int = Query(default=20, ge=1, le=50),
+) -> Dict[str, Any]:
+    """
+    Get artist statistics from the user's top artists and tracks.
+
+    Args:
+        time_range: Single time range to compute; all three plus
+            ``consistent_artists`` when omitted
+        limit: Number of artists to return per range
+
+    Returns:
+        Per time range: artists' rank-weighted share of top tracks with
+        diversity and concentration indices
+    """
+    from app.services import stats
+
+    return await stats.get_artist_stats(
+        _spotify_service(current_user), time_range=time_range, limit=limit
+    )
+
+
+@router.get("/trends")
+async def get_trends(
+    current_user: str = Depends(get_current_user),
+    kind: Optional[str] = Query(default=None, regex="^(tracks|artists)$"),
+) -> Dict[str, Any]:
+    """
+    Get rank movement of top tracks and artists between time ranges.
+
+    Args:
+        kind: Only compute ``tracks`` or ``artists``; both when omitted
+
+    Returns:
+        Per kind and comparison (``medium_term_to_short_term``,
+        ``long_term_to_medium_term``, ``long_term_to_short_term``): rising
+        and falling items with their rank delta, new entries and drop-outs
+    """
+    from app.services import trends
+
+    return await trends.get_trends(
+        _spotify_service(current_user), kinds=[kind] if kind else trends.KINDS
+    )
+
+
+@router.get("/history/top")
+async def get_history_top(
+    user_id: str = Depends(get_current_user_id),
+    kind: str = Query(default="tracks", regex="^(tracks|artists)$"),
+    time_range: str = Query(
+        default="medium_term", regex="^(short_term|medium_term|long_term)$"
+    ),
+    day: Optional[date] = Query(default=None, alias="date"),
+    limit: int = Query(default=10, ge=1, le=50),
+) -> Dict[str, Any]:
+    """
+    Get a top list as it stood on a past day.
+
+    Args:
+        kind: ``tracks`` or ``artists``
+        time_range: Spotify time range of the list
+        date: Day to read (ISO format); today when omitted
+        limit: Number of items to return (1-50)
+
+    Returns:
+        The day and its ranked items (id, name, rank)
+    """
+    from app.services.history import get_snapshot_store
+
+    day = day or date.today()
+    items = await asyncio.to_thread(
+        get_snapshot_store().snapshot, user_id, kind, time_range, day
+    )
+    if items is None:
+        raise HTTPException(status_code=404, detail="No snapshot for this date")
+    return {"date": day.isoformat(), "items": items[:limit]}
+
+
+@router.get("/history/rank")
+async def get_history_rank(
+    item_id: str,
+    start: date,
+    user_id: str = Depends(get_current_user_id),
+    kind: str = Query(default="tracks", regex="^(tracks|artists)$"),
+    time_range: str = Query(
+        default="medium_term", regex="^(short_term|medium_term|long_term)$"
+    ),
+    end: Optional[date] = None,
+) -> Dict[str, Any]:
+    """
+    Get the daily rank of one track or artist over a date range.
+
+    Args:
+        item_id: Spotify id of the track or artist
+        start: First day (ISO format)
+        end: Last day (ISO format); today when omitted. At most a year
+            after ``start``
+        kind: ``tracks`` or ``artists``
+        time_range: Spotify time range of the list
+
+    Returns:
+        ``series`` of ``{date, rank}``; rank is null on days the item was
+        not in the list
+    """
+    from app.services.history import get_snapshot_store
+
+    end = end or date.today()
+    if end < start or end - start > timedelta(days=366):
+        raise HTTPException(
+            status_code=400, detail="Date range must be between 0 and 366 days"
+        )
+    series = await asyncio.to_thread(
+        get_snapshot_store().rank_history,
+        user_id,
+        kind,
+        time_range,
+        item_id,
+        start,
+        end,
+    )
+    return {"id": item_id, "series": series}
+
+
+@router.get("/wrapped/{year}")
+async def get_wrapped(
+    year: int, user_id: str = Depends(get_current_user_id)
+) -> Dict[str, Any]:
+    """
+    Get the current user's precomputed summary of a year.
+
+    Summaries are computed overnight by the ``wrapped.py`` batch job from
+    the snapshot history, not on request.
+
+    Args:
+        year: Year of the summary
+
+    Returns:
+        Top tracks, artists and genres of the year, and the top item of
+        each month
+    """
+    from app.services.spotify import get_disk_cache
+    from app.services.wrapped import wrapped_key
+
+    disk = get_disk_cache()
+    entry = None
+    if disk is not None:
+        entry = await asyncio.to_thread(disk.get, wrapped_key(user_id, year))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No summary for this year")
+    return entry[0]
+
+
+def _require_discoverable(user_id: str) -> None:
+    """Refuse taste matching to users who have not opted in to it themselves."""
+    from app.services.taste import get_taste_index
+
+    if not get_taste_index().is_discoverable(user_id):
+        raise HTTPException(
+            status_code=403, detail="Opt in to taste matching to compare listeners"
+        )
+
+
+@router.put("/taste/discoverable")
+async def set_taste_discoverable(
+    enabled: bool,
+    current_user: str = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+) -> Dict[str, Any]:
+    """
+    Opt in to, or out of, taste matching with other listeners.
+
+    Only users who opted in appear in other users' compatibility and
+    similar-listener results, and only they can look others up.
+
+    Args:
+        enabled: Whether the current user can be matched
+
+    Returns:
+        The current user's ``discoverable`` setting
+    """
+    from app.services.taste import get_taste_index, update_taste_vector
+
+    if enabled:
+        await update_taste_vector(_spotify_service(current_user), user_id)
+    await asyncio.to_thread(get_taste_index().set_discoverable, user_id, enabled)
+    return {"discoverable": enabled}
+
+
+@router.get("/taste/compatibility/{other_user_id}")
+async def get_taste_compatibility(
+    other_user_id: str,
+    current_user: str = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+) -> Dict[str, Any]:
+    """
+    Get the taste compatibility between the current user and another user.
+
+    The current user's taste vector is rebuilt from their (cached) top
+    lists. Both users must have opted in through ``/taste/discoverable``.
+
+    Args:
+        other_user_id: Spotify id of the user to compare with
+
+    Returns:
+        ``similarity`` (cosine, -1 to 1) and ``score`` (0-100)
+
+    Raises:
+        HTTPException: 403 if the current user has not opted in; 404 if
+            the other user has no taste profile or has not opted in
+    """
+    from app.services.taste import get_taste_index, update_taste_vector
+
+    _require_discoverable(user_id)
+    vector = await update_taste_vector(_spotify_service(current_user), user_id)
+    index = get_taste_index()
+    other = index.get(other_user_id) if index.is_discoverable(other_user_id) else None
+    if other is None:
+        raise HTTPException(status_code=404, detail="User has no taste profile")
+    similarity = float(vector @ other)
+    return {
+        "user_id": other_user_id,
+        "similarity": round(similarity, 4),
+        "score": round(max(similarity, 0.0) * 100),
+    }
+
+
+@router.get("/taste/similar")
+async def get_similar_listeners(
+    current_user: str = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    limit: int = Query(default=10, ge=1, le=100),
+) -> List[Dict[str, Any]]:
+    """
+    Get the opted-in listeners whose taste is most similar to the current user's.
+
+    Args:
+        limit: Number of listeners to return (1-100)
+
+    Returns:
+        Users (id, similarity, score), most similar first
+
+    Raises:
+        HTTPException: 403 if the current user has not opted in
+    """
+    from app.services.taste import get_taste_index, update_taste_vector
+
+    _require_discoverable(user_id)
+    vector = await update_taste_vector(_spotify_service(current_user), user_id)
+    matches = await asyncio.to_thread(
+        get_taste_index().most_similar,
+        vector,
+        limit,
+        exclude=user_id,
+        discoverable_only=True,
+    )
+    return [
+        {
+            "user_id": match_id,
+            "similarity": round(similarity, 4),
+            "score": round(max(similarity, 0.0) * 100),
+        }
+        for match_id, similarity in matches
+    ]
+
+
+@router.get("/artists/insights")
+async def get_artists_insights(
+    ids: str = Query(min_length=1),
+    current_user: str = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+) -> Dict[str, Any]:
+    """
+    Get the insights of several artists in one response.
+
+    Args:
+        ids: Comma-separated Spotify artist ids (at most 20)
+
+    Returns:
+        ``artists``: per artist, as ``/artists/{artist_id}/insights``, in
+        the order given; ``not_found``: ids Spotify does not know, and ids
+        that are not Spotify ids at all
+    """
+    from app.services.artists import MAX_ARTISTS, artist_insights, is_artist_id
+
+    artist_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not artist_ids or len(artist_ids) > MAX_ARTISTS:
+        raise HTTPException(
+            status_code=400, detail=f"Give between 1 and {MAX_ARTISTS} artist ids"
+        )
+    # Spotify rejects a whole several-artists request over one malformed id
+    valid = [i for i in artist_ids if is_artist_id(i)]
+    insights = (
+        await artist_insights(_spotify_service(current_user), user_id, valid)
+        if valid
+        else []
+    )
+    found = {insight["artist"]["id"] for insight in insights}
+    return {
+        "artists": insights,
+        "not_found": [i for i in artist_ids if i not in found],
+    }
+
+
+@router.get("/artists/{artist_id}/insights")
+async def get_artist_insights(
+    artist_id: str,
+    current_user: str = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+) -> Dict[str, Any]:
+    """
+    Get an artist with their top tracks, albums, related artists and the
+    user's own listening of them.
+
+    Args:
+        artist_id: Spotify artist id
+
+    Returns:
+        ``artist``; ``top_tracks`` in the user's market; ``albums`` and
+        singles; ``related_artists``; ``listening``: the user's plays, last
+        play and ranks of the artist, and their plays of the top tracks;
+        ``errors``: per list that could not be fetched (and is null), its
+        ``status`` and ``detail``
+    """
+    from app.services.artists import artist_insights, is_artist_id
+
+    if not is_artist_id(artist_id):
+        raise HTTPException(status_code=404, detail="Artist not found")
+    insights = await artist_insights(
+        _spotify_service(current_user), user_id, [artist_id]
+    )
+    if not insights:
+        raise HTTPException(status_code=404, detail="Artist not found")
+    return insights[0]
+
+
+@router.get("/search-history")
+async def search_history(
+    q: str = Query(min_length=1, max_length=100),
+    current_user: str = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    kind: Optional[str] = Query(default=None, regex="^(track|artist|album)$"),
+    limit: int = Query(default=20, ge=1, le=50),
+) -> Dict[str, Any]:
+    """
+    Search the tracks, artists and albums in the user's listening history.
+
+    Words of three or more characters match anywhere in a name, shorter
+    ones at the start of a word. Tracks and albums also match on their
+    artists' names.
+
+    Args:
+        q: Search text
+        kind: Only return ``track``, ``artist`` or ``album`` results
+        limit: Number of results to return (1-50)
+
+    Returns:
+        ``results``: matches (kind, id, name, artists, album, plays,
+        last_played_at and rank per time range), name matches first, then
+        by plays; with ``indexed`` items and the search time ``took_ms``
+    """
+    from app.services import search
+
+    return await search.search_history(
+        _spotify_service(current_user),
+        user_id,
+        q,
+        kinds=(kind,) if kind else search.KINDS,
+        limit=limit,
+    )
+
+
+@router.get("/recently-played/stream")
+async def stream_recently_played(
+    current_user: str = Depends(get_stream_user),
+) -> StreamingResponse:
+    """
+    Stream newly played tracks as Server-Sent Events.
+
+    Each ``plays`` event carries a JSON list of plays that appeared since the
+    previous event, newest first. Upstream is polled once per session however
+    many streams are open. An ``expired`` event is sent when the Spotify
+    token is rejected, after which the stream closes.
+
+    Returns:
+        ``text/event-stream`` response
+    """
+    from app.services.live import STREAM_CLOSED, get_recently_played_hub
+
+    hub = get_recently_played_hub()
+    queue = hub.subscribe(current_user)
+    heartbeat = get_settings().LIVE_HEARTBEAT_SECONDS
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    plays = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment line keeps idle connections open through proxies
+                    yield ": keep-alive\n\n"
+                    continue
+                if plays is STREAM_CLOSED:
+                    yield "event: expired\ndata: {}\n\n"
+                    return
+                yield f"event: plays\ndata: {json.dumps(plays)}\n\n"
+        finally:
+            hub.unsubscribe(current_user, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,157 @@
+"""
+Cache TTLs learned from how often each cached response actually changes.
+
+Every upstream fetch of an adaptive entry is compared, by content hash,
+with the previous fetch under the same key. An unchanged response grows
+the key's TTL by ``growth`` and a changed one shrinks it by ``shrink``,
+within ``[min_seconds, max_seconds]``. Lists that barely move are
+refetched rarely; lists that churn are refetched more often than the
+fixed ``base_seconds`` TTL would.
+
+Two counters compare this with the fixed TTL:
+
+- ``calls_saved``: upstream calls the fixed TTL would have made. The
+  first hit in each base-TTL window after the first counts one; a
+  background refresh tops this up to the refreshes a warmer on the fixed
+  TTL would have made since the previous fetch.
+- ``stale_served``: hits older than ``base_seconds`` on entries found to
+  have changed at their next fetch, i.e. possibly stale responses the
+  fixed TTL would have refetched.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+
+@dataclass
+class _Learned:
+    ttl: float
+    digest: int
+    fetched_at: float
+    # Calls counted as saved on the current entry, and the last base-TTL
+    # window one was counted in
+    credited: int = 0
+    window: int = 0
+    # Hits on the current entry older than the base TTL
+    extended_hits: int = 0
+
+
+def content_digest(ids: Iterable[Any]) -> int:
+    """Return a hash of a response's ordered item ids."""
+    return hash(tuple(ids))
+
+
+class AdaptiveTTL:
+    """Per-key TTLs adapted to observed change, bounded to ``maxsize`` keys."""
+
+    def __init__(
+        self,
+        base_seconds: float,
+        min_seconds: float,
+        growth: float = 1.5,
+        shrink: float = 0.5,
+        maxsize: int = 10000,
+    ):
+        if not 0 < min_seconds <= base_seconds:
+            raise ValueError("min_seconds must be positive and at most base_seconds")
+        if growth < 1 or not 0 < shrink <= 1:
+            raise ValueError("growth must be at least 1 and shrink in (0, 1]")
+        self.base_seconds = base_seconds
+        self.min_seconds = min_seconds
+        self.growth = growth
+        self.shrink = shrink
+        self.maxsize = maxsize
+        self._learned: "OrderedDict[Hashable, _Learned]" = OrderedDict()
+        self.fetches = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.calls_saved = 0
+        self.stale_served = 0
+
+    def ttl(self, key: Hashable) -> float:
+        """Return the TTL currently learned for ``key``."""
+        learned = self._learned.get(key)
+        return learned.ttl if learned is not None else self.base_seconds
+
+    def fetched(
+        self,
+        key: Hashable,
+        digest: int,
+        max_seconds: float,
+        background: bool = False,
+        now: Optional[float] = None,
+    ) -> float:
+        """
+        Record an upstream fetch of ``key`` and return the TTL to cache it for.
+
+        Args:
+            key: What the TTL is learned for
+            digest: ``content_digest`` of the fetched response
+            max_seconds: Upper bound of the TTL for this key
+            background: The fetch refreshed the entry ahead of any request
+            now: Time of the fetch, defaulting to the current time
+        """
+        now = time.time() if now is None else now
+        self.fetches += 1
+        learned = self._learned.pop(key, None)
+        if learned is None:
+            learned = _Learned(
+                ttl=min(self.base_seconds, max_seconds), digest=digest, fetched_at=now
+            )
+        else:
+            if background:
+                # A warmer on the fixed TTL refreshes once per base window
+                windows = math.ceil((now - learned.fetched_at) / self.base_seconds) - 1
+                self.calls_saved += max(windows - learned.credited, 0)
+            if digest == learned.digest:
+                self.unchanged += 1
+                ttl = learned.ttl * self.growth
+            else:
+                self.changed += 1
+                self.stale_served += learned.extended_hits
+                ttl = learned.ttl * self.shrink
+            learned.ttl = max(self.min_seconds, min(ttl, max_seconds))
+            learned.digest = digest
+            learned.fetched_at = now
+            learned.credited = learned.window = learned.extended_hits = 0
+        self._learned[key] = learned
+        while len(self._learned) > self.maxsize:
+            self._learned.popitem(last=False)
+        return learned.ttl
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> None:
+        """Record a response for ``key`` served from the cache."""
+        learned = self._learned.get(key)
+        if learned is None:
+            return
+        now = time.time() if now is None else now
+        window = int((now - learned.fetched_at) // self.base_seconds)
+        if window < 1:
+            return
+        learned.extended_hits += 1
+        if window > learned.window:
+            # A fixed TTL would have refetched on the first hit of the window
+            self.calls_saved += 1
+            learned.credited += 1
+            learned.window = window
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return fetch and change counts, savings, staleness and learned TTLs."""
+        ttls = [learned.ttl for learned in self._learned.values()]
+        return {
+            "keys": len(ttls),
+            "fetches": self.fetches,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "calls_saved": self.calls_saved,
+            "stale_served": self.stale_served,
+            "ttl_seconds": {
+                "base": self.base_seconds,
+                "mean": round(sum(ttls) / len(ttls), 1) if ttls else None,
+                "min": min(ttls, default=None),
+                "max": max(ttls, default=None),
+            },
+        }
@@ -0,0 +1,242 @@
+"""
+Admission control: bounded in-flight requests per user and in total.
+
+Each authenticated session may have at most ``max_per_user`` requests
+admitted or queued; more are rejected at once with 429, so one client
+stuck in a refresh loop cannot take the worker's capacity. Sessions are
+keyed by a digest of their verified token's subject (the Spotify access
+token), so a JWT re-issued for the same session shares its budget.
+Requests with missing or invalid credentials (artwork loaded by ``<img>``
+tags, the OAuth routes) are keyed by client address under the larger
+``ADMISSION_MAX_PER_CLIENT`` limit, since one address may be a proxy or
+NAT in front of many browsers.
+
+At most ``max_in_flight`` requests run in total. Past that, requests wait
+in a bounded FIFO queue for up to ``queue_timeout`` seconds and are
+rejected with 503 when the queue is full or the wait runs out. Both
+rejections carry ``Retry-After``.
+
+Cheap routes (``ADMISSION_EXEMPT_PATHS``: the root, health and metrics
+checks, and the long-lived event stream) bypass admission entirely, so
+they stay fast while the API is saturated.
+"""
+
+import asyncio
+import hashlib
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, Hashable, Optional
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import get_settings
+
+TOO_MANY_REQUESTS = 429
+SERVICE_UNAVAILABLE = 503
+
+
+class AdmissionRejected(HTTPException):
+    """Raised when a request is not admitted."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+
+
+class AdmissionController:
+    """Per-key and global in-flight limits with a bounded wait queue."""
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_per_user: int,
+        queue_size: int,
+        queue_timeout: float,
+        retry_after: float,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self._per_user: Dict[Hashable, int] = {}
+        self._waiters: "Deque[asyncio.Future[None]]" = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_user = 0
+        self.rejected_overload = 0
+
+    async def acquire(self, user: Hashable = None, limit: Optional[int] = None) -> None:
+        """
+        Wait until the request may run.
+
+        Args:
+            user: Key the per-user limit applies to; None for anonymous
+                requests, which only count towards the global limit
+            limit: Requests ``user`` may have admitted or queued, if not
+                ``max_per_user``
+
+        Raises:
+            AdmissionRejected: 429 when ``user`` is at their limit, 503 when
+                the queue is full or the wait timed out
+        """
+        if user is not None:
+            if limit is None:
+                limit = self.max_per_user
+            if self._per_user.get(user, 0) >= limit:
+                self.rejected_user += 1
+                raise AdmissionRejected(
+                    TOO_MANY_REQUESTS,
+                    "Too many concurrent requests",
+                    self.retry_after,
+                )
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+        else:
+            if len(self._waiters) >= self.queue_size:
+                self.rejected_overload += 1
+                raise AdmissionRejected(
+                    SERVICE_UNAVAILABLE, "Server is overloaded", self.retry_after
+                )
+            await self._wait(user)
+        self._add(user, 1)
+        self.admitted += 1
+
+    async def _wait(self, user: Hashable) -> None:
+        """Queue until ``release`` hands over a slot."""
+        waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        # Queued requests count towards the user's limit
+        self._add(user, 1)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as the wait ended: pass it on
+                self._release_slot()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_overload += 1
+                raise AdmissionRejected(
+                    SERVICE_UNAVAILABLE, "Server is overloaded", self.retry_after
+                )
+            raise
+        finally:
+            self._add(user, -1)
+
+    def release(self, user: Hashable = None) -> None:
+        """Finish an admitted request, letting the next queued one run."""
+        self._add(user, -1)
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot moves to the waiter; in_flight is unchanged
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _add(self, user: Hashable, delta: int) -> None:
+        if user is None:
+            return
+        count = self._per_user.get(user, 0) + delta
+        if count > 0:
+            self._per_user[user] = count
+        else:
+            self._per_user.pop(user, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return current load and counters since start."""
+        return {
+            "in_flight": self.in_flight,
+            "queued_now": len(self._waiters),
+            "users_in_flight": len(self._per_user),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_user": self.rejected_user,
+            "rejected_overload": self.rejected_overload,
+        }
+
+
+@lru_cache()
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller."""
+    settings = get_settings()
+    return AdmissionController(
+        max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+        max_per_user=settings.ADMISSION_MAX_PER_USER,
+        queue_size=settings.ADMISSION_QUEUE_SIZE,
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+    )
+
+
+def admission_key(scope: Scope) -> Optional[Hashable]:
+    """Return the key the per-user limit of a request applies to."""
+    from app.api.auth import verify_token_claims
+
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                break
+            try:
+                subject = verify_token_claims(token).get("sub")
+            except HTTPException:
+                break
+            if subject:
+                return ("session", hashlib.sha256(subject.encode()).digest())
+            break
+    client = scope.get("client")
+    return ("client", client[0]) if client else None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware running HTTP requests through the admission controller.
+
+    Settings are read when Starlette builds the middleware stack, on the
+    first request, so importing the app does not load them.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        settings = get_settings()
+        self.app = app
+        self.enabled = settings.ADMISSION_ENABLED
+        self.exempt = frozenset(settings.ADMISSION_EXEMPT_PATHS)
+        self.max_per_client = settings.ADMISSION_MAX_PER_CLIENT
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            not self.enabled
+            or scope["type"] != "http"
+            or scope["path"] in self.exempt
+            or scope["method"] == "OPTIONS"
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        user = admission_key(scope)
+        limit = self.max_per_client if user and user[0] == "client" else None
+        controller = get_admission_controller()
+        try:
+            await controller.acquire(user, limit)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                {"detail": e.detail}, status_code=e.status_code, headers=e.headers
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(user)
@@ -0,0 +1,73 @@
+"""In-process caching primitives shared across the application."""
+
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    Bounded LRU cache whose entries expire at an absolute timestamp.
+
+    Lookups move the entry to the most-recently-used end; inserting past
+    ``maxsize`` evicts the least recently used entry. Expired entries are
+    dropped lazily when they are read, unless ``keep_stale`` is set: then
+    they stay until evicted so ``get_stale`` can serve them as a fallback.
+    """
+
+    def __init__(self, maxsize: int = 1024, keep_stale: bool = False):
+        """Create an empty cache holding at most ``maxsize`` entries."""
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.keep_stale = keep_stale
+        self._data: "OrderedDict[Hashable, Tuple[V, float]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """Return the live value for ``key`` or ``default``."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.time():
+            if not self.keep_stale:
+                del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def get_stale(self, key: Hashable) -> Optional[V]:
+        """Return the value for ``key`` even if it has expired."""
+        entry = self._data.get(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: V, expires_at: float) -> None:
+        """Store ``value`` under ``key`` until the unix time ``expires_at``."""
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def expires_at(self, key: Hashable) -> Optional[float]:
+        """Return the expiry time of a live entry without touching its recency."""
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[1]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove ``key`` and return its value, ignoring expiry."""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -26,6 +26,133 @@ class Settings(BaseSettings):
     # Security Settings
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    TOKEN_CLAIMS_CACHE_SIZE: int = 4096
+
+    # OAuth Settings
+    OAUTH_STATE_TTL_SECONDS: int = 600
+    # Unset: Secure only when SPOTIFY_REDIRECT_URI is https
+    OAUTH_STATE_COOKIE_SECURE: Optional[bool] = None
+    OAUTH_CONCURRENCY: int = 20
+    OAUTH_TIMEOUT_SECONDS: float = 10.0
+
+    # Spotify Response Cache Settings
+    RESPONSE_CACHE_SIZE: int = 10000
+    TOP_ITEMS_CACHE_TTL_SECONDS: int = 600
+    RECENTLY_PLAYED_CACHE_TTL_SECONDS: int = 60
+    PROFILE_CACHE_TTL_SECONDS: int = 3600
+    CATALOG_CACHE_TTL_SECONDS: int = 6 * 3600
+    DISK_CACHE_ENABLED: bool = True
+    DISK_CACHE_PATH: str = "spotifeye_cache.db"
+    DISK_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Adaptive TTL Settings (top list TTLs start at TOP_ITEMS_CACHE_TTL_SECONDS
+    # and move between the minimum and the per time range maximum; keep the
+    # minimum above CACHE_WARMER_LEAD_SECONDS)
+    ADAPTIVE_TTL_ENABLED: bool = True
+    ADAPTIVE_TTL_MIN_SECONDS: int = 120
+    ADAPTIVE_TTL_MAX_SECONDS: Dict[str, int] = {
+        "short_term": 3600,
+        "medium_term": 6 * 3600,
+        "long_term": 24 * 3600,
+    }
+    ADAPTIVE_TTL_GROWTH: float = 1.5
+    ADAPTIVE_TTL_SHRINK: float = 0.5
+
+    # Spotify Rate Limit Settings
+    SPOTIFY_RATE_LIMIT_PER_SECOND: float = 10.0
+    SPOTIFY_RATE_LIMIT_BURST: int = 20
+
+    # Spotify Upstream Resilience Settings
+    SPOTIFY_REQUEST_TIMEOUT_SECONDS: float = 5.0
+    SPOTIFY_RETRIES: int = 1
+    SPOTIFY_BREAKER_FAILURE_THRESHOLD: int = 5
+    SPOTIFY_BREAKER_RESET_SECONDS: int = 30
+    SPOTIFY_HEDGE_ENABLED: bool = False
+    SPOTIFY_HEDGE_MIN_SAMPLES: int = 20
+    SPOTIFY_HEDGE_MAX_PRESSURE: float = 0.5
+
+    # Artwork Thumbnail Settings (THUMBNAIL_WIDTH must be in THUMBNAIL_WIDTHS)
+    THUMBNAIL_DIR: str = "spotifeye_thumbnails"
+    THUMBNAIL_ORIGIN: str = "https://i.scdn.co/image/"
+    THUMBNAIL_WIDTH: int = 320
+    THUMBNAIL_WIDTHS: List[int] = [64, 160, 320, 640]
+    THUMBNAIL_FORMAT: str = "webp"  # or "avif"
+    THUMBNAIL_QUALITY: int = 75
+    THUMBNAIL_MAX_SOURCE_BYTES: int = 5 * 1024 * 1024
+    THUMBNAIL_MAX_BYTES: int = 512 * 1024 * 1024
+    # Missing or undecodable images are not refetched for this long
+    THUMBNAIL_FAILURE_TTL_SECONDS: float = 300
+
+    # Admission Control Settings (requests past the limits get 429/503)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_IN_FLIGHT: int = 64
+    ADMISSION_MAX_PER_USER: int = 8
+    # Anonymous requests (artwork, the OAuth routes) per client address,
+    # which may be a proxy or NAT shared by many users
+    ADMISSION_MAX_PER_CLIENT: int = 48
+    ADMISSION_QUEUE_SIZE: int = 128
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_RETRY_AFTER_SECONDS: float = 1.0
+    ADMISSION_EXEMPT_PATHS: List[str] = [
+        "/",
+        "/health",
+        "/metrics/upstream",
+        "/metrics/admission",
+        "/metrics/logging",
+        "/metrics/cache",
+        "/spotify/recently-played/stream",
+    ]
+
+    # Cache Warmer Settings (lead should exceed the interval and stay below
+    # the shortest cache TTL)
+    CACHE_WARMER_ENABLED: bool = True
+    CACHE_WARMER_INTERVAL_SECONDS: int = 20
+    CACHE_WARMER_LEAD_SECONDS: int = 30
+    CACHE_WARMER_CONCURRENCY: int = 4
+    CACHE_WARMER_ACTIVE_WINDOW_SECONDS: int = 3600
+    CACHE_WARMER_MAX_PRESSURE: float = 0.5
+
+    # Live Update Settings
+    LIVE_POLL_INTERVAL_SECONDS: int = 30
+    LIVE_HEARTBEAT_SECONDS: int = 15
+
+    # Listening History Settings
+    HISTORY_DB_PATH: str = "spotifeye_history.db"
+    SNAPSHOT_ENABLED: bool = True
+    SNAPSHOT_CHECK_INTERVAL_SECONDS: int = 3600
+    SNAPSHOT_KEYFRAME_DAYS: int = 30
+    SNAPSHOT_ACTIVE_WINDOW_DAYS: int = 30
+    SNAPSHOT_CONCURRENCY: int = 2
+
+    # Taste Compatibility Settings
+    TASTE_INDEX_PATH: str = "spotifeye_taste"
+    TASTE_ARTIST_BUCKETS: int = 512
+    TASTE_GENRE_BUCKETS: int = 256
+
+    # History Search Settings
+    SEARCH_INDEX_MAX_USERS: int = 1000
+    SEARCH_INDEX_IDLE_SECONDS: int = 1800
+    SEARCH_INDEX_REFRESH_SECONDS: int = 60
+
+    # Request Profiling Settings (off unless a sample rate or secret is set)
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_SECRET: str = ""
+    PROFILING_OUTPUT_DIR: str = "profiles"
+    PROFILING_FORMAT: str = "speedscope"  # or "html"
+    PROFILING_INTERVAL_SECONDS: float = 0.001
+    PROFILING_MAX_FILES: int = 200
+    PROFILING_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Logging Settings (records below WARNING logged while serving a request
+    # are sampled by path prefix; the longest matching prefix wins)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # or "text"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLE_RATE: float = 1.0
+    LOG_SAMPLE_RATES: Dict[str, float] = {"/spotify/": 0.1}
+
+    # Deployment Settings
+    COLD_START_MODE: bool = False
 
     class Config:
         env_file = ".env"
@@ -42,4 +169,8 @@ def get_settings() -> Settings:
     return Settings()
 
 
-settings = get_settings()
+def __getattr__(name: str) -> Any:
+    """Build the ``settings`` singleton on first access rather than at import."""
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
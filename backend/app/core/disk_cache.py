@@ -0,0 +1,150 @@
+"""
+Persistent second cache tier on local disk.
+
+Entries are pickled values in a single SQLite table. The database runs in
+WAL mode with ``synchronous=NORMAL``: every write is its own transaction,
+so a crash (or a restart mid-write) loses at most the last writes and
+never leaves a torn entry, and readers never block the writer.
+
+Stored bodies are read as one ``bytes`` object and unpickled straight
+from it, without an intermediate decode or copy. The total size of the
+stored bodies is bounded by ``max_bytes``; when it is exceeded the
+entries that expire soonest (already expired ones first) are evicted.
+
+Each process keeps its own running total of that size, so with several
+workers sharing one file it drifts from what is stored. It is recounted
+from the table whenever it crosses ``max_bytes``, before anything is
+evicted.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Hashable, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+"""
+
+# Fraction of max_bytes to shrink to when evicting, so eviction is batched
+EVICT_TO = 0.9
+
+
+class DiskCache:
+    """SQLite-backed cache of pickled values with absolute expiry times."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries"
+        ).fetchone()[0]
+
+    @staticmethod
+    def key_for(key: Hashable) -> str:
+        """Return the stored form of an in-memory cache key."""
+        return repr(key)
+
+    def get_entry(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Return ``(value, expires_at)`` for ``key``, even if it has expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?",
+                (self.key_for(key),),
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0]), row[1]
+        except Exception:
+            # Written by an incompatible version of the models; treat as a miss
+            self.pop(key)
+            return None
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Return ``(value, expires_at)`` for a live entry."""
+        entry = self.get_entry(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        """Store ``value`` under ``key`` until the unix time ``expires_at``."""
+        body = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        stored_key = self.key_for(key)
+        with self._lock, self._db:
+            previous = self._db.execute(
+                "SELECT LENGTH(value) FROM entries WHERE key = ?", (stored_key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (stored_key, body, expires_at),
+            )
+            self._size += len(body) - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                # Other workers may have written or evicted since we counted
+                self._size = self._db.execute(
+                    "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries"
+                ).fetchone()[0]
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Delete the soonest-expiring entries until under the size target."""
+        target = self.max_bytes * EVICT_TO
+        rows = self._db.execute(
+            "SELECT key, LENGTH(value) FROM entries ORDER BY expires_at"
+        )
+        doomed = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            doomed.append((key,))
+            self._size -= size
+        rows.close()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def pop(self, key: Hashable) -> bool:
+        """Remove ``key``; return whether this call removed it."""
+        stored_key = self.key_for(key)
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT LENGTH(value) FROM entries WHERE key = ?", (stored_key,)
+            ).fetchone()
+            if row is None:
+                return False
+            deleted = self._db.execute(
+                "DELETE FROM entries WHERE key = ?", (stored_key,)
+            ).rowcount
+            if deleted:
+                self._size -= row[0]
+        return bool(deleted)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries")
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Total bytes of stored bodies."""
+        return self._size
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._db.close()
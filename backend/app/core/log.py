@@ -0,0 +1,259 @@
+"""
+Structured logging that stays off the event loop.
+
+Loggers hand records to a bounded in-memory queue; a background thread
+formats them and writes them to stdout, so a slow or blocked stdout never
+stalls a request. Calls in the ``logger.info("Fetched %d tracks", n)``
+style leave the string formatting to that thread too. When the queue is
+full, records are dropped and counted instead of waiting for space.
+
+Each line is a JSON object holding the time, level, logger and message,
+the method and path of the request being served (if any) and any
+``extra`` fields. Bearer tokens, JWTs and token-like query parameters,
+JSON fields and ``extra`` keys are redacted before writing.
+
+Records below WARNING logged while serving a request are sampled per
+route: ``LOG_SAMPLE_RATES`` maps path prefixes to the fraction kept, the
+longest matching prefix winning, and ``LOG_SAMPLE_RATE`` covers other
+paths. Warnings and errors are always kept.
+"""
+
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Mapping, Optional, TextIO, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import get_settings
+
+REDACTED = "[REDACTED]"
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Loggers uvicorn writes to stdout itself unless told to propagate
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_REDACTIONS = (
+    # JWTs, including this API's session tokens
+    (re.compile(r"eyJ[\w-]*\.[\w-]+\.[\w-]*"), REDACTED),
+    (re.compile(r"(?i)(bearer\s+)[\w.~+/=-]+"), r"\1" + REDACTED),
+    # token=..., "access_token": "...", secret: ...
+    (
+        re.compile(
+            r"(?i)(\b(?:access_token|refresh_token|id_token|token"
+            r"|client_secret|secret|password)[\"']?\s*[=:]\s*[\"']?)"
+            r"[^\s&\"',;)}]+"
+        ),
+        r"\1" + REDACTED,
+    ),
+    # OAuth code and state only as query parameters or quoted keys, so
+    # "error code: 429" or "status_code=502" stay readable
+    (
+        re.compile(
+            r"(?i)([?&](?:code|state)=|[\"'](?:code|state)[\"']\s*:\s*[\"']?)"
+            r"[^\s&\"',;)}]+"
+        ),
+        r"\1" + REDACTED,
+    ),
+)
+_SENSITIVE_KEY = re.compile(r"(?i)token|secret|password|authorization|^code$|^state$")
+
+# Attributes every LogRecord has; anything else came from ``extra``
+_RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+_request: "contextvars.ContextVar[Optional[Tuple[str, str]]]" = contextvars.ContextVar(
+    "log_request", default=None
+)
+
+
+def redact(text: str) -> str:
+    """Replace credentials in ``text`` with a placeholder."""
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _redact_field(key: str, value: Any) -> Any:
+    if _SENSITIVE_KEY.search(key):
+        return REDACTED
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return redact(str(value))
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as one redacted JSON object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = _redact_field(key, value)
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The plain text format, redacted."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class RouteSampler(logging.Filter):
+    """Tags records with the current request and samples its success logs."""
+
+    def __init__(self, rates: Mapping[str, float], default_rate: float = 1.0):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_rate = default_rate
+        self.sampled_out = 0
+
+    def rate(self, path: str) -> float:
+        """Return the fraction of success logs kept for ``path``."""
+        for prefix, rate in self.rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request = _request.get()
+        if request is None:
+            return True
+        record.method, record.path = request
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.path)
+        if rate >= 1 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queues records unformatted, dropping them when the queue is full."""
+
+    def __init__(self, records: "queue.Queue[Any]"):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener thread formats; arguments are read there, not here
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room so stopping always drains the queue
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """The root logger's queue and the thread writing it out."""
+
+    def __init__(
+        self,
+        stream: TextIO,
+        level: str,
+        fmt: str,
+        queue_size: int,
+        sample_rates: Mapping[str, float],
+        default_rate: float = 1.0,
+    ):
+        self.level = level
+        self.queue: "queue.Queue[Any]" = queue.Queue(queue_size)
+        self.sampler = RouteSampler(sample_rates, default_rate)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.handler.addFilter(self.sampler)
+        output = logging.StreamHandler(stream)
+        output.setFormatter(
+            JSONFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT)
+        )
+        self.listener = _Listener(self.queue, output)
+        self.running = False
+
+    def start(self) -> None:
+        """Route the root logger, and uvicorn's, through the queue."""
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        for name in SERVER_LOGGERS:
+            server_logger = logging.getLogger(name)
+            server_logger.handlers.clear()
+            server_logger.propagate = True
+        self.listener.start()
+        self.running = True
+
+    def stop(self) -> None:
+        """Detach from the root logger and write out what is queued."""
+        if not self.running:
+            return
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        self.running = False
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the queue length and records dropped or sampled out."""
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+        }
+
+
+def create_log_pipeline(stream: TextIO = sys.stdout) -> LogPipeline:
+    """Create a logging pipeline from the settings."""
+    settings = get_settings()
+    return LogPipeline(
+        stream=stream,
+        level=settings.LOG_LEVEL,
+        fmt=settings.LOG_FORMAT,
+        queue_size=settings.LOG_QUEUE_SIZE,
+        sample_rates=settings.LOG_SAMPLE_RATES,
+        default_rate=settings.LOG_SAMPLE_RATE,
+    )
+
+
+class LogContextMiddleware:
+    """ASGI middleware recording the request being served for log records."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request.set((scope["method"], scope["path"]))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
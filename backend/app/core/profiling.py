@@ -0,0 +1,140 @@
+"""
+Opt-in profiling of individual requests.
+
+``ProfilingMiddleware`` runs a random ``PROFILING_SAMPLE_RATE`` fraction of
+requests, plus any request whose ``X-Profile`` header carries
+``PROFILING_SECRET``, under pyinstrument's statistical profiler. Each
+profiled request is written to ``PROFILING_OUTPUT_DIR`` as one speedscope
+file (or an HTML flame graph), and its response carries the file's id in
+``X-Profile-Id``. The profiler runs in async mode, so time a request spends
+awaiting Spotify is attributed to that request rather than to whatever
+else the event loop ran meanwhile. Past ``PROFILING_MAX_FILES`` files or
+``PROFILING_MAX_BYTES`` bytes, the oldest profiles are deleted after each
+save.
+
+Unprofiled requests cost a header scan and a ``random()`` call; with
+neither setting configured the middleware is a single attribute check.
+pyinstrument is imported on the first profiled request only.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from typing import Any
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_SUFFIXES = (".speedscope.json", ".html")
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles sampled or explicitly requested requests.
+
+    Settings are read when Starlette builds the middleware stack, on the
+    first request, so importing the app does not load them.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        settings = get_settings()
+        self.app = app
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.secret = settings.PROFILING_SECRET.encode()
+        self.output_dir = settings.PROFILING_OUTPUT_DIR
+        self.format = settings.PROFILING_FORMAT
+        self.interval = settings.PROFILING_INTERVAL_SECONDS
+        self.max_files = settings.PROFILING_MAX_FILES
+        self.max_bytes = settings.PROFILING_MAX_BYTES
+        self.active = self.sample_rate > 0 or bool(self.secret)
+
+    def should_profile(self, scope: Scope) -> bool:
+        """Return whether this request is sampled or asks to be profiled."""
+        if self.secret:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER and hmac.compare_digest(value, self.secret):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.active or scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        await self.profile(scope, receive, send)
+
+    async def profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Run the request under the profiler and save the result."""
+        from pyinstrument import Profiler
+
+        route = re.sub(r"[^A-Za-z0-9_.-]+", "_", scope["path"].strip("/")) or "root"
+        profile_id = (
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{route[:64]}-"
+            f"{uuid.uuid4().hex[:8]}"
+        )
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER, profile_id.encode()),
+                ]
+            await send(message)
+
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            try:
+                path = await asyncio.to_thread(self.save, profiler, profile_id)
+                logger.info("Saved request profile %s", path)
+            except Exception as e:
+                logger.error("Failed to save request profile %s: %s", profile_id, e)
+
+    def save(self, profiler: Any, profile_id: str) -> str:
+        """Render ``profiler``'s session to the output directory."""
+        if self.format == "html":
+            output = profiler.output_html()
+            path = os.path.join(self.output_dir, f"{profile_id}.html")
+        else:
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            output = profiler.output(renderer=SpeedscopeRenderer())
+            path = os.path.join(self.output_dir, f"{profile_id}.speedscope.json")
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(output)
+        self.prune()
+        return path
+
+    def prune(self) -> None:
+        """Delete the oldest profiles past the file count and size limits."""
+        profiles = []
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(PROFILE_SUFFIXES):
+                    stat = entry.stat()
+                    profiles.append((stat.st_mtime, entry.path, stat.st_size))
+        profiles.sort()
+        count = len(profiles)
+        size = sum(profile[2] for profile in profiles)
+        for _, path, file_size in profiles:
+            if count <= self.max_files and size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Pruned by a save running alongside this one
+                pass
+            count -= 1
+            size -= file_size
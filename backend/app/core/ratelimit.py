@@ -0,0 +1,52 @@
+"""Rate limiting for calls to upstream APIs."""
+
+import asyncio
+import time
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter for coroutines sharing one event loop.
+
+    Tokens refill continuously at ``rate`` per second up to ``burst``.
+    ``acquire`` waits until a token is available; ``try_acquire`` only
+    takes one that is available now.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """Create a full bucket refilling at ``rate`` tokens per second."""
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        refilled = self._tokens + (now - self._updated) * self.rate
+        self._tokens = min(float(self.burst), refilled)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait for and consume one token."""
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Consume one token if one is available now, without waiting."""
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    @property
+    def pressure(self) -> float:
+        """Fraction of the burst currently used, from 0.0 (idle) to 1.0."""
+        self._refill()
+        return 1.0 - self._tokens / self.burst
@@ -0,0 +1,262 @@
+"""Circuit breaking and hedged requests for calls to upstream APIs."""
+
+import asyncio
+import contextvars
+import functools
+import time
+from array import array
+from typing import Any, Callable, Dict, Optional, Set, TypeVar
+
+from fastapi import HTTPException
+
+from app.core.ratelimit import RateLimiter
+
+T = TypeVar("T")
+
+# Status returned when an upstream API is unavailable or its circuit is open
+UPSTREAM_UNAVAILABLE = 503
+
+
+class CircuitOpenError(HTTPException):
+    """Raised without calling upstream while an endpoint's circuit is open."""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(
+            status_code=UPSTREAM_UNAVAILABLE,
+            detail=f"Spotify is unavailable ({endpoint})",
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+        self.endpoint = endpoint
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail immediately for ``reset_seconds``. It then half-opens: one
+    trial call is let through, closing the circuit on success and reopening
+    it on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def retry_after(self) -> float:
+        """Return the seconds until the circuit half-opens."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        """Return whether a call may go upstream now."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial_in_flight or (
+            self.opened_at is None and self.failures >= self.failure_threshold
+        ):
+            self.times_opened += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Let another trial through after one ended without an outcome."""
+        self.trial_in_flight = False
+
+
+class LatencyWindow:
+    """Ring buffer of recent call latencies in seconds."""
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self._samples = array("d")
+        self._next = 0
+
+    def add(self, seconds: float) -> None:
+        if len(self._samples) < self.size:
+            self._samples.append(seconds)
+        else:
+            self._samples[self._next] = seconds
+        self._next = (self._next + 1) % self.size
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the ``q`` quantile of the window, or None when empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class UpstreamEndpoint:
+    """
+    Guards calls to one upstream endpoint with a breaker and optional hedging.
+
+    Blocking calls run in worker threads. ``is_failure`` decides which
+    exceptions count against the breaker; others (e.g. a 401 for one
+    user's token) count as the endpoint responding. A hedged call starts a
+    second attempt once the first has run longer than the endpoint's p95
+    latency and returns whichever succeeds first. With a ``limiter``, a
+    call takes a token only once the breaker has let it through, so an
+    open circuit fails fast without using up the shared rate limit. The
+    hedge is an extra upstream request, so it is only sent if ``limiter``
+    has a token to spare right then. The losing thread cannot be interrupted; its result
+    is discarded.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        breaker: CircuitBreaker,
+        is_failure: Callable[[BaseException], bool],
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.is_failure = is_failure
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyWindow()
+        self.calls = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedges_throttled = 0
+        self._abandoned: Set["asyncio.Future[Any]"] = set()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Return when to send a hedge, or None until enough samples exist."""
+        if len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.quantile(self.hedge_quantile)
+
+    async def call(self, fetch: Callable[[], T], hedge: bool = False) -> T:
+        """
+        Run ``fetch`` in a thread through the circuit breaker.
+
+        Raises:
+            CircuitOpenError: The circuit is open; upstream was not called
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+        self.calls += 1
+        delay = self.hedge_delay() if hedge else None
+        try:
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            started = time.monotonic()
+            if delay is None:
+                result = await asyncio.to_thread(fetch)
+            else:
+                result = await self._hedged(fetch, delay)
+        except asyncio.CancelledError:
+            self.breaker.release_trial()
+            raise
+        except Exception as e:
+            if self.is_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        self.latency.add(time.monotonic() - started)
+        return result
+
+    @staticmethod
+    def _attempt(fetch: Callable[[], T]) -> "asyncio.Future[T]":
+        """Start ``fetch`` in a worker thread, like ``asyncio.to_thread``."""
+        # A plain executor future rather than a task: an abandoned attempt
+        # still running when the loop closes is then dropped quietly
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(context.run, fetch)
+        )
+
+    async def _hedged(self, fetch: Callable[[], T], delay: float) -> T:
+        primary = self._attempt(fetch)
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        if self.limiter is not None and not self.limiter.try_acquire():
+            self.hedges_throttled += 1
+            return await primary
+
+        self.hedged += 1
+        hedge = self._attempt(fetch)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for attempt in done:
+                if attempt.exception() is None:
+                    if attempt is hedge:
+                        self.hedge_wins += 1
+                    for loser in pending:
+                        # Keep a reference so the thread's result is collected
+                        self._abandoned.add(loser)
+                        loser.add_done_callback(self._collect)
+                    return attempt.result()
+                error = error or attempt.exception()
+        assert error is not None
+        raise error
+
+    def _collect(self, future: "asyncio.Future[Any]") -> None:
+        self._abandoned.discard(future)
+        if not future.cancelled():
+            future.exception()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return breaker state, call counts and hedge statistics."""
+        p95 = self.latency.quantile(0.95)
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedged": self.hedged,
+            "hedges_throttled": self.hedges_throttled,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": (
+                round(self.hedge_wins / self.hedged, 4) if self.hedged else None
+            ),
+        }
@@ -1,44 +1,117 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp
+import importlib
 import logging
-import sys
 
-from app.api import auth, spotify
-from app.core.config import settings
+from app.api import auth, images, metrics, spotify
+from app.core.admission import AdmissionMiddleware
+from app.core.config import get_settings
+from app.core.log import LogContextMiddleware, create_log_pipeline
+from app.core.profiling import ProfilingMiddleware
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    stream=sys.stdout
-)
 logger = logging.getLogger(__name__)
 
+# Modules the request path imports lazily; preloaded at startup unless
+# COLD_START_MODE is set.
+LAZY_MODULES = (
+    "jose.jwt",
+    "spotipy",
+    "app.services.oauth",
+    "app.services.spotify",
+)
+
 app = FastAPI(title="SpotifEye API")
 
+
+def warm_up() -> None:
+    """Import the lazily-loaded dependencies ahead of the first request."""
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+
+
 @app.on_event("startup")
 async def startup_event():
+    settings = get_settings()
+    # Structured logging, written to stdout off the event loop
+    app.state.log_pipeline = create_log_pipeline()
+    app.state.log_pipeline.start()
+
+    if settings.COLD_START_MODE:
+        # Serverless: defer everything to first use
+        return
+
+    warm_up()
+
     # Log the API prefix
-    logger.info(f"API V1 prefix: {settings.API_V1_STR}")
-    
+    logger.info("API V1 prefix: %s", settings.API_V1_STR)
+
     # Log all registered routes
     for route in app.routes:
-        logger.info(f"Registered route: {route.path} [{route.methods}]")
+        logger.info("Registered route: %s [%s]", route.path, route.methods)
+
+    if settings.CACHE_WARMER_ENABLED:
+        from app.services.warmer import create_cache_warmer
+
+        app.state.cache_warmer = create_cache_warmer()
+        app.state.cache_warmer.start()
+
+    if settings.SNAPSHOT_ENABLED:
+        from app.services.history import create_snapshot_job
+
+        app.state.snapshot_job = create_snapshot_job()
+        app.state.snapshot_job.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    cache_warmer = getattr(app.state, "cache_warmer", None)
+    if cache_warmer is not None:
+        await cache_warmer.stop()
+    snapshot_job = getattr(app.state, "snapshot_job", None)
+    if snapshot_job is not None:
+        await snapshot_job.stop()
+    log_pipeline = getattr(app.state, "log_pipeline", None)
+    if log_pipeline is not None:
+        log_pipeline.stop()
+
+
+class FrontendCORSMiddleware(CORSMiddleware):
+    """CORS middleware that reads the allowed origin when the stack is built.
+
+    Starlette instantiates middleware on the first request, so settings are
+    not loaded just by importing the app.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        super().__init__(
+            app,
+            allow_origins=[get_settings().FRONTEND_URL],
+            allow_credentials=True,
+            allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            allow_headers=["*"],
+            expose_headers=["*"],
+            max_age=3600,  # Cache preflight requests for 1 hour
+        )
+
+
+# Inside CORS, so rejections still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
 
 # Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[settings.FRONTEND_URL],  # Use frontend URL from settings
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-    max_age=3600,  # Cache preflight requests for 1 hour
-)
+app.add_middleware(FrontendCORSMiddleware)
+
+# Tags log records with the request being served
+app.add_middleware(LogContextMiddleware)
+
+# Outermost, so a profile covers the whole middleware stack
+app.add_middleware(ProfilingMiddleware)
 
 # Include routers with prefixes
 app.include_router(auth.router, tags=["auth"])
 app.include_router(spotify.router, prefix="/spotify", tags=["spotify"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+app.include_router(images.router, prefix="/images", tags=["images"])
 
 
 @app.get("/")
@@ -48,3 +121,8 @@ async def root():
         "status": "operational",
         "version": "1.0.0",
     }
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
@@ -0,0 +1 @@
+"""Internal data models."""
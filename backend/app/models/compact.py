@@ -0,0 +1,311 @@
+"""
+Compact in-memory records for cached Spotify tracks, artists and plays.
+
+Raw Spotify objects are nested dicts that repeat every key string per item
+and carry fields the app never reads (``available_markets`` alone is a
+list of ~180 country codes per track and album). The records here keep
+only what the dashboard and the API responses need:
+
+- slotted, frozen dataclasses instead of dicts
+- ids, names and genres interned, so one artist cached for many users
+  shares its strings
+- ``uri``, ``href`` and ``external_urls`` rebuilt from the id
+- Spotify CDN image URLs stored as the 20-byte image id
+
+``to_api`` rebuilds the API's JSON shape; dropped fields are
+``available_markets``, ``external_ids`` and ``linked_from``.
+"""
+
+import sys
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+SPOTIFY_IMAGE_PREFIX = "https://i.scdn.co/image/"
+SPOTIFY_API_PREFIX = "https://api.spotify.com/v1"
+SPOTIFY_OPEN_PREFIX = "https://open.spotify.com"
+
+# (url or CDN image id, width, height)
+Image = Tuple[Union[bytes, str], Optional[int], Optional[int]]
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+def pack_images(images: Optional[Iterable[Dict[str, Any]]]) -> Tuple[Image, ...]:
+    """Pack an API ``images`` array, shrinking Spotify CDN URLs to their id."""
+    packed = []
+    for image in images or ():
+        url = image.get("url") or ""
+        key: Union[bytes, str] = url
+        if url.startswith(SPOTIFY_IMAGE_PREFIX):
+            try:
+                key = bytes.fromhex(url[len(SPOTIFY_IMAGE_PREFIX) :])
+            except ValueError:
+                pass
+        packed.append((key, image.get("width"), image.get("height")))
+    return tuple(packed)
+
+
+def unpack_images(images: Tuple[Image, ...]) -> List[Dict[str, Any]]:
+    """Rebuild an API ``images`` array from packed images."""
+    return [
+        {
+            "url": SPOTIFY_IMAGE_PREFIX + key.hex() if isinstance(key, bytes) else key,
+            "width": width,
+            "height": height,
+        }
+        for key, width, height in images
+    ]
+
+
+def _links(
+    kind: str, item_id: Optional[str], uri: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Return the id-derived link fields of an API object.
+
+    Objects without an id (local files) have no links; their ``uri``, if
+    any, is the one stored from the API.
+    """
+    if item_id is None:
+        return {
+            "id": None,
+            "type": kind,
+            "uri": uri,
+            "href": None,
+            "external_urls": {},
+        }
+    return {
+        "id": item_id,
+        "type": kind,
+        "uri": f"spotify:{kind}:{item_id}",
+        "href": f"{SPOTIFY_API_PREFIX}/{kind}s/{item_id}",
+        "external_urls": {"spotify": f"{SPOTIFY_OPEN_PREFIX}/{kind}/{item_id}"},
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class ArtistRef:
+    """Simplified artist as embedded in tracks and albums."""
+
+    id: Optional[str]
+    name: Optional[str]
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "ArtistRef":
+        return cls(_intern(data.get("id")), _intern(data.get("name")))
+
+    def to_api(self) -> Dict[str, Any]:
+        return {**_links("artist", self.id), "name": self.name}
+
+
+@dataclass(frozen=True, slots=True)
+class CompactArtist:
+    """Full artist object, as returned by top artists."""
+
+    id: Optional[str]
+    name: Optional[str]
+    genres: Tuple[str, ...]
+    images: Tuple[Image, ...]
+    popularity: Optional[int]
+    followers: Optional[int]
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "CompactArtist":
+        return cls(
+            id=_intern(data.get("id")),
+            name=_intern(data.get("name")),
+            genres=tuple(sys.intern(genre) for genre in data.get("genres") or ()),
+            images=pack_images(data.get("images")),
+            popularity=data.get("popularity"),
+            followers=(data.get("followers") or {}).get("total"),
+        )
+
+    def to_api(self) -> Dict[str, Any]:
+        return {
+            **_links("artist", self.id),
+            "name": self.name,
+            "genres": list(self.genres),
+            "images": unpack_images(self.images),
+            "popularity": self.popularity,
+            "followers": {"href": None, "total": self.followers},
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class CompactAlbum:
+    """Simplified album as embedded in tracks."""
+
+    id: Optional[str]
+    name: Optional[str]
+    album_type: Optional[str]
+    artists: Tuple[ArtistRef, ...]
+    images: Tuple[Image, ...]
+    release_date: Optional[str]
+    release_date_precision: Optional[str]
+    total_tracks: Optional[int]
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "CompactAlbum":
+        return cls(
+            id=_intern(data.get("id")),
+            name=_intern(data.get("name")),
+            album_type=_intern(data.get("album_type")),
+            artists=tuple(ArtistRef.from_api(a) for a in data.get("artists") or ()),
+            images=pack_images(data.get("images")),
+            release_date=_intern(data.get("release_date")),
+            release_date_precision=_intern(data.get("release_date_precision")),
+            total_tracks=data.get("total_tracks"),
+        )
+
+    def to_api(self) -> Dict[str, Any]:
+        return {
+            **_links("album", self.id),
+            "name": self.name,
+            "album_type": self.album_type,
+            "artists": [artist.to_api() for artist in self.artists],
+            "images": unpack_images(self.images),
+            "release_date": self.release_date,
+            "release_date_precision": self.release_date_precision,
+            "total_tracks": self.total_tracks,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class CompactTrack:
+    """Full track object, as returned by top tracks and recently played."""
+
+    id: Optional[str]
+    name: Optional[str]
+    artists: Tuple[ArtistRef, ...]
+    album: Optional[CompactAlbum]
+    duration_ms: Optional[int]
+    popularity: Optional[int]
+    explicit: Optional[bool]
+    preview_url: Optional[str]
+    track_number: Optional[int]
+    disc_number: Optional[int]
+    is_local: bool
+    # Only kept for tracks without an id, whose uri cannot be rebuilt
+    local_uri: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "CompactTrack":
+        album = data.get("album")
+        return cls(
+            id=_intern(data.get("id")),
+            name=_intern(data.get("name")),
+            artists=tuple(ArtistRef.from_api(a) for a in data.get("artists") or ()),
+            album=CompactAlbum.from_api(album) if album is not None else None,
+            duration_ms=data.get("duration_ms"),
+            popularity=data.get("popularity"),
+            explicit=data.get("explicit"),
+            preview_url=data.get("preview_url"),
+            track_number=data.get("track_number"),
+            disc_number=data.get("disc_number"),
+            is_local=bool(data.get("is_local", False)),
+            local_uri=data.get("uri") if data.get("id") is None else None,
+        )
+
+    def to_api(self) -> Dict[str, Any]:
+        return {
+            **_links("track", self.id, self.local_uri),
+            "name": self.name,
+            "artists": [artist.to_api() for artist in self.artists],
+            "album": self.album.to_api() if self.album is not None else None,
+            "duration_ms": self.duration_ms,
+            "popularity": self.popularity,
+            "explicit": self.explicit,
+            "preview_url": self.preview_url,
+            "track_number": self.track_number,
+            "disc_number": self.disc_number,
+            "is_local": self.is_local,
+        }
+
+
+def parse_played_at(played_at: str) -> int:
+    """Return an API ``played_at`` timestamp as unix milliseconds."""
+    parsed = datetime.fromisoformat(played_at.replace("Z", "+00:00"))
+    return int(parsed.timestamp() * 1000)
+
+
+def format_played_at(played_at_ms: int) -> str:
+    """Return unix milliseconds in the API's ``played_at`` format."""
+    parsed = datetime.fromtimestamp(played_at_ms / 1000, tz=timezone.utc)
+    return parsed.strftime("%Y-%m-%dT%H:%M:%S.") + f"{played_at_ms % 1000:03d}Z"
+
+
+@dataclass(frozen=True, slots=True)
+class CompactPlay:
+    """Play history item, as returned by recently played."""
+
+    track: CompactTrack
+    played_at_ms: int
+    context_uri: Optional[str]
+    context_type: Optional[str]
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "CompactPlay":
+        context = data.get("context") or {}
+        return cls(
+            track=CompactTrack.from_api(data["track"]),
+            played_at_ms=parse_played_at(data["played_at"]),
+            context_uri=_intern(context.get("uri")),
+            context_type=_intern(context.get("type")),
+        )
+
+    def to_api(self) -> Dict[str, Any]:
+        context = None
+        if self.context_uri is not None:
+            context = {"uri": self.context_uri, "type": self.context_type}
+        return {
+            "track": self.track.to_api(),
+            "played_at": format_played_at(self.played_at_ms),
+            "context": context,
+        }
+
+
+class PlayHistory:
+    """
+    Array-backed play history for long listening histories.
+
+    Timestamps live in an ``array('q')`` and each distinct track is stored
+    once; plays reference tracks by index into ``tracks`` through an
+    ``array('I')``. Plays are kept in insertion order.
+    """
+
+    __slots__ = ("played_at_ms", "track_index", "tracks", "_track_ids")
+
+    def __init__(self) -> None:
+        self.played_at_ms = array("q")
+        self.track_index = array("I")
+        self.tracks: List[CompactTrack] = []
+        self._track_ids: Dict[Optional[str], int] = {}
+
+    def append(self, play: CompactPlay) -> None:
+        """Add one play."""
+        # Local files have no id; their uri tells them apart
+        key = play.track.id or play.track.local_uri
+        index = self._track_ids.get(key)
+        if index is None:
+            index = len(self.tracks)
+            self.tracks.append(play.track)
+            self._track_ids[key] = index
+        self.played_at_ms.append(play.played_at_ms)
+        self.track_index.append(index)
+
+    def extend_api(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Add plays given in the API's JSON shape."""
+        for item in items:
+            self.append(CompactPlay.from_api(item))
+
+    def __len__(self) -> int:
+        return len(self.played_at_ms)
+
+    def __iter__(self) -> Iterator[Tuple[int, CompactTrack]]:
+        """Yield ``(played_at_ms, track)`` pairs in insertion order."""
+        for played_at, index in zip(self.played_at_ms, self.track_index):
+            yield played_at, self.tracks[index]
@@ -0,0 +1,73 @@
+"""Tracking of recently active users for background jobs."""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional
+
+
+@dataclass
+class ActiveUser:
+    """A user seen on an authenticated request."""
+
+    user_id: str
+    access_token: str
+    last_seen: float
+    refresh_token: Optional[str] = None
+
+
+class ActivityTracker:
+    """
+    Bounded record of users ordered by last activity.
+
+    Touching a user moves them to the most-recent end; once ``maxsize`` users
+    are tracked the least recently active one is forgotten.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        """Create an empty tracker holding at most ``maxsize`` users."""
+        self.maxsize = maxsize
+        self._users: "OrderedDict[str, ActiveUser]" = OrderedDict()
+
+    def touch(
+        self, user_id: str, access_token: str, refresh_token: Optional[str] = None
+    ) -> None:
+        """Record activity for ``user_id`` with their current tokens."""
+        self._users[user_id] = ActiveUser(
+            user_id, access_token, time.time(), refresh_token
+        )
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+    def update_token(self, user_id: str, access_token: str) -> None:
+        """Replace a tracked user's access token without touching activity."""
+        user = self._users.get(user_id)
+        if user is not None:
+            user.access_token = access_token
+
+    def forget(self, user_id: str) -> None:
+        """Stop tracking ``user_id``, e.g. after their token was rejected."""
+        self._users.pop(user_id, None)
+
+    def active(self, since: float) -> List[ActiveUser]:
+        """Return users seen at or after ``since``, most recent first."""
+        users = []
+        for user in reversed(self._users.values()):
+            if user.last_seen < since:
+                break
+            users.append(user)
+        return users
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._users
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+@lru_cache()
+def get_activity_tracker() -> ActivityTracker:
+    """Return the process-wide activity tracker."""
+    return ActivityTracker()
@@ -0,0 +1,129 @@
+"""
+Artist insights: an artist with their top tracks, albums, related artists
+and the user's own listening, for one artist or a batch.
+
+The artists themselves come from the several-artists endpoint, 50 ids per
+call. Everything else is per artist and is fetched concurrently with
+them, in one round trip paced by the shared rate limiter rather than one
+after another. All of it is catalog data read through the response cache
+shared by every session. The user's plays and ranks come from their
+history search index (see ``app.services.search``), which needs no
+upstream calls once the dashboard's lists are cached.
+
+A per-artist list Spotify refuses or fails to return (404, 403, 429 or
+5xx; Spotify has withdrawn related artists for many apps) is returned as
+null with an entry in the artist's ``errors``, rather than failing the
+whole response.
+"""
+
+import asyncio
+import re
+from typing import Any, Dict, List, Sequence
+
+from fastapi import HTTPException
+
+from app.services.search import SearchIndex, user_index
+from app.services.spotify import SpotifyService
+
+# Artists per batch; each costs up to three upstream calls when uncached
+MAX_ARTISTS = 20
+
+SECTIONS = ("top_tracks", "albums", "related_artists")
+
+# Spotify ids are 22 base62 characters
+ARTIST_ID = re.compile(r"[0-9A-Za-z]{22}")
+
+
+def is_artist_id(artist_id: str) -> bool:
+    """Return whether ``artist_id`` has the form of a Spotify id."""
+    return ARTIST_ID.fullmatch(artist_id) is not None
+
+
+def section_failed(error: BaseException) -> bool:
+    """Return whether a failed section is left out rather than failing all."""
+    return isinstance(error, HTTPException) and (
+        error.status_code in (403, 404, 429) or error.status_code >= 500
+    )
+
+
+def listening(
+    index: SearchIndex, artist_id: str, top_tracks: Sequence[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Return the user's plays and ranks of an artist and of their top tracks."""
+    artist = index.find("artist", artist_id) or {}
+    tracks = [index.find("track", track["id"]) for track in top_tracks]
+    return {
+        "plays": artist.get("plays", 0),
+        "last_played_at": artist.get("last_played_at"),
+        "ranks": artist.get("ranks"),
+        "top_tracks_played": [
+            {"id": track["id"], "name": track["name"], "plays": track["plays"]}
+            for track in tracks
+            if track and track["plays"]
+        ],
+    }
+
+
+async def artist_insights(
+    service: SpotifyService, user_id: str, artist_ids: Sequence[str]
+) -> List[Dict[str, Any]]:
+    """
+    Get the insights of several artists in one concurrent fan-out.
+
+    Args:
+        service: The user's Spotify service
+        user_id: Spotify id of the user, for their listening
+        artist_ids: Spotify artist ids (duplicates are ignored)
+
+    Returns:
+        Per known artist, in the order of ``artist_ids``: ``artist``,
+        ``top_tracks``, ``albums``, ``related_artists`` (each null when it
+        could not be fetched), ``listening``, and ``errors`` with the
+        status and detail of each missing section; ids Spotify does not
+        know are left out
+
+    Raises:
+        HTTPException: The artists themselves could not be fetched, or a
+            section failed for another reason than those above (such as
+            an expired session)
+    """
+    artist_ids = list(dict.fromkeys(artist_ids))
+    sections = [
+        fetch(artist_id)
+        for artist_id in artist_ids
+        for fetch in (
+            service.get_artist_top_tracks,
+            service.get_artist_albums,
+            service.get_related_artists,
+        )
+    ]
+    artists, index, results = await asyncio.gather(
+        service.get_artists(artist_ids),
+        user_index(service, user_id),
+        # Unknown ids fail here; they are dropped below rather than failing all
+        asyncio.gather(*sections, return_exceptions=True),
+    )
+    per_artist = {
+        artist_id: results[3 * i : 3 * i + 3] for i, artist_id in enumerate(artist_ids)
+    }
+    insights = []
+    for artist in artists:
+        insight: Dict[str, Any] = {"artist": artist}
+        errors: Dict[str, Dict[str, Any]] = {}
+        for section, result in zip(SECTIONS, per_artist[artist["id"]]):
+            if isinstance(result, BaseException):
+                if not section_failed(result):
+                    raise result
+                assert isinstance(result, HTTPException)
+                errors[section] = {
+                    "status": result.status_code,
+                    "detail": result.detail,
+                }
+                result = None
+            insight[section] = result
+        insight["listening"] = listening(
+            index, artist["id"], insight["top_tracks"] or []
+        )
+        insight["errors"] = errors
+        insights.append(insight)
+    return insights
@@ -0,0 +1,496 @@
+"""
+Daily snapshots of users' top lists, stored delta-encoded in SQLite.
+
+Spotify only exposes the current top lists, so a job records each active
+user's top tracks and artists for every time range once a day. Each list
+is stored as integer item ids (spotify ids are mapped once to integers in
+``items``):
+
+- a keyframe (the full id list as packed uint32s) on the first snapshot
+  and every ``keyframe_days`` after it
+- otherwise an edit script against the previous stored day, as compact
+  JSON ``[[start, end, [new ids]], ...]`` replacing ``previous[start:end]``
+- nothing at all on days where the list did not change
+
+A typical day (a couple of songs moving) costs a few dozen bytes per
+list. Reading a date replays at most ``keyframe_days`` small edit scripts
+on top of the nearest keyframe.
+
+The store also keeps every play seen in users' recently played tracks,
+once each, so play counts outlive Spotify's 50-play window.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.services.activity import ActiveUser, ActivityTracker, get_activity_tracker
+from app.services.spotify import SpotifyService
+from app.services.stats import TIME_RANGES
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("tracks", "artists")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    idx INTEGER PRIMARY KEY,
+    spotify_id TEXT NOT NULL UNIQUE,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    time_range TEXT NOT NULL,
+    day TEXT NOT NULL,
+    keyframe INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (user_id, kind, time_range, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS captures (
+    user_id TEXT PRIMARY KEY,
+    day TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS capture_days (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+-- Stores created before capture_days only know each user's last capture
+INSERT OR IGNORE INTO capture_days SELECT user_id, day FROM captures;
+CREATE TABLE IF NOT EXISTS plays (
+    user_id TEXT NOT NULL,
+    played_at INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    PRIMARY KEY (user_id, played_at)
+) WITHOUT ROWID;
+"""
+
+EditScript = List[Tuple[int, int, List[int]]]
+
+
+def diff_ids(previous: Sequence[int], current: Sequence[int]) -> EditScript:
+    """Return the edit script turning ``previous`` into ``current``."""
+    matcher = SequenceMatcher(a=previous, b=current, autojunk=False)
+    return [
+        (i1, i2, list(current[j1:j2]))
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_edits(previous: List[int], edits: EditScript) -> List[int]:
+    """Apply an edit script produced by ``diff_ids``."""
+    current = list(previous)
+    # Apply from the end so earlier offsets stay valid
+    for start, end, replacement in reversed(edits):
+        current[start:end] = replacement
+    return current
+
+
+def _encode(ids: Sequence[int], edits: Optional[EditScript]) -> bytes:
+    if edits is None:
+        return array("I", ids).tobytes()
+    return json.dumps(edits, separators=(",", ":")).encode()
+
+
+def _decode(previous: List[int], keyframe: bool, payload: bytes) -> List[int]:
+    if keyframe:
+        ids = array("I")
+        ids.frombytes(payload)
+        return ids.tolist()
+    return apply_edits(previous, json.loads(payload))
+
+
+class SnapshotStore:
+    """SQLite-backed, delta-encoded store of daily top-list snapshots."""
+
+    def __init__(self, path: str, keyframe_days: int = 30):
+        self.keyframe_days = keyframe_days
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def _item_ids(self, items: Sequence[Dict[str, Any]]) -> List[int]:
+        """Map spotify ids to integer ids, registering unseen items."""
+        self._db.executemany(
+            "INSERT OR IGNORE INTO items (spotify_id, name) VALUES (?, ?)",
+            [(item["id"], item.get("name")) for item in items],
+        )
+        placeholders = ",".join("?" * len(items))
+        rows = self._db.execute(
+            f"SELECT spotify_id, idx FROM items WHERE spotify_id IN ({placeholders})",
+            [item["id"] for item in items],
+        ).fetchall()
+        index = dict(rows)
+        return [index[item["id"]] for item in items]
+
+    def _rows(
+        self, user_id: str, kind: str, time_range: str, start: date, end: date
+    ) -> List[Tuple[str, int, bytes]]:
+        """Return rows up to ``end``, from the last keyframe on or before ``start``."""
+        list_key = (user_id, kind, time_range)
+        return self._db.execute(
+            """
+            SELECT day, keyframe, payload FROM snapshots
+            WHERE user_id = ? AND kind = ? AND time_range = ? AND day <= ?
+              AND day >= COALESCE((
+                  SELECT MAX(day) FROM snapshots
+                  WHERE user_id = ? AND kind = ? AND time_range = ?
+                    AND keyframe = 1 AND day <= ?
+              ), '')
+            ORDER BY day
+            """,
+            (*list_key, end.isoformat(), *list_key, start.isoformat()),
+        ).fetchall()
+
+    def _replay(self, rows: Sequence[Tuple[str, int, bytes]]) -> List[int]:
+        ids: List[int] = []
+        for _, keyframe, payload in rows:
+            ids = _decode(ids, bool(keyframe), payload)
+        return ids
+
+    def record(
+        self,
+        user_id: str,
+        kind: str,
+        time_range: str,
+        day: date,
+        items: Sequence[Dict[str, Any]],
+    ) -> int:
+        """
+        Store one day's list and return the bytes written.
+
+        Nothing is written when the list is unchanged since the last
+        stored day. Items without an id (local files, unavailable tracks)
+        are left out.
+        """
+        items = [item for item in items if item.get("id")]
+        with self._lock, self._db:
+            ids = self._item_ids(items) if items else []
+            previous_day = day - timedelta(days=1)
+            rows = self._rows(user_id, kind, time_range, previous_day, previous_day)
+            edits: Optional[EditScript] = None
+            if rows:
+                keyframe_day = date.fromisoformat(rows[0][0])
+                if (day - keyframe_day).days < self.keyframe_days:
+                    edits = diff_ids(self._replay(rows), ids)
+                    if not edits:
+                        return 0
+            payload = _encode(ids, edits)
+            self._db.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, kind, time_range, day.isoformat(), edits is None, payload),
+            )
+            return len(payload)
+
+    def mark_captured(self, user_id: str, day: date) -> None:
+        """Record that every list of ``user_id`` was captured on ``day``."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO captures VALUES (?, ?)",
+                (user_id, day.isoformat()),
+            )
+            self._db.execute(
+                "INSERT OR IGNORE INTO capture_days VALUES (?, ?)",
+                (user_id, day.isoformat()),
+            )
+
+    def last_captured(self, user_id: str) -> Optional[date]:
+        """Return the last day all lists of ``user_id`` were captured."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT day FROM captures WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def captured_days(self, user_id: str, start: date, end: date) -> List[date]:
+        """
+        Return the days from ``start`` to ``end`` ``user_id`` was captured on.
+
+        Lists are stored only when they change, so a day without a capture
+        (the user was inactive, or a capture failed) is not known to have
+        the previous day's lists.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT day FROM capture_days
+                WHERE user_id = ? AND day BETWEEN ? AND ?
+                ORDER BY day
+                """,
+                (user_id, start.isoformat(), end.isoformat()),
+            ).fetchall()
+        return [date.fromisoformat(row[0]) for row in rows]
+
+    def record_plays(
+        self, user_id: str, plays: Sequence[Tuple[int, Dict[str, Any]]]
+    ) -> int:
+        """
+        Store plays of ``user_id`` not stored yet; return how many were new.
+
+        Args:
+            plays: ``(played_at, track)`` pairs, ``played_at`` in unix
+                milliseconds
+        """
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO plays VALUES (?, ?, ?)",
+                [
+                    (user_id, played_at, json.dumps(track, separators=(",", ":")))
+                    for played_at, track in plays
+                ],
+            )
+            return self._db.total_changes - before
+
+    def plays(self, user_id: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """Return every stored ``(played_at, track)`` of ``user_id``, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT played_at, track FROM plays
+                WHERE user_id = ? ORDER BY played_at
+                """,
+                (user_id,),
+            ).fetchall()
+        return [(played_at, json.loads(track)) for played_at, track in rows]
+
+    def users(self) -> List[str]:
+        """Return every user with at least one capture."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT user_id FROM captures ORDER BY user_id"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def snapshot(
+        self, user_id: str, kind: str, time_range: str, day: date
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Return the list as it stood on ``day``, or None before the first."""
+        with self._lock:
+            rows = self._rows(user_id, kind, time_range, day, day)
+            if not rows:
+                return None
+            ids = self._replay(rows)
+            names = self._names(ids)
+        return [
+            {"id": names[idx][0], "name": names[idx][1], "rank": rank}
+            for rank, idx in enumerate(ids, 1)
+        ]
+
+    def _names(self, ids: Sequence[int]) -> Dict[int, Tuple[str, Optional[str]]]:
+        placeholders = ",".join("?" * len(ids))
+        rows = self._db.execute(
+            f"SELECT idx, spotify_id, name FROM items WHERE idx IN ({placeholders})",
+            list(ids),
+        ).fetchall()
+        return {idx: (spotify_id, name) for idx, spotify_id, name in rows}
+
+    def item_names(self, ids: Sequence[int]) -> Dict[int, Tuple[str, Optional[str]]]:
+        """Return ``(spotify_id, name)`` for integer item ids."""
+        with self._lock:
+            return self._names(ids)
+
+    def daily_ids(
+        self, user_id: str, kind: str, time_range: str, start: date, end: date
+    ) -> List[List[int]]:
+        """
+        Return the list's integer item ids for each day from ``start`` to ``end``.
+
+        The lists are replayed once from the keyframe before ``start``;
+        days before the first snapshot get an empty list.
+        """
+        with self._lock:
+            rows = self._rows(user_id, kind, time_range, start, end)
+        days = []
+        ids: List[int] = []
+        position = 0
+        day = start
+        while day <= end:
+            while position < len(rows) and rows[position][0] <= day.isoformat():
+                _, keyframe, payload = rows[position]
+                ids = _decode(ids, bool(keyframe), payload)
+                position += 1
+            days.append(ids)
+            day += timedelta(days=1)
+        return days
+
+    def rank_history(
+        self,
+        user_id: str,
+        kind: str,
+        time_range: str,
+        spotify_id: str,
+        start: date,
+        end: date,
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the daily rank of one item between ``start`` and ``end``.
+
+        ``rank`` is None on days the item was not listed or before the
+        first snapshot.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT idx FROM items WHERE spotify_id = ?", (spotify_id,)
+            ).fetchone()
+        target = row[0] if row else None
+        days = self.daily_ids(user_id, kind, time_range, start, end)
+        return [
+            {
+                "date": (start + timedelta(days=offset)).isoformat(),
+                "rank": ids.index(target) + 1 if target in ids else None,
+            }
+            for offset, ids in enumerate(days)
+        ]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._db.close()
+
+
+@lru_cache()
+def get_snapshot_store() -> SnapshotStore:
+    """Return the process-wide snapshot store."""
+    settings = get_settings()
+    return SnapshotStore(
+        settings.HISTORY_DB_PATH, keyframe_days=settings.SNAPSHOT_KEYFRAME_DAYS
+    )
+
+
+async def refresh_user_token(tracker: ActivityTracker, user: ActiveUser) -> bool:
+    """Exchange a tracked user's refresh token for a new access token."""
+    from app.services.oauth import OAuthError, get_oauth_client
+
+    if not user.refresh_token:
+        return False
+    try:
+        token_info = await get_oauth_client().refresh_access_token(user.refresh_token)
+    except OAuthError as e:
+        logger.error("Error refreshing token for snapshot: %s", e)
+        return False
+    tracker.update_token(user.user_id, token_info["access_token"])
+    return True
+
+
+class SnapshotJob:
+    """
+    Captures each active user's top lists once a day.
+
+    Every check (``check_interval_seconds``) captures users seen within the
+    active window that have no capture for today yet, so a restart or a
+    missed check only delays the snapshot.
+    """
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        tracker: ActivityTracker,
+        check_interval_seconds: float,
+        active_window_seconds: float,
+        concurrency: int,
+    ):
+        self.store = store
+        self.tracker = tracker
+        self.check_interval_seconds = check_interval_seconds
+        self.active_window_seconds = active_window_seconds
+        self.concurrency = concurrency
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def capture(self, user: ActiveUser, day: date) -> int:
+        """Snapshot every list of ``user`` for ``day``; return bytes written."""
+        from app.services.search import record_top_lists
+
+        service = SpotifyService(user.access_token)
+        fetchers = {
+            "tracks": service.get_top_tracks,
+            "artists": service.get_top_artists,
+        }
+        lists = [(kind, r) for kind in KINDS for r in TIME_RANGES]
+        results = await asyncio.gather(
+            *(fetchers[kind](limit=50, time_range=r) for kind, r in lists)
+        )
+        record_top_lists(user.user_id, dict(zip(lists, results)))
+        written = 0
+        for (kind, time_range), items in zip(lists, results):
+            written += await asyncio.to_thread(
+                self.store.record, user.user_id, kind, time_range, day, items
+            )
+        await asyncio.to_thread(self.store.mark_captured, user.user_id, day)
+        return written
+
+    async def run_once(self, day: Optional[date] = None) -> Dict[str, int]:
+        """Capture every active user not yet captured on ``day``."""
+        day = day or date.today()
+        users = self.tracker.active(since=time.time() - self.active_window_seconds)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        counts = {"captured": 0, "failed": 0, "bytes": 0}
+
+        async def run(user: ActiveUser) -> None:
+            last = await asyncio.to_thread(self.store.last_captured, user.user_id)
+            if last == day:
+                return
+            async with semaphore:
+                try:
+                    counts["bytes"] += await self.capture(user, day)
+                except HTTPException as e:
+                    if e.status_code != 401 or not await refresh_user_token(
+                        self.tracker, user
+                    ):
+                        counts["failed"] += 1
+                        return
+                    counts["bytes"] += await self.capture(user, day)
+                counts["captured"] += 1
+
+        await asyncio.gather(*(run(user) for user in users))
+        return counts
+
+    async def run(self) -> None:
+        """Run snapshot checks until cancelled."""
+        while True:
+            try:
+                counts = await self.run_once()
+                logger.debug("Snapshot check: %s", counts)
+            except Exception as e:
+                logger.error("Snapshot check failed: %s", e)
+            await asyncio.sleep(self.check_interval_seconds)
+
+    def start(self) -> None:
+        """Start the snapshot loop on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the snapshot loop and wait for it to finish."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def create_snapshot_job() -> SnapshotJob:
+    """Create a snapshot job configured from application settings."""
+    settings = get_settings()
+    return SnapshotJob(
+        store=get_snapshot_store(),
+        tracker=get_activity_tracker(),
+        check_interval_seconds=settings.SNAPSHOT_CHECK_INTERVAL_SECONDS,
+        active_window_seconds=settings.SNAPSHOT_ACTIVE_WINDOW_DAYS * 86400,
+        concurrency=settings.SNAPSHOT_CONCURRENCY,
+    )
@@ -0,0 +1,137 @@
+"""Fan-out of new recently-played items to live subscribers."""
+
+import asyncio
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.models.compact import parse_played_at
+from app.services.spotify import SpotifyService
+from app.services.thumbnails import with_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Sentinel pushed to subscribers when their session's stream ends
+STREAM_CLOSED = None
+
+
+def played_at_ms(item: Dict[str, Any]) -> int:
+    """Return a play's ``played_at`` timestamp as unix milliseconds."""
+    return parse_played_at(item["played_at"])
+
+
+class SessionPoller:
+    """Polls one session's recently played tracks for all of its subscribers."""
+
+    def __init__(self, service: SpotifyService, interval_seconds: float):
+        self.service = service
+        self.interval_seconds = interval_seconds
+        self.subscribers: Set["asyncio.Queue[Optional[List[Dict[str, Any]]]]"] = set()
+        self.cursor: Optional[int] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def broadcast(self, message: Optional[List[Dict[str, Any]]]) -> None:
+        """Queue ``message`` for every subscriber, skipping full queues."""
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A stalled client misses this delta rather than blocking others
+                logger.debug("Dropped live update for a slow subscriber")
+
+    async def poll_once(self) -> List[Dict[str, Any]]:
+        """Fetch and broadcast plays newer than the cursor, with thumbnails."""
+        if self.cursor is None:
+            # Start from the newest known play so only new ones are pushed
+            latest = await self.service.get_recently_played(limit=50)
+            self.cursor = max(
+                (played_at_ms(item) for item in latest),
+                default=int(datetime.now().timestamp() * 1000),
+            )
+            return []
+
+        new_items = await self.service.get_recently_played_after(after=self.cursor)
+        if new_items:
+            self.cursor = max(played_at_ms(item) for item in new_items)
+            self.broadcast(with_thumbnails(new_items))
+        return new_items
+
+    async def run(self) -> None:
+        """
+        Poll until cancelled or the session's token is rejected.
+
+        Any other failure is logged and the next poll goes ahead, so a bad
+        item or a cache error never leaves subscribers waiting on a poller
+        that has stopped.
+        """
+        while True:
+            try:
+                await self.poll_once()
+            except HTTPException as e:
+                if e.status_code == 401:
+                    self.broadcast(STREAM_CLOSED)
+                    return
+                logger.error("Live poll failed: %s", e.detail)
+            except Exception:
+                logger.exception("Live poll failed")
+            await asyncio.sleep(self.interval_seconds)
+
+
+class RecentlyPlayedHub:
+    """
+    Shares one upstream poller per session between its live subscribers.
+
+    Tabs using the same session subscribe to the same poller, so upstream
+    load is one request per session per interval however many streams are
+    open. The poller starts with the first subscriber and stops with the
+    last.
+    """
+
+    def __init__(self, interval_seconds: float, queue_size: int = 16):
+        self.interval_seconds = interval_seconds
+        self.queue_size = queue_size
+        self._pollers: Dict[str, SessionPoller] = {}
+
+    def subscribe(
+        self, access_token: str
+    ) -> "asyncio.Queue[Optional[List[Dict[str, Any]]]]":
+        """Return a queue receiving lists of new plays for ``access_token``."""
+        session_key = SpotifyService.session_key_for(access_token)
+        poller = self._pollers.get(session_key)
+        if poller is None or (poller.task is not None and poller.task.done()):
+            poller = SessionPoller(SpotifyService(access_token), self.interval_seconds)
+            self._pollers[session_key] = poller
+        queue: "asyncio.Queue[Optional[List[Dict[str, Any]]]]" = asyncio.Queue(
+            maxsize=self.queue_size
+        )
+        poller.subscribers.add(queue)
+        if poller.task is None:
+            poller.task = asyncio.create_task(poller.run())
+        return queue
+
+    def unsubscribe(self, access_token: str, queue: "asyncio.Queue[Any]") -> None:
+        """Detach ``queue``, stopping the session's poller if it was the last."""
+        session_key = SpotifyService.session_key_for(access_token)
+        poller = self._pollers.get(session_key)
+        if poller is None:
+            return
+        poller.subscribers.discard(queue)
+        if not poller.subscribers:
+            if poller.task is not None:
+                poller.task.cancel()
+            del self._pollers[session_key]
+
+    def subscriber_count(self, access_token: str) -> int:
+        """Return how many streams are open for ``access_token``'s session."""
+        poller = self._pollers.get(SpotifyService.session_key_for(access_token))
+        return len(poller.subscribers) if poller else 0
+
+
+@lru_cache()
+def get_recently_played_hub() -> RecentlyPlayedHub:
+    """Return the process-wide recently-played hub."""
+    return RecentlyPlayedHub(interval_seconds=get_settings().LIVE_POLL_INTERVAL_SECONDS)
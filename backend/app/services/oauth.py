@@ -0,0 +1,225 @@
+"""
+Spotify OAuth: authorize URLs, login state and async token requests.
+
+Token requests go to Spotify's accounts service over a pooled
+``httpx.AsyncClient`` instead of blocking spotipy calls, so a burst of
+logins waits on the network without holding the event loop. At most
+``concurrency`` token requests are in flight; the rest queue.
+"""
+
+import asyncio
+import secrets
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode
+
+import httpx
+
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.core.disk_cache import DiskCache
+
+SPOTIFY_AUTHORIZE_URL = "https://accounts.spotify.com/authorize"
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+
+class OAuthError(Exception):
+    """Raised when Spotify's accounts service rejects or fails a token request."""
+
+
+class OAuthStateStore:
+    """
+    Single-use OAuth ``state`` values with expiry.
+
+    ``/login`` issues a random state and ``/callback`` only accepts a state
+    it issued that has not expired or been used, so a callback URL crafted
+    by someone else (login CSRF) is rejected. With a disk cache the states
+    are shared by every worker using the same file, so the callback may be
+    served by a different worker than the login.
+    """
+
+    def __init__(
+        self, ttl_seconds: float, maxsize: int, disk: Optional[DiskCache] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.disk = disk
+        self._memory: TTLCache[bool] = TTLCache(maxsize=maxsize)
+
+    async def issue(self) -> str:
+        """Create and remember a new state value."""
+        state = secrets.token_urlsafe(32)
+        expires_at = time.time() + self.ttl_seconds
+        if self.disk is not None:
+            await asyncio.to_thread(
+                self.disk.set, ("oauth-state", state), True, expires_at
+            )
+        else:
+            self._memory.set(state, True, expires_at)
+        return state
+
+    async def consume(self, state: str) -> bool:
+        """Return whether ``state`` was issued and still valid, invalidating it."""
+        if self.disk is not None:
+            key = ("oauth-state", state)
+
+            def take() -> bool:
+                return self.disk.get(key) is not None and self.disk.pop(key)
+
+            return await asyncio.to_thread(take)
+        valid = self._memory.get(state) is not None
+        self._memory.pop(state)
+        return valid
+
+
+class SpotifyOAuthClient:
+    """Async client for Spotify's authorization code flow."""
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        redirect_uri: str,
+        scope: str,
+        concurrency: int,
+        timeout_seconds: float,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.scope = scope
+        self.concurrency = concurrency
+        self.timeout_seconds = timeout_seconds
+        self.transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def authorize_url(self, state: str) -> str:
+        """Return the Spotify authorization URL for a login with ``state``."""
+        query = {
+            "client_id": self.client_id,
+            "response_type": "code",
+            "redirect_uri": self.redirect_uri,
+            "scope": self.scope,
+            "state": state,
+        }
+        return f"{SPOTIFY_AUTHORIZE_URL}?{urlencode(query)}"
+
+    def _client(self) -> httpx.AsyncClient:
+        """Return the pooled HTTP client of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            limits = httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            )
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout_seconds, limits=limits, transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._http
+
+    async def _token_request(self, data: Dict[str, str]) -> Dict[str, Any]:
+        client = self._client()
+        assert self._semaphore is not None
+        async with self._semaphore:
+            try:
+                response = await client.post(
+                    SPOTIFY_TOKEN_URL,
+                    data=data,
+                    auth=(self.client_id, self.client_secret),
+                )
+            except httpx.HTTPError as e:
+                raise OAuthError(f"Token request failed: {str(e)}")
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code != 200 or "access_token" not in body:
+            raise OAuthError(
+                body.get("error_description")
+                or body.get("error")
+                or f"Token request failed with HTTP {response.status_code}"
+            )
+        return body
+
+    async def exchange_code(self, code: str) -> Dict[str, Any]:
+        """
+        Exchange an authorization code for tokens.
+
+        Returns:
+            Token info with ``access_token``, ``refresh_token`` and
+            ``expires_in``
+
+        Raises:
+            OAuthError: The code was rejected or Spotify could not be reached
+        """
+        return await self._token_request(
+            {
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": self.redirect_uri,
+            }
+        )
+
+    async def refresh_access_token(self, refresh_token: str) -> Dict[str, Any]:
+        """
+        Exchange a refresh token for a new access token.
+
+        Spotify does not always rotate the refresh token; the one passed in
+        is returned when no new one is issued.
+
+        Raises:
+            OAuthError: The token was rejected or Spotify could not be reached
+        """
+        token_info = await self._token_request(
+            {"grant_type": "refresh_token", "refresh_token": refresh_token}
+        )
+        token_info.setdefault("refresh_token", refresh_token)
+        return token_info
+
+    async def client_credentials(self) -> Dict[str, Any]:
+        """
+        Get an app access token, for catalog requests made outside a session.
+
+        Raises:
+            OAuthError: The credentials were rejected or Spotify could not be
+                reached
+        """
+        return await self._token_request({"grant_type": "client_credentials"})
+
+    async def aclose(self) -> None:
+        """Close pooled connections."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+@lru_cache()
+def get_oauth_client() -> SpotifyOAuthClient:
+    """Return the process-wide Spotify OAuth client."""
+    settings = get_settings()
+    return SpotifyOAuthClient(
+        client_id=settings.SPOTIFY_CLIENT_ID,
+        client_secret=settings.SPOTIFY_CLIENT_SECRET,
+        redirect_uri=settings.SPOTIFY_REDIRECT_URI,
+        scope=settings.SPOTIFY_SCOPES,
+        concurrency=settings.OAUTH_CONCURRENCY,
+        timeout_seconds=settings.OAUTH_TIMEOUT_SECONDS,
+    )
+
+
+@lru_cache()
+def get_oauth_state_store() -> OAuthStateStore:
+    """Return the process-wide OAuth state store."""
+    from app.services.spotify import get_disk_cache
+
+    settings = get_settings()
+    return OAuthStateStore(
+        ttl_seconds=settings.OAUTH_STATE_TTL_SECONDS,
+        maxsize=settings.TOKEN_CLAIMS_CACHE_SIZE,
+        disk=get_disk_cache(),
+    )
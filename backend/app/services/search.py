@@ -0,0 +1,549 @@
+"""
+Per-user in-memory search over listening history.
+
+A user's index holds one document per track, artist and album seen in
+their top lists or recently played tracks, with the plays counted and
+the current rank in each top list. Track and album documents also carry
+their artists' names, so searching an artist finds their tracks too.
+
+Names are normalised (accents stripped, case folded, punctuation dropped)
+and every word is indexed under its trigrams, plus ``" " + first
+character`` and ``" " + first two characters`` marking word starts.
+Posting lists are ``array("I")`` of document numbers, 4 bytes per entry,
+in ascending order. A query word of three or more characters matches as a
+substring, a shorter one as a word prefix. The posting lists of a query's
+keys are intersected with numpy, shortest first, and the candidates are
+ranked as a whole; only as many as needed to fill the page, best first,
+are confirmed against their text.
+
+The index is built on a user's first search from the (cached) top lists
+and recently played tracks and topped up on later searches once
+``SEARCH_INDEX_REFRESH_SECONDS`` have passed: new items are appended and
+plays newer than the last one counted are added. Searches arriving while
+an index is first built wait for it. If a later top-up fails, it is logged
+and the search uses the index as it stands.
+
+Every recently played list fetched for a user, by a request or the cache
+warmer, goes through ``record_plays``: new plays are stored in the
+snapshot store (see ``app.services.history``) and counted in the user's
+index if it is loaded. A new index starts from the stored plays, so the
+play history grows past Spotify's 50-play window whether or not the user
+searches, and survives eviction. The daily snapshots update the ranks of
+loaded indexes too. Indexes of users idle for ``SEARCH_INDEX_IDLE_SECONDS``,
+or beyond the ``SEARCH_INDEX_MAX_USERS`` most recent, are evicted on each
+search and each recorded list, so they go even if no one searches again.
+"""
+
+import asyncio
+import heapq
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.models.compact import format_played_at, parse_played_at
+from app.services.history import get_snapshot_store
+from app.services.spotify import SpotifyService
+from app.services.stats import TIME_RANGES
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("track", "artist", "album")
+TRACK, ARTIST, ALBUM = range(len(KINDS))
+
+# Sort key bits: matched on the name, plays, best rank (missing ones and
+# those past NO_RANK sort alike)
+NAME_SHIFT = 52
+MAX_PLAYS = (1 << 31) - 1
+NO_RANK = (1 << 20) - 1
+
+_NON_WORD = re.compile(r"[^\w]+")
+_EMPTY = np.empty(0, dtype=np.uint32)
+
+
+def normalise(text: str) -> str:
+    """Return ``text`` folded for matching: no accents, case or punctuation."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", stripped.casefold()).split())
+
+
+def word_keys(word: str) -> Iterable[str]:
+    """Return the index keys of one normalised word."""
+    padded = " " + word
+    yield padded[:2]
+    for i in range(len(padded) - 2):
+        yield padded[i : i + 3]
+
+
+def query_keys(word: str) -> List[str]:
+    """Return the keys every document matching a query word is listed under."""
+    if len(word) < 3:
+        return [(" " + word)[:3]]
+    return [word[i : i + 3] for i in range(len(word) - 2)]
+
+
+def _intersect(small: np.ndarray, large: np.ndarray) -> np.ndarray:
+    """Return the items of sorted ``small`` also in sorted ``large``."""
+    positions = np.minimum(np.searchsorted(large, small), len(large) - 1)
+    return small[large[positions] == small]
+
+
+class _Postings(Dict[str, "array[int]"]):
+    """Document numbers per key, ascending."""
+
+    def add(self, number: int, text: str) -> None:
+        for key in {key for word in text.split() for key in word_keys(word)}:
+            postings = self.get(key)
+            if postings is None:
+                postings = self[key] = array("I")
+            postings.append(number)
+
+    def candidates(self, words: Sequence[str]) -> np.ndarray:
+        """
+        Return the numbers of documents listed under every key of ``words``.
+
+        A word of up to three characters has one key, which is exact; the
+        trigrams of a longer word can all occur without the word itself,
+        so those candidates still need checking against the text.
+        """
+        lists = []
+        for word in words:
+            for key in query_keys(word):
+                postings = self.get(key)
+                if postings is None:
+                    return _EMPTY
+                lists.append(postings)
+        lists.sort(key=len)
+        matched = np.array(lists[0], dtype=np.uint32)
+        for postings in lists[1:]:
+            if not len(matched):
+                break
+            matched = _intersect(matched, np.frombuffer(postings, dtype=np.uint32))
+        return matched
+
+
+def _ascending(keys: np.ndarray, first: int) -> Iterator[int]:
+    """Yield the positions of ``keys`` in ascending order, sorting lazily."""
+    remaining = np.arange(len(keys))
+    size = first
+    while len(remaining):
+        if len(remaining) > size:
+            split = np.argpartition(keys[remaining], size)
+            head, remaining = remaining[split[:size]], remaining[split[size:]]
+        else:
+            head, remaining = remaining, remaining[:0]
+        yield from head[np.lexsort((head, keys[head]))].tolist()
+        size *= 4
+
+
+class SearchIndex:
+    """Search index over one user's tracks, artists and albums."""
+
+    def __init__(self) -> None:
+        self._numbers: Dict[Tuple[int, str], int] = {}
+        self.kinds = array("B")
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.artists: List[Tuple[str, ...]] = []
+        self.albums: List[Optional[str]] = []
+        self.name_texts: List[str] = []
+        self.texts: List[str] = []
+        self.plays = array("I")
+        self.last_played = array("q")
+        self.best_rank = array("I")
+        self.ranks: Dict[Tuple[int, str], Dict[int, int]] = {}
+        # Keys of the name alone, and of the name, artists and album
+        self.name_postings = _Postings()
+        self.postings = _Postings()
+        self.played_until = 0
+        self.refreshed_at: Optional[float] = None
+        self.refreshing: Optional["asyncio.Future[None]"] = None
+        self.used_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _document(
+        self,
+        kind: int,
+        item_id: Optional[str],
+        name: Optional[str],
+        artists: Sequence[str] = (),
+        album: Optional[str] = None,
+    ) -> Optional[int]:
+        """Return the number of a document, adding it when it is new."""
+        if not item_id or not name:
+            return None
+        number = self._numbers.get((kind, item_id))
+        if number is not None:
+            return number
+        number = len(self.ids)
+        self._numbers[(kind, item_id)] = number
+        name_text = normalise(name)
+        others = [normalise(other) for other in (*artists, album) if other]
+        text = " ".join([name_text, *others])
+        self.kinds.append(kind)
+        self.ids.append(item_id)
+        self.names.append(name)
+        self.artists.append(tuple(artists))
+        self.albums.append(album)
+        self.name_texts.append(name_text)
+        self.texts.append(text)
+        self.plays.append(0)
+        self.last_played.append(0)
+        self.best_rank.append(NO_RANK)
+        self.name_postings.add(number, name_text)
+        self.postings.add(number, text)
+        return number
+
+    def _track(self, track: Dict[str, Any]) -> List[Optional[int]]:
+        """Add a track, its artists and album; return their numbers, track first."""
+        artist_refs = track.get("artists") or []
+        album = track.get("album") or {}
+        return [
+            self._document(
+                TRACK,
+                track.get("id"),
+                track.get("name"),
+                [a["name"] for a in artist_refs if a.get("name")],
+                album.get("name"),
+            ),
+            *(self._document(ARTIST, a.get("id"), a.get("name")) for a in artist_refs),
+            self._document(
+                ALBUM,
+                album.get("id"),
+                album.get("name"),
+                [a["name"] for a in album.get("artists") or [] if a.get("name")],
+            ),
+        ]
+
+    def add_top(
+        self, kind: str, time_range: str, items: Sequence[Dict[str, Any]]
+    ) -> None:
+        """Index a top list (``tracks`` or ``artists``), replacing its ranks."""
+        code = TRACK if kind == "tracks" else ARTIST
+        ranks: Dict[int, int] = {}
+        for rank, item in enumerate(items, 1):
+            if code == TRACK:
+                number = self._track(item)[0]
+            else:
+                number = self._document(ARTIST, item.get("id"), item.get("name"))
+            if number is not None:
+                ranks.setdefault(number, rank)
+        previous = self.ranks.get((code, time_range), {})
+        self.ranks[(code, time_range)] = ranks
+        for number in {*previous, *ranks}:
+            self.best_rank[number] = min(
+                NO_RANK,
+                *(
+                    self.ranks.get((code, r), {}).get(number, NO_RANK)
+                    for r in TIME_RANGES
+                ),
+            )
+
+    def add_plays(self, plays: Sequence[Dict[str, Any]]) -> int:
+        """Count plays newer than those already counted; return how many."""
+        counted = 0
+        latest = self.played_until
+        for play in plays:
+            played_at = parse_played_at(play["played_at"])
+            if played_at <= self.played_until:
+                continue
+            for number in self._track(play.get("track") or {}):
+                if number is None:
+                    continue
+                self.plays[number] += 1
+                if played_at > self.last_played[number]:
+                    self.last_played[number] = played_at
+            latest = max(latest, played_at)
+            counted += 1
+        self.played_until = latest
+        return counted
+
+    def search(
+        self, query: str, kinds: Sequence[str] = KINDS, limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the best matches of ``query``.
+
+        Matches on the name come before matches on artists or album only;
+        within each, more played and then higher ranked items come first.
+        """
+        words = normalise(query).split()
+        if not words:
+            return []
+        matched = self.postings.candidates(words)
+        if len(kinds) < len(KINDS) and len(matched):
+            codes = np.frombuffer(self.kinds, dtype=np.uint8)[matched]
+            matched = matched[np.isin(codes, [KINDS.index(k) for k in kinds])]
+        if not len(matched):
+            return []
+        in_name = np.isin(matched, self.name_postings.candidates(words))
+        plays = np.frombuffer(self.plays, dtype=np.uint32)[matched].astype(np.int64)
+        ranks = np.frombuffer(self.best_rank, dtype=np.uint32)[matched]
+        keys = (
+            (~in_name).astype(np.int64) << NAME_SHIFT
+            | (MAX_PLAYS - np.minimum(plays, MAX_PLAYS)) << 20
+            | ranks
+        )
+
+        # Candidates are checked best first, stopping at ``limit`` matches.
+        # One whose name only seemed to match moves down to the other tier.
+        longer = [word for word in words if len(word) > 3]
+        results: List[int] = []
+        demoted: List[Tuple[int, int]] = []
+        for position in _ascending(keys, limit):
+            key, number = int(keys[position]), int(matched[position])
+            while demoted and demoted[0][0] <= key and len(results) < limit:
+                results.append(heapq.heappop(demoted)[1])
+            if len(results) == limit:
+                break
+            if not all(word in self.texts[number] for word in longer):
+                continue
+            if in_name[position] and not all(
+                word in self.name_texts[number] for word in longer
+            ):
+                heapq.heappush(demoted, (key | 1 << NAME_SHIFT, number))
+                continue
+            results.append(number)
+            if len(results) == limit:
+                break
+        while demoted and len(results) < limit:
+            results.append(heapq.heappop(demoted)[1])
+        return [self.document(number) for number in results]
+
+    def find(self, kind: str, item_id: str) -> Optional[Dict[str, Any]]:
+        """Return the document of a ``kind`` item by id, if indexed."""
+        number = self._numbers.get((KINDS.index(kind), item_id))
+        return None if number is None else self.document(number)
+
+    def document(self, number: int) -> Dict[str, Any]:
+        """Return a document with its plays and ranks."""
+        kind = self.kinds[number]
+        last_played = self.last_played[number]
+        result: Dict[str, Any] = {
+            "kind": KINDS[kind],
+            "id": self.ids[number],
+            "name": self.names[number],
+        }
+        if kind != ARTIST:
+            result["artists"] = list(self.artists[number])
+        if kind == TRACK:
+            result["album"] = self.albums[number]
+        result["plays"] = self.plays[number]
+        result["last_played_at"] = (
+            datetime.fromtimestamp(last_played / 1000, timezone.utc).isoformat()
+            if last_played
+            else None
+        )
+        if kind != ALBUM:
+            result["ranks"] = {
+                r: self.ranks.get((kind, r), {}).get(number) for r in TIME_RANGES
+            }
+        return result
+
+
+class SearchIndexes:
+    """The search indexes of recently searching users, evicted when idle."""
+
+    def __init__(self, max_users: int, idle_seconds: float):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._indexes: "OrderedDict[str, SearchIndex]" = OrderedDict()
+        # Latest play stored per user, to skip recently played lists seen before
+        self.stored_until: TTLCache[int] = TTLCache(maxsize=max_users)
+
+    def get(self, user_id: str) -> SearchIndex:
+        """Return the index of ``user_id``, creating an empty one if needed."""
+        now = time.monotonic()
+        index = self._indexes.pop(user_id, None)
+        if index is None:
+            index = SearchIndex()
+        index.used_at = now
+        self._indexes[user_id] = index
+        self.evict(now)
+        return index
+
+    def loaded(self, user_id: str) -> Optional[SearchIndex]:
+        """Return the index of ``user_id`` if it is built, without using it."""
+        index = self._indexes.get(user_id)
+        return index if index is not None and index.refreshed_at is not None else None
+
+    def evict(self, now: float) -> None:
+        """Drop indexes idle for too long, and the least recent over the limit."""
+        while self._indexes:
+            user_id, index = next(iter(self._indexes.items()))
+            if len(self._indexes) <= self.max_users and (
+                now - index.used_at < self.idle_seconds
+            ):
+                break
+            del self._indexes[user_id]
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._indexes
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+
+@lru_cache()
+def get_search_indexes() -> SearchIndexes:
+    """Return the process-wide search indexes."""
+    settings = get_settings()
+    return SearchIndexes(
+        max_users=settings.SEARCH_INDEX_MAX_USERS,
+        idle_seconds=settings.SEARCH_INDEX_IDLE_SECONDS,
+    )
+
+
+def _indexed_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the parts of a track the index uses, for storing its plays."""
+    album = track.get("album") or {}
+    return {
+        "id": track.get("id"),
+        "name": track.get("name"),
+        "artists": [
+            {"id": a.get("id"), "name": a.get("name")}
+            for a in track.get("artists") or []
+        ],
+        "album": {
+            "id": album.get("id"),
+            "name": album.get("name"),
+            "artists": [{"name": a.get("name")} for a in album.get("artists") or []],
+        },
+    }
+
+
+async def record_plays(user_id: str, plays: Sequence[Dict[str, Any]]) -> int:
+    """
+    Store the new plays of a recently played list; return how many were new.
+
+    They are also counted in the user's index when it is loaded. A list
+    with nothing newer than the last one stored is skipped without
+    touching the database. Storage errors are logged, not raised, so they
+    never fail the request that fetched the list.
+    """
+    records = [
+        (parse_played_at(play["played_at"]), _indexed_track(play.get("track") or {}))
+        for play in plays
+    ]
+    records = [(played_at, track) for played_at, track in records if track["id"]]
+    indexes = get_search_indexes()
+    indexes.evict(time.monotonic())
+    latest = max((played_at for played_at, _ in records), default=0)
+    if latest <= (indexes.stored_until.get(user_id) or 0):
+        return 0
+    try:
+        added = await asyncio.to_thread(
+            get_snapshot_store().record_plays, user_id, records
+        )
+    except sqlite3.Error as e:
+        logger.warning("Could not store plays: %s", e)
+        return 0
+    indexes.stored_until.set(user_id, latest, time.time() + indexes.idle_seconds)
+    index = indexes.loaded(user_id)
+    if index is not None:
+        index.add_plays(plays)
+    return added
+
+
+def record_top_lists(
+    user_id: str, lists: Dict[Tuple[str, str], Sequence[Dict[str, Any]]]
+) -> None:
+    """Update the ranks in the user's loaded index from fresh top lists."""
+    index = get_search_indexes().loaded(user_id)
+    if index is None:
+        return
+    for (kind, time_range), items in lists.items():
+        index.add_top(kind, time_range, items)
+
+
+async def refresh_index(
+    service: SpotifyService, user_id: str, index: SearchIndex
+) -> None:
+    """
+    Add the user's current top lists and recent plays to ``index``.
+
+    These come through the response cache, so a refresh shortly after the
+    dashboard loaded makes no upstream calls. The first refresh of an
+    index starts from the plays stored by ``record_plays``.
+    """
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(service.get_top_tracks(limit=50, time_range=r) for r in TIME_RANGES),
+        *(service.get_top_artists(limit=50, time_range=r) for r in TIME_RANGES),
+        service.get_recently_played(limit=50),
+    )
+    if index.refreshed_at is None:
+        stored = await asyncio.to_thread(get_snapshot_store().plays, user_id)
+        index.add_plays(
+            [
+                {"track": track, "played_at": format_played_at(played_at)}
+                for played_at, track in stored
+            ]
+        )
+    for time_range, tracks in zip(TIME_RANGES, results):
+        index.add_top("tracks", time_range, tracks)
+    for time_range, artists in zip(TIME_RANGES, results[len(TIME_RANGES) :]):
+        index.add_top("artists", time_range, artists)
+    index.add_plays(results[-1])
+    index.refreshed_at = started
+
+
+async def user_index(service: SpotifyService, user_id: str) -> SearchIndex:
+    """
+    Return the user's index, refreshed first if it is due.
+
+    One refresh runs at a time. Searches made during an index's first
+    refresh wait for it; later ones use the index as it stands. Only the
+    first refresh raises: a later one that fails is logged and the index
+    is returned as it was.
+    """
+    index = get_search_indexes().get(user_id)
+    refresh_seconds = get_settings().SEARCH_INDEX_REFRESH_SECONDS
+    if index.refreshing is None and (
+        index.refreshed_at is None
+        or time.monotonic() - index.refreshed_at >= refresh_seconds
+    ):
+        refreshing = asyncio.ensure_future(refresh_index(service, user_id, index))
+        index.refreshing = refreshing
+        refreshing.add_done_callback(lambda _: setattr(index, "refreshing", None))
+        try:
+            await asyncio.shield(refreshing)
+        except Exception as e:
+            if index.refreshed_at is None:
+                raise
+            logger.warning("Search index refresh failed: %s", e)
+    elif index.refreshing is not None and index.refreshed_at is None:
+        await asyncio.shield(index.refreshing)
+    return index
+
+
+async def search_history(
+    service: SpotifyService,
+    user_id: str,
+    query: str,
+    kinds: Sequence[str] = KINDS,
+    limit: int = 20,
+) -> Dict[str, Any]:
+    """Search the user's tracks, artists and albums, refreshing if due."""
+    index = await user_index(service, user_id)
+    started = time.perf_counter()
+    results = index.search(query, kinds, limit)
+    return {
+        "query": query,
+        "results": results,
+        "indexed": len(index),
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
@@ -1,25 +1,371 @@
+import asyncio
+import hashlib
 import logging
-from typing import Any, Dict, List
+import sqlite3
+import time
+from functools import lru_cache
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
+import requests
 import spotipy
 from fastapi import HTTPException
 from spotipy.exceptions import SpotifyException
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from app.core.adaptive_ttl import AdaptiveTTL, content_digest
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.core.disk_cache import DiskCache
+from app.core.ratelimit import RateLimiter
+from app.core.resilience import UPSTREAM_UNAVAILABLE, CircuitBreaker, UpstreamEndpoint
+from app.models.compact import CompactAlbum, CompactArtist, CompactPlay, CompactTrack
+
+CompactItem = Union[CompactAlbum, CompactArtist, CompactPlay, CompactTrack]
+
+# Spotify's limit on ids per several-artists request
+ARTISTS_PER_REQUEST = 50
+
+# Cache key prefix of catalog data, which is the same for every session
+CATALOG_SCOPE = "catalog"
+
+# Market of artist top tracks when the user's country is not known
+DEFAULT_MARKET = "US"
+
+# The only profile fields written to the disk tier (the rest is PII)
+PROFILE_DISK_FIELDS = ("id", "country")
+
 logger = logging.getLogger(__name__)
 
 
+@lru_cache()
+def get_response_cache() -> TTLCache[Tuple[CompactItem, ...]]:
+    """Return the shared cache of Spotify API responses, as compact records."""
+    return TTLCache(maxsize=get_settings().RESPONSE_CACHE_SIZE, keep_stale=True)
+
+
+@lru_cache()
+def get_adaptive_ttl() -> AdaptiveTTL:
+    """Return the TTLs learned for top lists, per user and request."""
+    settings = get_settings()
+    return AdaptiveTTL(
+        base_seconds=settings.TOP_ITEMS_CACHE_TTL_SECONDS,
+        min_seconds=settings.ADAPTIVE_TTL_MIN_SECONDS,
+        growth=settings.ADAPTIVE_TTL_GROWTH,
+        shrink=settings.ADAPTIVE_TTL_SHRINK,
+        maxsize=settings.RESPONSE_CACHE_SIZE,
+    )
+
+
+@lru_cache()
+def get_rate_limiter() -> RateLimiter:
+    """Return the limiter shared by all upstream Spotify calls."""
+    settings = get_settings()
+    return RateLimiter(
+        rate=settings.SPOTIFY_RATE_LIMIT_PER_SECOND,
+        burst=settings.SPOTIFY_RATE_LIMIT_BURST,
+    )
+
+
+@lru_cache()
+def get_profile_cache() -> TTLCache[Dict[str, Any]]:
+    """Return the cache of user profiles, keyed per session."""
+    return TTLCache(maxsize=get_settings().RESPONSE_CACHE_SIZE, keep_stale=True)
+
+
+@lru_cache()
+def get_disk_cache() -> Optional[DiskCache]:
+    """Return the on-disk cache tier, or None when it is disabled."""
+    settings = get_settings()
+    if not settings.DISK_CACHE_ENABLED:
+        return None
+    return DiskCache(settings.DISK_CACHE_PATH, settings.DISK_CACHE_MAX_BYTES)
+
+
+async def read_through(
+    memory: TTLCache[Any], key: Hashable, stale: bool = False
+) -> Optional[Any]:
+    """
+    Look ``key`` up in ``memory``, then on disk.
+
+    Live disk hits are promoted into ``memory`` with their stored expiry.
+    With ``stale`` expired entries of either tier are returned too.
+    """
+    value = memory.get_stale(key) if stale else memory.get(key)
+    disk = get_disk_cache()
+    if value is not None or disk is None:
+        return value
+    try:
+        entry = await asyncio.to_thread(disk.get_entry if stale else disk.get, key)
+    except sqlite3.Error as e:
+        logger.warning("Disk cache read failed: %s", e)
+        return None
+    if entry is None:
+        return None
+    value, expires_at = entry
+    if expires_at > time.time():
+        memory.set(key, value, expires_at)
+    return value
+
+
+async def write_through(
+    memory: TTLCache[Any], key: Hashable, value: Any, expires_at: float
+) -> None:
+    """Store ``value`` in ``memory`` and on disk."""
+    memory.set(key, value, expires_at)
+    disk = get_disk_cache()
+    if disk is None:
+        return
+    try:
+        await asyncio.to_thread(disk.set, key, value, expires_at)
+    except sqlite3.Error as e:
+        # The disk tier is an optimisation; never fail a request over it
+        logger.warning("Disk cache write failed: %s", e)
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Return whether ``error`` means Spotify itself failed, not the request."""
+    if isinstance(error, SpotifyException):
+        return (
+            error.http_status is None
+            or error.http_status >= 500
+            or (error.http_status == 429)
+        )
+    if isinstance(error, HTTPException):
+        return error.status_code == UPSTREAM_UNAVAILABLE
+    return isinstance(error, requests.RequestException)
+
+
+@lru_cache()
+def get_upstreams() -> Dict[str, UpstreamEndpoint]:
+    """Return the guarded upstream endpoints by name, created on first use."""
+    return {}
+
+
+def get_upstream(endpoint: str) -> UpstreamEndpoint:
+    """Return the circuit breaker and latency tracking for ``endpoint``."""
+    upstreams = get_upstreams()
+    upstream = upstreams.get(endpoint)
+    if upstream is None:
+        settings = get_settings()
+        upstream = UpstreamEndpoint(
+            endpoint,
+            CircuitBreaker(
+                failure_threshold=settings.SPOTIFY_BREAKER_FAILURE_THRESHOLD,
+                reset_seconds=settings.SPOTIFY_BREAKER_RESET_SECONDS,
+            ),
+            is_failure=is_upstream_failure,
+            hedge_min_samples=settings.SPOTIFY_HEDGE_MIN_SAMPLES,
+            limiter=get_rate_limiter(),
+        )
+        upstreams[endpoint] = upstream
+    return upstream
+
+
 class SpotifyService:
     """Service class for interacting with Spotify Web API."""
 
     def __init__(self, access_token: str):
         """Initialize Spotify client with user's access token."""
-        self.client = spotipy.Spotify(auth=access_token)
+        settings = get_settings()
+        self.client = spotipy.Spotify(
+            auth=access_token,
+            requests_timeout=settings.SPOTIFY_REQUEST_TIMEOUT_SECONDS,
+            retries=settings.SPOTIFY_RETRIES,
+        )
         self.logger = logging.getLogger(__name__)
+        # Responses are cached per session, keyed by a digest of the token
+        self.session_key = self.session_key_for(access_token)
+
+    @staticmethod
+    def session_key_for(access_token: str) -> str:
+        """Return the key identifying the session that owns ``access_token``."""
+        return hashlib.sha256(access_token.encode()).hexdigest()
+
+    def cache_key(self, endpoint: str, **params: Any) -> Tuple[Hashable, ...]:
+        """Return the response cache key for ``endpoint`` called with ``params``."""
+        return (self.session_key, endpoint, *sorted(params.items()))
+
+    def user_key(self) -> Hashable:
+        """Return the user's Spotify id if their profile is cached, else the session key."""
+        profile = get_profile_cache().get_stale(self.profile_key())
+        if profile is None or not profile.get("id"):
+            return self.session_key
+        return profile["id"]
+
+    @staticmethod
+    def catalog_key(endpoint: str, **params: Any) -> Tuple[Hashable, ...]:
+        """Return the response cache key of catalog data, shared by all sessions."""
+        return (CATALOG_SCOPE, endpoint, *sorted(params.items()))
+
+    def market(self) -> str:
+        """Return the user's country from their cached profile, or the default."""
+        profile = get_profile_cache().get_stale(self.profile_key())
+        return (profile or {}).get("country") or DEFAULT_MARKET
+
+    def cache_expiry(self, endpoint: str, **params: Any) -> Optional[float]:
+        """Return when the cached response for ``endpoint`` expires, if cached."""
+        return get_response_cache().expires_at(self.cache_key(endpoint, **params))
+
+    async def _cached(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        fetch: Callable[[], Dict[str, Any]],
+        model: Type[CompactItem],
+        ttl: float,
+        refresh: bool,
+        max_ttl: Optional[float] = None,
+        shared: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Return ``fetch()["items"]`` through the response cache.
+
+        Misses are looked up in the disk tier, then fetched through
+        ``_fetch``. Items are cached as ``model`` records and expanded back
+        to the API's JSON shape on every return. While Spotify is failing,
+        an expired entry is served instead of an error (except on
+        ``refresh``, which must not report stale data as refreshed).
+
+        With ``max_ttl``, ``ttl`` is only the starting point: the TTL is
+        learned per user and request from whether each fetch changed the
+        items, up to ``max_ttl`` (see ``app.core.adaptive_ttl``). ``shared``
+        responses are catalog data, cached once for all sessions.
+        """
+        cache = get_response_cache()
+        if shared:
+            key = self.catalog_key(endpoint, **params)
+        else:
+            key = self.cache_key(endpoint, **params)
+        adaptive = None
+        if max_ttl is not None:
+            adaptive = get_adaptive_ttl()
+            # Learned per user rather than per session, so it outlives tokens
+            learned_key = (self.user_key(), *key[1:])
+        records = None if refresh else await read_through(cache, key)
+        if records is not None and adaptive is not None:
+            adaptive.hit(learned_key)
+        if records is None:
+            try:
+                items = (await self._fetch(endpoint, fetch))["items"]
+            except (HTTPException, SpotifyException) as e:
+                if refresh or not is_upstream_failure(e):
+                    raise
+                records = await read_through(cache, key, stale=True)
+                if records is None:
+                    raise
+                self.logger.warning("Serving stale %s: Spotify unavailable", endpoint)
+            else:
+                records = tuple(model.from_api(item) for item in items)
+                if adaptive is not None:
+                    ttl = adaptive.fetched(
+                        learned_key,
+                        content_digest(item.get("id") for item in items),
+                        max_ttl,
+                        background=refresh,
+                    )
+                await write_through(cache, key, records, time.time() + ttl)
+        return [record.to_api() for record in records]
+
+    async def _fetch(
+        self, endpoint: str, fetch: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Run a blocking spotipy call under the shared rate limit.
+
+        The call goes through ``endpoint``'s circuit breaker, which takes
+        the rate limiter token once it lets the call through, and, when
+        enabled and the rate limiter has headroom, is hedged.
+
+        Raises:
+            HTTPException: 503 when the circuit is open or Spotify could not
+                be reached
+        """
+        settings = get_settings()
+        limiter = get_rate_limiter()
+        hedge = (
+            settings.SPOTIFY_HEDGE_ENABLED
+            and limiter.pressure <= settings.SPOTIFY_HEDGE_MAX_PRESSURE
+        )
+        try:
+            return await get_upstream(endpoint).call(fetch, hedge=hedge)
+        except requests.RequestException as e:
+            raise HTTPException(
+                status_code=UPSTREAM_UNAVAILABLE,
+                detail=f"Spotify did not respond: {str(e)}",
+            )
+
+    @staticmethod
+    def _max_ttl(time_range: str) -> Optional[int]:
+        """Return the adaptive TTL bound of a top list, or None when disabled."""
+        settings = get_settings()
+        if not settings.ADAPTIVE_TTL_ENABLED:
+            return None
+        return settings.ADAPTIVE_TTL_MAX_SECONDS.get(
+            time_range, settings.TOP_ITEMS_CACHE_TTL_SECONDS
+        )
+
+    async def get_profile(self, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Get the current user's profile, cached per session.
+
+        Only ``PROFILE_DISK_FIELDS`` reach the disk tier, and only when they
+        changed or the stored entry is past half its TTL, so refreshing on
+        every request does not write on every request. After a restart,
+        until it is refetched, the profile has only those fields.
+
+        Args:
+            refresh: Bypass the cache and refetch from Spotify
+
+        Returns:
+            User object
+        """
+        cache = get_profile_cache()
+        key = self.profile_key()
+        profile = None if refresh else await read_through(cache, key)
+        if profile is not None:
+            return profile
+        try:
+            profile = await self._fetch("profile", self.client.current_user)
+        except SpotifyException as e:
+            self.logger.error("Error fetching user profile: %s", e)
+            raise HTTPException(status_code=e.http_status, detail=str(e))
+        now = time.time()
+        ttl = get_settings().PROFILE_CACHE_TTL_SECONDS
+        stored = {field: profile.get(field) for field in PROFILE_DISK_FIELDS}
+        previous = cache.get_stale(key)
+        expires_at = cache.expires_at(key)
+        if (
+            previous is None
+            or expires_at is None
+            or expires_at - now < ttl / 2
+            or {field: previous.get(field) for field in PROFILE_DISK_FIELDS} != stored
+        ):
+            expires_at = now + ttl
+            await write_through(cache, key, stored, expires_at)
+        # In memory, the full profile shares the stored entry's expiry
+        cache.set(key, profile, expires_at)
+        return profile
+
+    def profile_key(self) -> Tuple[Hashable, ...]:
+        """Return the profile cache key of this session."""
+        return (self.session_key, "profile")
+
+    async def last_known_profile(self) -> Optional[Dict[str, Any]]:
+        """Return the session's cached profile, even if it has expired."""
+        return await read_through(get_profile_cache(), self.profile_key(), stale=True)
 
     async def get_top_tracks(
-        self, limit: int = 20, time_range: str = "medium_term"
+        self, limit: int = 20, time_range: str = "medium_term", refresh: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Get user's top tracks.
@@ -30,22 +376,31 @@ class SpotifyService:
                 - short_term: ~4 weeks
                 - medium_term: ~6 months
                 - long_term: calculated from several years of data
+            refresh: Bypass the response cache and refetch from Spotify
 
         Returns:
             List of track objects
         """
         try:
-            results = self.client.current_user_top_tracks(
-                limit=limit, time_range=time_range
+            items = await self._cached(
+                "top-tracks",
+                {"limit": limit, "time_range": time_range},
+                lambda: self.client.current_user_top_tracks(
+                    limit=limit, time_range=time_range
+                ),
+                CompactTrack,
+                get_settings().TOP_ITEMS_CACHE_TTL_SECONDS,
+                refresh,
+                self._max_ttl(time_range),
             )
-            self.logger.info(f"Successfully fetched top {limit} tracks")
-            return results["items"]
+            self.logger.info("Successfully fetched top %d tracks", limit)
+            return items
         except SpotifyException as e:
-            self.logger.error(f"Error fetching top tracks: {str(e)}")
+            self.logger.error("Error fetching top tracks: %s", e)
             raise HTTPException(status_code=e.http_status, detail=str(e))
 
     async def get_top_artists(
-        self, limit: int = 20, time_range: str = "medium_term"
+        self, limit: int = 20, time_range: str = "medium_term", refresh: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Get user's top artists.
@@ -56,34 +411,234 @@ class SpotifyService:
                 - short_term: ~4 weeks
                 - medium_term: ~6 months
                 - long_term: calculated from several years of data
+            refresh: Bypass the response cache and refetch from Spotify
 
         Returns:
             List of artist objects
         """
         try:
-            results = self.client.current_user_top_artists(
-                limit=limit, time_range=time_range
+            items = await self._cached(
+                "top-artists",
+                {"limit": limit, "time_range": time_range},
+                lambda: self.client.current_user_top_artists(
+                    limit=limit, time_range=time_range
+                ),
+                CompactArtist,
+                get_settings().TOP_ITEMS_CACHE_TTL_SECONDS,
+                refresh,
+                self._max_ttl(time_range),
+            )
+            self.logger.info("Successfully fetched top %d artists", limit)
+            return items
+        except SpotifyException as e:
+            self.logger.error("Error fetching top artists: %s", e)
+            raise HTTPException(status_code=e.http_status, detail=str(e))
+
+    async def get_artists(self, artist_ids: Sequence[str]) -> List[Dict[str, Any]]:
+        """
+        Get artists by id, fetching uncached ones 50 per upstream request.
+
+        Each artist is cached under its own catalog key, so a batch reuses
+        whatever earlier batches, of any user, already fetched. While
+        Spotify is failing, expired entries are served as in ``_cached``.
+
+        Args:
+            artist_ids: Spotify artist ids
+
+        Returns:
+            List of artist objects, in the order of ``artist_ids``; ids
+            Spotify does not know are left out
+        """
+        cache = get_response_cache()
+        unique = list(dict.fromkeys(artist_ids))
+        keys = {i: self.catalog_key("artist", id=i) for i in unique}
+        cached = await asyncio.gather(*(read_through(cache, keys[i]) for i in unique))
+        found: Dict[str, Tuple[CompactItem, ...]] = {
+            i: records for i, records in zip(unique, cached) if records is not None
+        }
+        missing = [i for i in unique if i not in found]
+
+        async def fetch(chunk: Sequence[str]) -> Dict[str, Tuple[CompactItem, ...]]:
+            try:
+                response = await self._fetch(
+                    "artists", lambda: self.client.artists(chunk)
+                )
+            except (HTTPException, SpotifyException) as e:
+                if not is_upstream_failure(e):
+                    raise
+                stale = await asyncio.gather(
+                    *(read_through(cache, keys[i], stale=True) for i in chunk)
+                )
+                if any(records is None for records in stale):
+                    raise
+                self.logger.warning("Serving stale artists: Spotify unavailable")
+                return dict(zip(chunk, stale))
+            expires_at = time.time() + get_settings().CATALOG_CACHE_TTL_SECONDS
+            # Unknown ids are cached as empty, so they are not asked for again
+            fetched = {
+                i: (CompactArtist.from_api(artist),) if artist else ()
+                for i, artist in zip(chunk, response["artists"])
+            }
+            await asyncio.gather(
+                *(
+                    write_through(cache, keys[i], records, expires_at)
+                    for i, records in fetched.items()
+                )
+            )
+            return fetched
+
+        try:
+            for fetched in await asyncio.gather(
+                *(
+                    fetch(tuple(missing[i : i + ARTISTS_PER_REQUEST]))
+                    for i in range(0, len(missing), ARTISTS_PER_REQUEST)
+                )
+            ):
+                found.update(fetched)
+        except SpotifyException as e:
+            self.logger.error("Error fetching artists: %s", e)
+            raise HTTPException(status_code=e.http_status, detail=str(e))
+        return [record.to_api() for i in artist_ids for record in found.get(i, ())]
+
+    async def get_artist_top_tracks(self, artist_id: str) -> List[Dict[str, Any]]:
+        """
+        Get an artist's most popular tracks in the user's market.
+
+        Args:
+            artist_id: Spotify artist id
+
+        Returns:
+            Up to 10 track objects
+        """
+        market = self.market()
+        try:
+            return await self._cached(
+                "artist-top-tracks",
+                {"id": artist_id, "market": market},
+                lambda: {
+                    "items": self.client.artist_top_tracks(artist_id, country=market)[
+                        "tracks"
+                    ]
+                },
+                CompactTrack,
+                get_settings().CATALOG_CACHE_TTL_SECONDS,
+                False,
+                shared=True,
             )
-            self.logger.info(f"Successfully fetched top {limit} artists")
-            return results["items"]
         except SpotifyException as e:
-            self.logger.error(f"Error fetching top artists: {str(e)}")
+            self.logger.error("Error fetching artist top tracks: %s", e)
             raise HTTPException(status_code=e.http_status, detail=str(e))
 
-    async def get_recently_played(self, limit: int = 50) -> List[Dict[str, Any]]:
+    async def get_artist_albums(
+        self, artist_id: str, limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Get an artist's albums and singles, newest first.
+
+        Args:
+            artist_id: Spotify artist id
+            limit: Number of albums to return (max 50)
+
+        Returns:
+            List of simplified album objects
+        """
+        try:
+            return await self._cached(
+                "artist-albums",
+                {"id": artist_id, "limit": limit},
+                lambda: self.client.artist_albums(
+                    artist_id, include_groups="album,single", limit=limit
+                ),
+                CompactAlbum,
+                get_settings().CATALOG_CACHE_TTL_SECONDS,
+                False,
+                shared=True,
+            )
+        except SpotifyException as e:
+            self.logger.error("Error fetching artist albums: %s", e)
+            raise HTTPException(status_code=e.http_status, detail=str(e))
+
+    async def get_related_artists(self, artist_id: str) -> List[Dict[str, Any]]:
+        """
+        Get the artists Spotify considers similar to an artist.
+
+        Args:
+            artist_id: Spotify artist id
+
+        Returns:
+            Up to 20 artist objects
+        """
+        try:
+            return await self._cached(
+                "related-artists",
+                {"id": artist_id},
+                lambda: {
+                    "items": self.client.artist_related_artists(artist_id)["artists"]
+                },
+                CompactArtist,
+                get_settings().CATALOG_CACHE_TTL_SECONDS,
+                False,
+                shared=True,
+            )
+        except SpotifyException as e:
+            self.logger.error("Error fetching related artists: %s", e)
+            raise HTTPException(status_code=e.http_status, detail=str(e))
+
+    async def get_recently_played(
+        self, limit: int = 50, refresh: bool = False
+    ) -> List[Dict[str, Any]]:
         """
         Get user's recently played tracks.
 
         Args:
             limit: Number of tracks to return (max 50)
+            refresh: Bypass the response cache and refetch from Spotify
 
         Returns:
             List of recently played track objects
         """
         try:
-            results = self.client.current_user_recently_played(limit=limit)
-            self.logger.info(f"Successfully fetched {limit} recently played tracks")
+            items = await self._cached(
+                "recently-played",
+                {"limit": limit},
+                lambda: self.client.current_user_recently_played(limit=limit),
+                CompactPlay,
+                get_settings().RECENTLY_PLAYED_CACHE_TTL_SECONDS,
+                refresh,
+            )
+            self.logger.info("Successfully fetched %d recently played tracks", limit)
+        except SpotifyException as e:
+            self.logger.error("Error fetching recently played tracks: %s", e)
+            raise HTTPException(status_code=e.http_status, detail=str(e))
+        from app.services.search import record_plays
+
+        # Counted in the user's play history (see app.services.search)
+        profile = await self.last_known_profile()
+        if profile and profile.get("id"):
+            await record_plays(profile["id"], items)
+        return items
+
+    async def get_recently_played_after(
+        self, after: int, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Get tracks played after a cursor, bypassing the response cache.
+
+        Args:
+            after: Unix timestamp in milliseconds; only later plays are returned
+            limit: Number of tracks to return (max 50)
+
+        Returns:
+            List of recently played track objects, newest first
+        """
+        try:
+            results = await self._fetch(
+                "recently-played-after",
+                lambda: self.client.current_user_recently_played(
+                    limit=limit, after=after
+                ),
+            )
             return results["items"]
         except SpotifyException as e:
-            self.logger.error(f"Error fetching recently played tracks: {str(e)}")
+            self.logger.error("Error fetching recently played tracks: %s", e)
             raise HTTPException(status_code=e.http_status, detail=str(e))
@@ -0,0 +1,327 @@
+"""Genre and artist statistics computed from a user's top lists."""
+
+import asyncio
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.services.spotify import SpotifyService
+
+TIME_RANGES = ("short_term", "medium_term", "long_term")
+
+# A derived result, and the expiry of each top list it was computed from
+Memo = Tuple[Dict[str, Any], Tuple[Optional[float], ...]]
+
+
+@lru_cache()
+def get_stats_cache() -> TTLCache[Memo]:
+    """Return the cache of results derived from top lists, keyed per session."""
+    return TTLCache(maxsize=get_settings().RESPONSE_CACHE_SIZE)
+
+
+def rank_weights(count: int) -> np.ndarray:
+    """Return linearly decaying weights: rank 1 gets 1.0, rank ``count`` 1/count."""
+    return np.arange(count, 0, -1, dtype=np.float64) / max(count, 1)
+
+
+def genre_incidence(
+    artists: Sequence[Dict[str, Any]], vocabulary: Dict[str, int]
+) -> np.ndarray:
+    """Return an artists x genres 0/1 matrix over the shared ``vocabulary``."""
+    incidence = np.zeros((len(artists), len(vocabulary)), dtype=np.float64)
+    rows = [
+        row for row, artist in enumerate(artists) for _ in artist.get("genres") or ()
+    ]
+    cols = [vocabulary[g] for artist in artists for g in artist.get("genres") or ()]
+    incidence[rows, cols] = 1.0
+    return incidence
+
+
+def diversity(shares: np.ndarray) -> Dict[str, float]:
+    """
+    Return diversity and concentration indices of a share vector.
+
+    - entropy: Shannon entropy in nats
+    - effective_count: exp(entropy), the number of equally weighted
+      categories with the same entropy
+    - concentration: Herfindahl-Hirschman index, sum of squared shares
+    """
+    nonzero = shares[shares > 0]
+    entropy = float(-(nonzero * np.log(nonzero)).sum()) if nonzero.size else 0.0
+    return {
+        "entropy": round(entropy, 4),
+        "effective_count": round(float(np.exp(entropy)) if nonzero.size else 0.0, 2),
+        "concentration": round(float((shares**2).sum()), 4),
+    }
+
+
+def genre_stats(
+    artists: Sequence[Dict[str, Any]],
+    vocabulary: Dict[str, int],
+    genres: Sequence[str],
+    limit: int,
+) -> Dict[str, Any]:
+    """
+    Compute rank-weighted genre statistics for one top-artists list.
+
+    Args:
+        artists: Top artists, best first
+        vocabulary: Genre to column index, shared across time ranges
+        genres: Genre names in column order
+        limit: Number of genres and genre pairs to return
+    """
+    incidence = genre_incidence(artists, vocabulary)
+    weights = rank_weights(len(artists)) @ incidence
+    total = weights.sum()
+    shares = weights / total if total else weights
+
+    top = np.argsort(-weights, kind="stable")[:limit]
+    distribution = [
+        {
+            "genre": genres[i],
+            "weight": round(float(weights[i]), 4),
+            "share": round(float(shares[i]), 4),
+        }
+        for i in top
+        if weights[i] > 0
+    ]
+
+    # Genre pairs sharing an artist: upper triangle of the co-occurrence matrix
+    co_occurrence = incidence.T @ incidence
+    upper_rows, upper_cols = np.triu_indices(len(genres), k=1)
+    counts = co_occurrence[upper_rows, upper_cols]
+    pairs = np.argsort(-counts, kind="stable")[:limit]
+
+    return {
+        "artist_count": len(artists),
+        "genre_count": int((weights > 0).sum()),
+        "genres": distribution,
+        **diversity(shares),
+        "co_occurrence": [
+            {
+                "genres": [genres[upper_rows[p]], genres[upper_cols[p]]],
+                "count": int(counts[p]),
+            }
+            for p in pairs
+            if counts[p] > 0
+        ],
+    }
+
+
+def artist_stats(
+    artists: Sequence[Dict[str, Any]],
+    tracks: Sequence[Dict[str, Any]],
+    limit: int,
+) -> Dict[str, Any]:
+    """
+    Compute artist statistics for one time range.
+
+    Track credit is rank weighted and split evenly between a track's
+    artists, so the diversity indices measure how concentrated the user's
+    top tracks are on a few artists.
+
+    Args:
+        artists: Top artists, best first
+        tracks: Top tracks, best first
+        limit: Number of artists to return
+    """
+    ids: Dict[str, int] = {}
+    names: List[str] = []
+    rows: List[int] = []
+    credit: List[float] = []
+    for weight, track in zip(rank_weights(len(tracks)), tracks):
+        credited = track.get("artists") or ()
+        for artist in credited:
+            index = ids.setdefault(artist.get("id"), len(ids))
+            if index == len(names):
+                names.append(artist.get("name"))
+            rows.append(index)
+            credit.append(weight / len(credited))
+
+    weights = np.bincount(
+        np.asarray(rows, dtype=np.intp), weights=credit, minlength=len(ids)
+    )
+    total = weights.sum()
+    shares = weights / total if total else weights
+    id_list = list(ids)
+    top = np.argsort(-weights, kind="stable")[:limit]
+
+    genres_per_artist = [len(artist.get("genres") or ()) for artist in artists]
+    return {
+        "artist_count": len(artists),
+        "track_artist_count": len(ids),
+        "mean_genres_per_artist": round(
+            float(np.mean(genres_per_artist)) if genres_per_artist else 0.0, 2
+        ),
+        **diversity(shares),
+        "artists": [
+            {
+                "id": id_list[i],
+                "name": names[i],
+                "track_share": round(float(shares[i]), 4),
+            }
+            for i in top
+        ],
+    }
+
+
+async def _top_lists(
+    service: SpotifyService, time_ranges: Sequence[str], tracks: bool
+) -> Tuple[List[List[Dict[str, Any]]], List[List[Dict[str, Any]]]]:
+    """Fetch top artists (and optionally tracks) for each range concurrently."""
+    calls = [service.get_top_artists(limit=50, time_range=r) for r in time_ranges]
+    if tracks:
+        calls += [service.get_top_tracks(limit=50, time_range=r) for r in time_ranges]
+    results = await asyncio.gather(*calls)
+    return list(results[: len(time_ranges)]), list(results[len(time_ranges) :])
+
+
+async def memoised(
+    service: SpotifyService,
+    kind: str,
+    compute: Callable[[], Awaitable[Dict[str, Any]]],
+    inputs: Sequence[Tuple[str, str]],
+    **params: Any,
+) -> Dict[str, Any]:
+    """
+    Return ``compute()`` for the session and ``params``, computing it once.
+
+    ``inputs`` are the ``(endpoint, time_range)`` top-50 lists the result
+    is derived from. Their TTLs are learned per list, so one may be
+    refetched long before another; a result is reused only while every
+    input is still the cached response it was computed from, and never
+    past the first of them to expire.
+    """
+    cache = get_stats_cache()
+    key = service.cache_key(kind, **params)
+
+    def expiries() -> Tuple[Optional[float], ...]:
+        return tuple(
+            service.cache_expiry(endpoint, limit=50, time_range=time_range)
+            for endpoint, time_range in inputs
+        )
+
+    entry = cache.get(key)
+    if entry is not None and None not in entry[1] and entry[1] == expiries():
+        return entry[0]
+    result = await compute()
+    current = expiries()
+    ttl = get_settings().TOP_ITEMS_CACHE_TTL_SECONDS
+    expires_at = min([time.time() + ttl, *(e for e in current if e is not None)])
+    cache.set(key, (result, current), expires_at)
+    return result
+
+
+def combined_genre_stats(
+    artist_lists: Sequence[Sequence[Dict[str, Any]]],
+    vocabulary: Dict[str, int],
+    genres: Sequence[str],
+    limit: int,
+) -> Dict[str, Any]:
+    """Sum the rank-weighted genre vectors of several top-artist lists."""
+    weights = np.zeros(len(genres))
+    for artists in artist_lists:
+        weights += rank_weights(len(artists)) @ genre_incidence(artists, vocabulary)
+    total = weights.sum()
+    shares = weights / total if total else weights
+    top = np.argsort(-shares, kind="stable")[:limit]
+    return {
+        "genre_count": int((shares > 0).sum()),
+        "genres": [
+            {"genre": genres[i], "share": round(float(shares[i]), 4)}
+            for i in top
+            if shares[i] > 0
+        ],
+        **diversity(shares),
+    }
+
+
+async def get_genre_stats(
+    service: SpotifyService, time_range: Optional[str] = None, limit: int = 20
+) -> Dict[str, Any]:
+    """
+    Return genre statistics, memoised per session and time range.
+
+    Without ``time_range`` all three ranges are computed over one shared
+    genre vocabulary, plus a ``combined`` entry summing their rank-weighted
+    distributions.
+    """
+
+    time_ranges = [time_range] if time_range else TIME_RANGES
+
+    async def compute() -> Dict[str, Any]:
+        artist_lists, _ = await _top_lists(service, time_ranges, tracks=False)
+        genres = sorted(
+            {
+                genre
+                for artists in artist_lists
+                for artist in artists
+                for genre in artist.get("genres") or ()
+            }
+        )
+        vocabulary = {genre: i for i, genre in enumerate(genres)}
+        result: Dict[str, Any] = {
+            r: genre_stats(artists, vocabulary, genres, limit)
+            for r, artists in zip(time_ranges, artist_lists)
+        }
+        if len(time_ranges) > 1:
+            result["combined"] = combined_genre_stats(
+                artist_lists, vocabulary, genres, limit
+            )
+        return result
+
+    return await memoised(
+        service,
+        "stats-genres",
+        compute,
+        [("top-artists", r) for r in time_ranges],
+        time_range=time_range,
+        limit=limit,
+    )
+
+
+async def get_artist_stats(
+    service: SpotifyService, time_range: Optional[str] = None, limit: int = 20
+) -> Dict[str, Any]:
+    """
+    Return artist statistics, memoised per session and time range.
+
+    Without ``time_range`` all three ranges are computed, and
+    ``consistent_artists`` lists the top artists present in every range.
+    """
+
+    time_ranges = [time_range] if time_range else TIME_RANGES
+
+    async def compute() -> Dict[str, Any]:
+        artist_lists, track_lists = await _top_lists(service, time_ranges, tracks=True)
+        result: Dict[str, Any] = {
+            r: artist_stats(artists, tracks, limit)
+            for r, artists, tracks in zip(time_ranges, artist_lists, track_lists)
+        }
+        if len(time_ranges) > 1:
+            common = set.intersection(
+                *({a.get("id") for a in artists} for artists in artist_lists)
+            )
+            result["consistent_artists"] = [
+                {"id": a.get("id"), "name": a.get("name")}
+                for a in artist_lists[0]
+                if a.get("id") in common
+            ]
+        return result
+
+    return await memoised(
+        service,
+        "stats-artists",
+        compute,
+        [
+            (endpoint, r)
+            for endpoint in ("top-artists", "top-tracks")
+            for r in time_ranges
+        ],
+        time_range=time_range,
+        limit=limit,
+    )
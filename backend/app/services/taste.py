@@ -0,0 +1,297 @@
+"""
+Fixed-length taste vectors and a memory-mapped index for comparing users.
+
+A user's vector concatenates three blocks, each L2-normalised and scaled
+by its weight before the whole vector is normalised:
+
+- artists: top artists of every time range, rank weighted and feature
+  hashed (signed) into ``artist_buckets`` dimensions
+- genres: the same artists' genres, hashed into ``genre_buckets``
+- tracks: rank-weighted means of top-track attributes (popularity,
+  explicit share, duration, release year), centred on typical values
+
+Hashing keeps the length fixed however many artists and genres exist, so
+vectors of all users live in one float32 matrix. Vectors are unit length,
+so cosine similarity is a dot product and the most similar listeners are
+one matrix-vector product over the index.
+
+Vectors are built for every active user, but other users only ever see
+those who opted in to taste matching (``discoverable``).
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.spotify import SpotifyService
+from app.services.stats import TIME_RANGES, rank_weights
+
+logger = logging.getLogger(__name__)
+
+TRACK_FEATURES = ("popularity", "explicit", "duration", "release_year")
+
+# Relative weight of each block in the final vector
+ARTIST_WEIGHT = 1.0
+GENRE_WEIGHT = 1.0
+TRACK_WEIGHT = 0.25
+
+
+def _hash(value: str, buckets: int) -> Tuple[int, float]:
+    """Return a stable (bucket, sign) pair for ``value``."""
+    digest = zlib.crc32(value.encode())
+    return digest % buckets, 1.0 if (digest // buckets) & 1 else -1.0
+
+
+def _normalised(block: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(block)
+    return block / norm if norm else block
+
+
+def _release_year(track: Dict[str, Any]) -> Optional[int]:
+    release_date = (track.get("album") or {}).get("release_date") or ""
+    return int(release_date[:4]) if release_date[:4].isdigit() else None
+
+
+def track_features(tracks: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Return the rank-weighted, centred track attribute means."""
+    if not tracks:
+        return np.zeros(len(TRACK_FEATURES))
+    weights = rank_weights(len(tracks))
+    weights = weights / weights.sum()
+    years = [_release_year(track) for track in tracks]
+    values = np.array(
+        [
+            [(track.get("popularity") or 50) / 50 - 1 for track in tracks],
+            [1.0 if track.get("explicit") else -1.0 for track in tracks],
+            [(track.get("duration_ms") or 210000) / 210000 - 1 for track in tracks],
+            [(year - 2000) / 25 if year else 0.0 for year in years],
+        ]
+    )
+    return values @ weights
+
+
+def taste_vector(
+    artist_lists: Sequence[Sequence[Dict[str, Any]]],
+    track_lists: Sequence[Sequence[Dict[str, Any]]],
+    artist_buckets: int,
+    genre_buckets: int,
+) -> np.ndarray:
+    """
+    Build a unit-length taste vector from top-artist and top-track lists.
+
+    Args:
+        artist_lists: Top artists per time range, best first
+        track_lists: Top tracks per time range, best first
+        artist_buckets: Dimensions of the hashed artist block
+        genre_buckets: Dimensions of the hashed genre block
+    """
+    artists = np.zeros(artist_buckets)
+    genres = np.zeros(genre_buckets)
+    for artist_list in artist_lists:
+        for weight, artist in zip(rank_weights(len(artist_list)), artist_list):
+            if artist.get("id"):
+                bucket, sign = _hash(artist["id"], artist_buckets)
+                artists[bucket] += sign * weight
+            for genre in artist.get("genres") or ():
+                bucket, sign = _hash(genre, genre_buckets)
+                genres[bucket] += sign * weight
+
+    tracks = np.mean([track_features(t) for t in track_lists], axis=0)
+    vector = np.concatenate(
+        [
+            ARTIST_WEIGHT * _normalised(artists),
+            GENRE_WEIGHT * _normalised(genres),
+            TRACK_WEIGHT * _normalised(tracks),
+        ]
+    )
+    return _normalised(vector).astype(np.float32)
+
+
+class TasteIndex:
+    """
+    Memory-mapped matrix of taste vectors, one row per user.
+
+    Rows are stored in ``<path>.f32`` and the user id of each row in
+    ``<path>.ids`` (the first line records the vector length, so a changed
+    configuration starts a fresh index). The matrix grows by doubling.
+    Users who opted in to being matched are listed in
+    ``<path>.discoverable``.
+    """
+
+    def __init__(self, path: str, dim: int, initial_capacity: int = 1024):
+        self.dim = dim
+        self._matrix_path = f"{path}.f32"
+        self._ids_path = f"{path}.ids"
+        self._discoverable_path = f"{path}.discoverable"
+        self._lock = threading.Lock()
+        self._discoverable = self._load_discoverable()
+        self._ids: List[str] = self._load_ids()
+        self._rows = {user_id: row for row, user_id in enumerate(self._ids)}
+        row_bytes = dim * np.dtype(np.float32).itemsize
+        stored_rows = (
+            os.path.getsize(self._matrix_path) // row_bytes
+            if self._ids and os.path.exists(self._matrix_path)
+            else 0
+        )
+        if stored_rows < len(self._ids):
+            logger.warning("Taste index is incomplete, starting a fresh one")
+            self._ids, self._rows, stored_rows = [], {}, 0
+        if not self._ids:
+            with open(self._ids_path, "w") as f:
+                f.write(f"# dim {dim}\n")
+        self._matrix = self._open(
+            max(initial_capacity, stored_rows), fresh=not self._ids
+        )
+
+    def _load_ids(self) -> List[str]:
+        try:
+            with open(self._ids_path) as f:
+                header = f.readline().strip()
+                if header != f"# dim {self.dim}":
+                    return []
+                return f.read().split()
+        except FileNotFoundError:
+            return []
+
+    def _load_discoverable(self) -> Set[str]:
+        try:
+            with open(self._discoverable_path) as f:
+                return set(f.read().split())
+        except FileNotFoundError:
+            return set()
+
+    def set_discoverable(self, user_id: str, discoverable: bool) -> None:
+        """Opt ``user_id`` in to, or out of, being matched with other users."""
+        with self._lock:
+            if discoverable:
+                self._discoverable.add(user_id)
+            else:
+                self._discoverable.discard(user_id)
+            temporary = f"{self._discoverable_path}.tmp"
+            with open(temporary, "w") as f:
+                f.writelines(f"{i}\n" for i in sorted(self._discoverable))
+            os.replace(temporary, self._discoverable_path)
+
+    def is_discoverable(self, user_id: str) -> bool:
+        """Return whether ``user_id`` opted in to being matched."""
+        with self._lock:
+            return user_id in self._discoverable
+
+    def _open(self, capacity: int, fresh: bool = False) -> np.memmap:
+        if fresh or not os.path.exists(self._matrix_path):
+            open(self._matrix_path, "wb").close()
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        with open(self._matrix_path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        return np.memmap(
+            self._matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+        )
+
+    def upsert(self, user_id: str, vector: np.ndarray) -> None:
+        """Store or replace the vector of ``user_id``."""
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                row = len(self._ids)
+                if row == len(self._matrix):
+                    self._matrix.flush()
+                    self._matrix = self._open(2 * len(self._matrix))
+                self._ids.append(user_id)
+                self._rows[user_id] = row
+                with open(self._ids_path, "a") as f:
+                    f.write(f"{user_id}\n")
+            self._matrix[row] = vector
+
+    def get(self, user_id: str) -> Optional[np.ndarray]:
+        """Return a copy of the vector of ``user_id``, if indexed."""
+        with self._lock:
+            row = self._rows.get(user_id)
+            return None if row is None else np.array(self._matrix[row])
+
+    def similarity(self, first: str, second: str) -> Optional[float]:
+        """Return the cosine similarity of two indexed users."""
+        with self._lock:
+            rows = self._rows.get(first), self._rows.get(second)
+            if None in rows:
+                return None
+            return float(self._matrix[rows[0]] @ self._matrix[rows[1]])
+
+    def most_similar(
+        self,
+        vector: np.ndarray,
+        k: int,
+        exclude: Optional[str] = None,
+        discoverable_only: bool = False,
+    ) -> List[Tuple[str, float]]:
+        """Return up to ``k`` (user id, similarity) pairs, most similar first."""
+        with self._lock:
+            count = len(self._ids)
+            matrix = self._matrix[:count]
+            ids = list(self._ids)
+            hidden = np.zeros(count, dtype=bool)
+            if discoverable_only:
+                hidden[:] = True
+                hidden[
+                    [self._rows[u] for u in self._discoverable if u in self._rows]
+                ] = False
+            if exclude is not None and exclude in self._rows:
+                hidden[self._rows[exclude]] = True
+        scores = matrix @ vector
+        scores[hidden] = -np.inf
+        k = min(k, count - int(hidden.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(ids[row], float(scores[row])) for row in top]
+
+    def flush(self) -> None:
+        """Write pending vector updates to disk."""
+        with self._lock:
+            self._matrix.flush()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+@lru_cache()
+def get_taste_index() -> TasteIndex:
+    """Return the process-wide taste index."""
+    settings = get_settings()
+    dim = (
+        settings.TASTE_ARTIST_BUCKETS
+        + settings.TASTE_GENRE_BUCKETS
+        + len(TRACK_FEATURES)
+    )
+    return TasteIndex(settings.TASTE_INDEX_PATH, dim)
+
+
+async def update_taste_vector(service: SpotifyService, user_id: str) -> np.ndarray:
+    """
+    Rebuild and store the taste vector of ``user_id``.
+
+    The top lists come through the response cache, so after the dashboard
+    or the cache warmer has loaded them this makes no upstream calls.
+    """
+    settings = get_settings()
+    results = await asyncio.gather(
+        *(service.get_top_artists(limit=50, time_range=r) for r in TIME_RANGES),
+        *(service.get_top_tracks(limit=50, time_range=r) for r in TIME_RANGES),
+    )
+    vector = taste_vector(
+        results[: len(TIME_RANGES)],
+        results[len(TIME_RANGES) :],
+        settings.TASTE_ARTIST_BUCKETS,
+        settings.TASTE_GENRE_BUCKETS,
+    )
+    get_taste_index().upsert(user_id, vector)
+    return vector
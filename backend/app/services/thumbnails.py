@@ -0,0 +1,320 @@
+"""
+Resized artwork thumbnails served from a local disk cache.
+
+Spotify's ``images`` arrays offer a few variants per album or artist
+(typically 640, 300 and 64 px JPEGs) and the dashboard used to load the
+largest for every card. ``/spotify/*`` responses now carry a
+``thumbnail_url`` next to each ``images`` array, pointing at
+``/images/{image id}/{width}.{format}``. That endpoint fetches the
+smallest variant at least ``width`` wide from the Spotify CDN once,
+shrinks it to ``width`` in WebP or AVIF, stores it on disk and serves it
+with immutable caching headers.
+
+Only Spotify CDN images are proxied: the path carries the 40-hex image
+id, never an arbitrary URL. The id addresses the CDN image's content, so
+a thumbnail file, named after the id, width and format, never changes.
+Concurrent requests for a thumbnail that is not on disk yet share one
+fetch and resize.
+
+The directory is bounded by ``max_bytes``: past it, the least recently
+served thumbnails are deleted (recency starts from file modification
+times after a restart). Images the CDN does not have, or that cannot be
+decoded, are remembered for ``failure_ttl_seconds`` so repeated requests
+for them fail without going back to the CDN.
+"""
+
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.core.disk_cache import EVICT_TO
+from app.models.compact import SPOTIFY_IMAGE_PREFIX
+
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+
+def pick_variant(images: Sequence[Dict[str, Any]], width: int) -> Optional[str]:
+    """
+    Return the CDN image id of the smallest variant at least ``width`` wide.
+
+    Falls back to the largest variant when all are narrower. Returns None
+    when no variant is on the Spotify CDN.
+    """
+    candidates = [
+        (image.get("width") or 0, image["url"][len(SPOTIFY_IMAGE_PREFIX) :])
+        for image in images
+        if (image.get("url") or "").startswith(SPOTIFY_IMAGE_PREFIX)
+    ]
+    if not candidates:
+        return None
+    wide_enough = [c for c in candidates if c[0] >= width]
+    if wide_enough:
+        return min(wide_enough)[1]
+    return max(candidates)[1]
+
+
+def thumbnail_path(image_id: str, width: int, fmt: str) -> str:
+    """Return the API path of a thumbnail."""
+    return f"/images/{image_id}/{width}.{fmt}"
+
+
+def with_thumbnails(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Add ``thumbnail_url`` beside every ``images`` array in ``items``.
+
+    The URL is a path on this API, or None when there is no CDN image.
+    """
+    settings = get_settings()
+    width, fmt = settings.THUMBNAIL_WIDTH, settings.THUMBNAIL_FORMAT
+
+    def visit(value: Any) -> None:
+        if isinstance(value, dict):
+            images = value.get("images")
+            if isinstance(images, list):
+                image_id = pick_variant(images, width)
+                value["thumbnail_url"] = (
+                    thumbnail_path(image_id, width, fmt) if image_id else None
+                )
+            for child in value.values():
+                if isinstance(child, (dict, list)):
+                    visit(child)
+        elif isinstance(value, list):
+            for child in value:
+                visit(child)
+
+    visit(items)
+    return items
+
+
+def render_thumbnail(source: bytes, width: int, fmt: str, quality: int) -> bytes:
+    """Shrink an image to ``width`` (never enlarging it) and encode it."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(source)) as image:
+        image.draft("RGB", (width, width))
+        image = image.convert("RGB")
+        # Bounded by width only; thumbnail() keeps the aspect ratio
+        image.thumbnail((width, image.height))
+        output = io.BytesIO()
+        image.save(output, format=fmt.upper(), quality=quality)
+    return output.getvalue()
+
+
+class ThumbnailService:
+    """Fetches, resizes and stores artwork thumbnails."""
+
+    def __init__(
+        self,
+        directory: str,
+        origin: str,
+        quality: int,
+        max_source_bytes: int,
+        timeout_seconds: float,
+        max_bytes: int,
+        failure_ttl_seconds: float,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.directory = directory
+        self.origin = origin
+        self.quality = quality
+        self.max_source_bytes = max_source_bytes
+        self.timeout_seconds = timeout_seconds
+        self.transport = transport
+        self.max_bytes = max_bytes
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.fetches = 0
+        # Stored thumbnails and their sizes, least recently served first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._scanned = False
+        self._files_lock = threading.Lock()
+        self._failures: TTLCache[Tuple[int, str]] = TTLCache(maxsize=4096)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._pending: Dict[str, "asyncio.Future[bytes]"] = {}
+
+    def file_path(self, image_id: str, width: int, fmt: str) -> str:
+        """Return where a thumbnail is stored."""
+        return os.path.join(self.directory, image_id[:2], f"{image_id}-{width}.{fmt}")
+
+    def _client(self) -> httpx.AsyncClient:
+        """Return the pooled HTTP client of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout_seconds, transport=self.transport
+            )
+            self._loop = loop
+            self._pending = {}
+        return self._http
+
+    async def get(self, image_id: str, width: int, fmt: str) -> bytes:
+        """
+        Return the encoded thumbnail, creating its file on first request.
+
+        The stored file is read in one go, so one deleted by a concurrent
+        eviction is simply created again rather than failing mid-response.
+
+        Raises:
+            HTTPException: 404 when the CDN has no such image, 502 when it
+                could not be fetched or decoded
+        """
+        path = self.file_path(image_id, width, fmt)
+        body = await asyncio.to_thread(self._use, path)
+        if body is not None:
+            return body
+        failure = self._failures.get(image_id)
+        if failure is not None:
+            raise HTTPException(status_code=failure[0], detail=failure[1])
+        # Binds per-loop state (HTTP client, work in progress) to this loop
+        self._client()
+        pending = self._pending.get(path)
+        if pending is None:
+            pending = asyncio.ensure_future(self._create(image_id, width, fmt, path))
+            self._pending[path] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(path, None))
+        return await asyncio.shield(pending)
+
+    async def _create(self, image_id: str, width: int, fmt: str, path: str) -> bytes:
+        source = await self._fetch(image_id)
+        try:
+            body = await asyncio.to_thread(
+                render_thumbnail, source, width, fmt, self.quality
+            )
+        except Exception as e:
+            raise self._failed(image_id, 502, f"Unreadable image: {str(e)}")
+        await asyncio.to_thread(self._write, path, body)
+        return body
+
+    def _failed(self, image_id: str, status_code: int, detail: str) -> HTTPException:
+        """Remember that ``image_id`` cannot be served, and return the error."""
+        self._failures.set(
+            image_id, (status_code, detail), time.time() + self.failure_ttl_seconds
+        )
+        return HTTPException(status_code=status_code, detail=detail)
+
+    async def _fetch(self, image_id: str) -> bytes:
+        self.fetches += 1
+        try:
+            async with self._client().stream("GET", self.origin + image_id) as response:
+                if response.status_code == 404:
+                    raise self._failed(image_id, 404, "Image not found")
+                if response.status_code != 200:
+                    raise HTTPException(
+                        status_code=502,
+                        detail=f"Image origin returned HTTP {response.status_code}",
+                    )
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_source_bytes:
+                        raise self._failed(image_id, 502, "Image too large")
+                    chunks.append(chunk)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"Image fetch failed: {str(e)}")
+        return b"".join(chunks)
+
+    def _write(self, path: str, body: bytes) -> None:
+        """Write ``body`` to ``path`` atomically."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        with self._files_lock:
+            self._scan()
+            self._track(path, len(body))
+            doomed = self._evict()
+        for old in doomed:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def _use(self, path: str) -> Optional[bytes]:
+        """Mark a thumbnail as just served; return it, or None if not on disk."""
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+        except OSError:
+            with self._files_lock:
+                self._size -= self._files.pop(path, 0)
+            return None
+        with self._files_lock:
+            self._scan()
+            self._track(path, len(body))
+        return body
+
+    def _scan(self) -> None:
+        """Index the thumbnails already on disk, oldest first, once."""
+        if self._scanned:
+            return
+        found = []
+        for directory, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                found.append(
+                    (stat.st_mtime, os.path.join(directory, name), stat.st_size)
+                )
+        for _, path, size in sorted(found):
+            self._track(path, size)
+        self._scanned = True
+
+    def _track(self, path: str, size: int) -> None:
+        self._size += size - self._files.pop(path, 0)
+        self._files[path] = size
+
+    def _evict(self) -> List[str]:
+        """Drop the least recently served thumbnails past ``max_bytes``."""
+        doomed: List[str] = []
+        if self._size <= self.max_bytes:
+            return doomed
+        target = self.max_bytes * EVICT_TO
+        # The newest thumbnail stays, even if it alone is over the target
+        while self._size > target and len(self._files) > 1:
+            path, size = self._files.popitem(last=False)
+            self._size -= size
+            doomed.append(path)
+        return doomed
+
+    @property
+    def size(self) -> int:
+        """Total bytes of the thumbnails known to be stored."""
+        return self._size
+
+
+@lru_cache()
+def get_thumbnail_service() -> ThumbnailService:
+    """Return the process-wide thumbnail service."""
+    settings = get_settings()
+    return ThumbnailService(
+        directory=settings.THUMBNAIL_DIR,
+        origin=settings.THUMBNAIL_ORIGIN,
+        quality=settings.THUMBNAIL_QUALITY,
+        max_source_bytes=settings.THUMBNAIL_MAX_SOURCE_BYTES,
+        timeout_seconds=settings.SPOTIFY_REQUEST_TIMEOUT_SECONDS,
+        max_bytes=settings.THUMBNAIL_MAX_BYTES,
+        failure_ttl_seconds=settings.THUMBNAIL_FAILURE_TTL_SECONDS,
+    )
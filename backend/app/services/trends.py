@@ -0,0 +1,96 @@
+"""Rank movement of top tracks and artists between time ranges."""
+
+import asyncio
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.services.spotify import SpotifyService
+from app.services.stats import TIME_RANGES, memoised
+
+# (baseline, recent) pairs, oldest window first
+COMPARISONS: Tuple[Tuple[str, str], ...] = (
+    ("medium_term", "short_term"),
+    ("long_term", "medium_term"),
+    ("long_term", "short_term"),
+)
+
+KINDS = ("tracks", "artists")
+
+
+def rank_delta(
+    baseline: Sequence[Dict[str, Any]], recent: Sequence[Dict[str, Any]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Compare two ranked lists by id in O(n).
+
+    Ranks are 1-based; ``delta`` is ``previous_rank - rank``, so positive
+    values are rising.
+
+    Returns:
+        ``rising`` and ``falling`` items present in both lists (largest
+        moves first), ``new`` items only in ``recent`` and ``dropped`` items
+        only in ``baseline``
+    """
+    baseline_ranks = {item.get("id"): rank for rank, item in enumerate(baseline, 1)}
+    recent_ids = set()
+    rising: List[Dict[str, Any]] = []
+    falling: List[Dict[str, Any]] = []
+    new: List[Dict[str, Any]] = []
+
+    for rank, item in enumerate(recent, 1):
+        item_id = item.get("id")
+        recent_ids.add(item_id)
+        previous = baseline_ranks.get(item_id)
+        if previous is None:
+            new.append({"id": item_id, "name": item.get("name"), "rank": rank})
+        elif previous != rank:
+            entry = {
+                "id": item_id,
+                "name": item.get("name"),
+                "rank": rank,
+                "previous_rank": previous,
+                "delta": previous - rank,
+            }
+            (rising if previous > rank else falling).append(entry)
+
+    dropped = [
+        {"id": item.get("id"), "name": item.get("name"), "previous_rank": rank}
+        for rank, item in enumerate(baseline, 1)
+        if item.get("id") not in recent_ids
+    ]
+    rising.sort(key=lambda entry: -entry["delta"])
+    falling.sort(key=lambda entry: entry["delta"])
+    return {"rising": rising, "falling": falling, "new": new, "dropped": dropped}
+
+
+async def get_trends(
+    service: SpotifyService, kinds: Sequence[str] = KINDS
+) -> Dict[str, Any]:
+    """
+    Return rank movement between time ranges, memoised per session.
+
+    The underlying top-50 lists are fetched concurrently through the
+    response cache, so they are shared with the dashboard.
+    """
+
+    async def compute() -> Dict[str, Any]:
+        fetchers = {
+            "tracks": service.get_top_tracks,
+            "artists": service.get_top_artists,
+        }
+        requests = [(kind, r) for kind in kinds for r in TIME_RANGES]
+        results = await asyncio.gather(
+            *(fetchers[kind](limit=50, time_range=r) for kind, r in requests)
+        )
+        lists = dict(zip(requests, results))
+        return {
+            kind: {
+                f"{baseline}_to_{recent}": rank_delta(
+                    lists[(kind, baseline)], lists[(kind, recent)]
+                )
+                for baseline, recent in COMPARISONS
+            }
+            for kind in kinds
+        }
+
+    inputs = [(f"top-{kind}", r) for kind in kinds for r in TIME_RANGES]
+    return await memoised(service, "trends", compute, inputs, kinds=tuple(kinds))
@@ -0,0 +1,179 @@
+"""Background refresh of cached dashboard data for recently active users."""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.services.activity import ActiveUser, ActivityTracker, get_activity_tracker
+from app.services.spotify import SpotifyService, get_rate_limiter
+from app.services.taste import update_taste_vector
+
+logger = logging.getLogger(__name__)
+
+# Requests the dashboard makes on load: (service method, cache endpoint, params)
+DASHBOARD_REQUESTS: List[Tuple[str, str, Dict[str, Any]]] = [
+    *(
+        (method, endpoint, {"limit": 50, "time_range": time_range})
+        for method, endpoint in (
+            ("get_top_tracks", "top-tracks"),
+            ("get_top_artists", "top-artists"),
+        )
+        for time_range in ("short_term", "medium_term", "long_term")
+    ),
+    ("get_recently_played", "recently-played", {"limit": 50}),
+]
+
+# Longest multiple of the interval the warmer backs off to
+MAX_BACKOFF = 8
+
+
+class CacheWarmer:
+    """
+    Periodically refreshes cached responses before they expire.
+
+    Each cycle collects the dashboard entries of recently active users that
+    are missing or expire within ``lead_seconds``, ordered by the users' last
+    activity, and refreshes them under a global concurrency budget. Refreshes
+    are skipped while the upstream rate limiter is above ``max_pressure``,
+    and the cycle interval doubles (up to ``MAX_BACKOFF`` times) until a cycle
+    completes without skipping. Users whose top lists were refreshed get
+    their taste vector rebuilt from the fresh lists.
+    """
+
+    def __init__(
+        self,
+        tracker: ActivityTracker,
+        interval_seconds: float,
+        lead_seconds: float,
+        concurrency: int,
+        active_window_seconds: float,
+        max_pressure: float,
+    ):
+        self.tracker = tracker
+        self.interval_seconds = interval_seconds
+        self.lead_seconds = lead_seconds
+        self.concurrency = concurrency
+        self.active_window_seconds = active_window_seconds
+        self.max_pressure = max_pressure
+        self.backoff = 1
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def due(
+        self, user: ActiveUser, now: float
+    ) -> List[Tuple[SpotifyService, str, Dict[str, Any]]]:
+        """Return the dashboard requests of ``user`` that need refreshing."""
+        service = SpotifyService(user.access_token)
+        jobs = []
+        for method, endpoint, params in DASHBOARD_REQUESTS:
+            expires_at = service.cache_expiry(endpoint, **params)
+            if expires_at is None or expires_at - now <= self.lead_seconds:
+                jobs.append((service, method, params))
+        return jobs
+
+    async def run_once(self) -> Dict[str, int]:
+        """Run one warming cycle and return refreshed/skipped/failed counts."""
+        now = time.time()
+        users = self.tracker.active(since=now - self.active_window_seconds)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = get_rate_limiter()
+        counts = {"refreshed": 0, "skipped": 0, "failed": 0}
+        # Users whose top lists changed this cycle, for taste vector updates
+        top_refreshed: Dict[str, SpotifyService] = {}
+
+        async def refresh(
+            user: ActiveUser,
+            service: SpotifyService,
+            method: str,
+            params: Dict[str, Any],
+        ) -> None:
+            async with semaphore:
+                if limiter.pressure > self.max_pressure:
+                    counts["skipped"] += 1
+                    return
+                try:
+                    await getattr(service, method)(refresh=True, **params)
+                    counts["refreshed"] += 1
+                    if method != "get_recently_played":
+                        top_refreshed[user.user_id] = service
+                except HTTPException as e:
+                    counts["failed"] += 1
+                    if e.status_code == 401:
+                        # The session's token has expired; stop warming it
+                        self.tracker.forget(user.user_id)
+
+        # Semaphore waiters are served in FIFO order, so creating the tasks
+        # most-recently-active user first gives those users priority.
+        await asyncio.gather(
+            *(
+                refresh(user, service, method, params)
+                for user in users
+                for service, method, params in self.due(user, now)
+            )
+        )
+
+        async def update_taste(user_id: str, service: SpotifyService) -> None:
+            # Served from the lists just cached, but counted like a refresh
+            async with semaphore:
+                if limiter.pressure > self.max_pressure:
+                    counts["skipped"] += 1
+                    return
+                try:
+                    await update_taste_vector(service, user_id)
+                except HTTPException as e:
+                    logger.debug("Taste vector update failed: %s", e.detail)
+
+        await asyncio.gather(
+            *(
+                update_taste(user_id, service)
+                for user_id, service in top_refreshed.items()
+                if user_id in self.tracker
+            )
+        )
+
+        if counts["skipped"]:
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+        else:
+            self.backoff = 1
+        return counts
+
+    async def run(self) -> None:
+        """Run warming cycles until cancelled."""
+        while True:
+            try:
+                counts = await self.run_once()
+                logger.debug("Cache warmer cycle: %s", counts)
+            except Exception as e:
+                logger.error("Cache warmer cycle failed: %s", e)
+            await asyncio.sleep(self.interval_seconds * self.backoff)
+
+    def start(self) -> None:
+        """Start the warming loop on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the warming loop and wait for it to finish."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def create_cache_warmer() -> CacheWarmer:
+    """Create a cache warmer configured from application settings."""
+    settings = get_settings()
+    return CacheWarmer(
+        tracker=get_activity_tracker(),
+        interval_seconds=settings.CACHE_WARMER_INTERVAL_SECONDS,
+        lead_seconds=settings.CACHE_WARMER_LEAD_SECONDS,
+        concurrency=settings.CACHE_WARMER_CONCURRENCY,
+        active_window_seconds=settings.CACHE_WARMER_ACTIVE_WINDOW_SECONDS,
+        max_pressure=settings.CACHE_WARMER_MAX_PRESSURE,
+    )
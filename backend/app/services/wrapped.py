@@ -0,0 +1,406 @@
+"""
+Yearly "Wrapped" summaries, precomputed from the snapshot history.
+
+``WrappedJob`` walks every user in the snapshot store in batches. For each
+batch it replays the year's daily short-term top lists from SQLite, on
+the days each user was actually captured, fetches the genres of the
+artists involved through ``SpotifyService`` (async, under the shared rate
+limit and response cache, each artist once per run), and computes the
+summaries in a process pool so the numpy work scales across cores. The
+next batch is loaded while the pool computes the current one.
+
+Summaries are written to the disk cache, where the API serves them from.
+Finished users are appended to a checkpoint file after every batch, so an
+interrupted run resumes where it stopped; users whose summary failed are
+not checkpointed and are retried on the next run. So are the users of a
+batch whose genre lookup failed; the run goes on with the next batch.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+from fastapi import HTTPException
+from spotipy.exceptions import SpotifyException
+
+from app.core.disk_cache import DiskCache
+from app.services.history import KINDS, SnapshotStore
+from app.services.oauth import OAuthError
+from app.services.spotify import SpotifyService
+from app.services.stats import diversity, rank_weights
+
+logger = logging.getLogger(__name__)
+
+# Daily lists summarized; short_term (~4 weeks) follows listening most closely
+WRAPPED_TIME_RANGE = "short_term"
+WRAPPED_TTL_SECONDS = 400 * 86400
+TOP_COUNT = 5
+# App tokens are renewed this long before they expire
+APP_TOKEN_MARGIN_SECONDS = 300
+
+
+def wrapped_key(user_id: str, year: int) -> Tuple[Hashable, ...]:
+    """Return the disk cache key of a user's summary for ``year``."""
+    return ("wrapped", user_id, year)
+
+
+def load_history(
+    store: SnapshotStore, user_id: str, year: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Return the daily lists of ``user_id`` for ``year``, as plain picklable data.
+
+    The year is read up to today, and only days the user was captured on
+    are included. Returns None when nothing was recorded.
+    """
+    start = date(year, 1, 1)
+    end = min(date(year, 12, 31), date.today())
+    if end < start:
+        return None
+    captured = store.captured_days(user_id, start, end)
+    if not captured:
+        return None
+    offsets = [(day - start).days for day in captured]
+    days = {}
+    for kind in KINDS:
+        daily = store.daily_ids(user_id, kind, WRAPPED_TIME_RANGE, start, end)
+        days[kind] = [daily[offset] for offset in offsets]
+    ids = {idx for kind in KINDS for listed in days[kind] for idx in listed}
+    if not ids:
+        return None
+    return {
+        "user_id": user_id,
+        "year": year,
+        "days": [day.isoformat() for day in captured],
+        **days,
+        "names": store.item_names(sorted(ids)),
+        "genres": {},
+    }
+
+
+def _ranked(
+    days: Sequence[Sequence[int]],
+) -> Tuple[List[int], np.ndarray, np.ndarray]:
+    """Return the items listed, and days x items rank and weight matrices."""
+    items = sorted({idx for listed in days for idx in listed})
+    column = {idx: c for c, idx in enumerate(items)}
+    ranks = np.zeros((len(days), len(items)), dtype=np.int16)
+    weights = np.zeros((len(days), len(items)), dtype=np.float64)
+    previous = None
+    for row, listed in enumerate(days):
+        # Unchanged days share one list object (kept through pickling)
+        if listed is previous:
+            ranks[row] = ranks[row - 1]
+            weights[row] = weights[row - 1]
+        elif listed:
+            cols = [column[idx] for idx in listed]
+            ranks[row, cols] = np.arange(1, len(listed) + 1)
+            weights[row, cols] = rank_weights(len(listed))
+        previous = listed
+    return items, ranks, weights
+
+
+def _kind_summary(
+    days: Sequence[Sequence[int]],
+    months: np.ndarray,
+    year: int,
+    names: Dict[int, Tuple[str, Optional[str]]],
+) -> Tuple[Dict[str, Any], List[int], np.ndarray]:
+    """Summarize one kind's daily lists; also return its items and scores."""
+    items, ranks, weights = _ranked(days)
+    scores = weights.sum(axis=0)
+    listed = ranks > 0
+    best = np.where(listed, ranks, np.iinfo(np.int16).max).min(axis=0)
+    total = scores.sum()
+
+    def item(c: int) -> Dict[str, Any]:
+        spotify_id, name = names[items[c]]
+        return {"id": spotify_id, "name": name}
+
+    top = [
+        {
+            **item(c),
+            "share": round(float(scores[c] / total), 4),
+            "days_listed": int(listed[:, c].sum()),
+            "days_at_number_one": int((ranks[:, c] == 1).sum()),
+            "best_rank": int(best[c]),
+        }
+        for c in np.argsort(-scores, kind="stable")[:TOP_COUNT]
+    ]
+
+    by_month = []
+    for month in range(1, 13):
+        monthly = weights[months == month].sum(axis=0)
+        if monthly.any():
+            by_month.append(
+                {
+                    "month": f"{year}-{month:02d}",
+                    **item(int(np.argmax(monthly))),
+                }
+            )
+
+    summary = {"distinct": len(items), "top": top, "by_month": by_month}
+    return summary, items, scores
+
+
+def summarize_year(history: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute a user's yearly summary from ``load_history`` output.
+
+    Items are scored by summing their rank weights over every captured
+    day. Runs in a worker process, so it only touches its argument.
+
+    Returns:
+        ``days_recorded`` (days captured), and for ``tracks`` and
+        ``artists``: the number of ``distinct`` items, the ``top`` items
+        (share of the year's score, days listed, days at number one, best
+        rank) and the item of each month. ``artists`` also has the top
+        ``genres`` with their share and diversity indices.
+    """
+    year = history["year"]
+    names = history["names"]
+    months = np.array([date.fromisoformat(day).month for day in history["days"]])
+    result: Dict[str, Any] = {
+        "user_id": history["user_id"],
+        "year": year,
+        "generated_at": time.time(),
+        "days_recorded": len(history["days"]),
+    }
+    scored = {}
+    for kind in KINDS:
+        result[kind], *scored[kind] = _kind_summary(history[kind], months, year, names)
+
+    items, scores = scored["artists"]
+    genres = sorted({g for idx in items for g in history["genres"].get(idx, ())})
+    if genres:
+        vocabulary = {genre: i for i, genre in enumerate(genres)}
+        incidence = np.zeros((len(items), len(genres)))
+        for row, idx in enumerate(items):
+            for genre in history["genres"].get(idx, ()):
+                incidence[row, vocabulary[genre]] = 1.0
+        weights = scores @ incidence
+        shares = weights / weights.sum()
+        result["artists"]["genres"] = [
+            {"genre": genres[i], "share": round(float(shares[i]), 4)}
+            for i in np.argsort(-shares, kind="stable")[:TOP_COUNT]
+        ]
+        result["artists"].update(diversity(shares))
+    return result
+
+
+class WrappedJob:
+    """Batch job computing every user's summary for one year."""
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        disk: DiskCache,
+        year: int,
+        checkpoint_path: str,
+        workers: int,
+        batch_size: int,
+        app_token: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None,
+    ):
+        """
+        Args:
+            store: Snapshot history to read
+            disk: Cache the summaries are written to
+            year: Year to summarize
+            checkpoint_path: File listing users already done
+            workers: Number of worker processes
+            batch_size: Users loaded and summarized together
+            app_token: Returns a new client-credentials token response,
+                used to look up artist genres; genres are left out without
+                one
+        """
+        self.store = store
+        self.disk = disk
+        self.year = year
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.app_token = app_token
+        self._catalog: Optional[SpotifyService] = None
+        self._catalog_expires_at = 0.0
+        self._genres: Dict[str, List[str]] = {}
+
+    def read_checkpoint(self) -> Set[str]:
+        """Return the users finished by earlier runs."""
+        if not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def write_checkpoint(self, user_ids: Sequence[str]) -> None:
+        """Durably record that ``user_ids`` are finished."""
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{user_id}\n" for user_id in user_ids)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def catalog(self, renew: bool = False) -> SpotifyService:
+        """Return a service on a current app token, getting a new one if needed."""
+        assert self.app_token is not None
+        if renew or self._catalog is None or time.time() >= self._catalog_expires_at:
+            token_info = await self.app_token()
+            self._catalog = SpotifyService(token_info["access_token"])
+            self._catalog_expires_at = (
+                time.time()
+                + token_info.get("expires_in", 3600)
+                - APP_TOKEN_MARGIN_SECONDS
+            )
+        return self._catalog
+
+    async def add_genres(self, histories: Sequence[Dict[str, Any]]) -> None:
+        """
+        Attach artist genres to ``histories``, fetching unseen artists.
+
+        Raises:
+            HTTPException, SpotifyException: The lookup failed, even after
+                renewing a rejected app token
+            OAuthError: No app token could be obtained
+        """
+        if self.app_token is None:
+            return
+        artists = {
+            idx: history["names"][idx][0]
+            for history in histories
+            for listed in history["artists"]
+            for idx in listed
+        }
+        missing = sorted(set(artists.values()) - self._genres.keys())
+        if missing:
+            try:
+                found = await (await self.catalog()).get_artists(missing)
+            except (HTTPException, SpotifyException) as e:
+                status = getattr(e, "status_code", getattr(e, "http_status", None))
+                if status != 401:
+                    raise
+                found = await (await self.catalog(renew=True)).get_artists(missing)
+            for artist in found:
+                self._genres[artist["id"]] = artist.get("genres") or []
+        for history in histories:
+            history["genres"] = {
+                idx: self._genres.get(artists[idx], [])
+                for listed in history["artists"]
+                for idx in listed
+            }
+
+    async def load_batch(
+        self, user_ids: Sequence[str]
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Load and enrich the histories of one batch of users.
+
+        Returns:
+            The histories to summarize, and the users with history whose
+            genres could not be looked up
+        """
+        histories = await asyncio.gather(
+            *(
+                asyncio.to_thread(load_history, self.store, user_id, self.year)
+                for user_id in user_ids
+            )
+        )
+        ready = [history for history in histories if history is not None]
+        try:
+            await self.add_genres(ready)
+        except (HTTPException, SpotifyException, OAuthError) as e:
+            logger.error("Genre lookup failed for %d users: %s", len(ready), e)
+            return [], [history["user_id"] for history in ready]
+        return ready, []
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Summarize every user not in the checkpoint.
+
+        Returns:
+            Counts of users (``summarized``, ``empty`` without history in
+            the year, ``failed``, ``skipped`` from the checkpoint), the
+            elapsed ``seconds`` and ``users_per_second``
+        """
+        users = await asyncio.to_thread(self.store.users)
+        done = await asyncio.to_thread(self.read_checkpoint)
+        pending = [user_id for user_id in users if user_id not in done]
+        batches = [
+            pending[i : i + self.batch_size]
+            for i in range(0, len(pending), self.batch_size)
+        ]
+        counts: Dict[str, Any] = {
+            "summarized": 0,
+            "empty": 0,
+            "failed": 0,
+            "skipped": len(users) - len(pending),
+        }
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        # Fresh interpreters rather than forks of a process running threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            loading = (
+                asyncio.create_task(self.load_batch(batches[0])) if batches else None
+            )
+            for position, batch in enumerate(batches):
+                assert loading is not None
+                histories, lookup_failed = await loading
+                if position + 1 < len(batches):
+                    loading = asyncio.create_task(
+                        self.load_batch(batches[position + 1])
+                    )
+                results = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(pool, summarize_year, history)
+                        for history in histories
+                    ),
+                    return_exceptions=True,
+                )
+                failed = set(lookup_failed)
+                for history, result in zip(histories, results):
+                    user_id = history["user_id"]
+                    if isinstance(result, BaseException):
+                        logger.error("Summary failed for %s: %s", user_id, result)
+                        failed.add(user_id)
+                        continue
+                    await asyncio.to_thread(
+                        self.disk.set,
+                        wrapped_key(user_id, self.year),
+                        result,
+                        time.time() + WRAPPED_TTL_SECONDS,
+                    )
+                counts["summarized"] += (
+                    len(histories) - len(failed) + len(lookup_failed)
+                )
+                counts["empty"] += len(batch) - len(histories) - len(lookup_failed)
+                counts["failed"] += len(failed)
+                await asyncio.to_thread(
+                    self.write_checkpoint, [u for u in batch if u not in failed]
+                )
+                logger.info(
+                    "Wrapped %d: %d/%d",
+                    self.year,
+                    sum(len(b) for b in batches[: position + 1]),
+                    len(pending),
+                )
+
+        elapsed = time.perf_counter() - started
+        processed = len(pending)
+        counts["seconds"] = round(elapsed, 3)
+        counts["users_per_second"] = round(processed / elapsed, 2) if elapsed else 0.0
+        return counts
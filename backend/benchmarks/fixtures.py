@@ -0,0 +1,97 @@
+"""Synthetic Spotify API objects shaped like real responses."""
+
+import random
+from typing import Any, Dict, List
+
+MARKETS = [
+    "".join(pair)
+    for pair in zip("ABCDEFGHIJKLMNOPQRSTUVWXYZ" * 7, "ZYXWVUTSRQPONM" * 13)
+][:180]
+
+GENRES = [
+    "pop",
+    "rock",
+    "indie rock",
+    "art pop",
+    "alternative rock",
+    "hip hop",
+    "rap",
+    "electronic",
+    "house",
+    "techno",
+    "jazz",
+    "soul",
+    "r&b",
+    "folk",
+    "metal",
+]
+
+
+def _id(rng: random.Random) -> str:
+    alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    return "".join(rng.choice(alphabet) for _ in range(22))
+
+
+def _images(rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "url": "https://i.scdn.co/image/" + "%040x" % rng.getrandbits(160),
+            "width": size,
+            "height": size,
+        }
+        for size in (640, 300, 64)
+    ]
+
+
+def _links(kind: str, item_id: str) -> Dict[str, Any]:
+    return {
+        "id": item_id,
+        "type": kind,
+        "uri": f"spotify:{kind}:{item_id}",
+        "href": f"https://api.spotify.com/v1/{kind}s/{item_id}",
+        "external_urls": {"spotify": f"https://open.spotify.com/{kind}/{item_id}"},
+    }
+
+
+def make_artist(rng: random.Random, full: bool = True) -> Dict[str, Any]:
+    """Return an artist object; ``full`` adds the top-artists-only fields."""
+    artist = {**_links("artist", _id(rng)), "name": f"Artist {rng.randrange(10**6)}"}
+    if full:
+        artist.update(
+            genres=rng.sample(GENRES, 3),
+            images=_images(rng),
+            popularity=rng.randrange(100),
+            followers={"href": None, "total": rng.randrange(10**7)},
+        )
+    return artist
+
+
+def make_track(rng: random.Random) -> Dict[str, Any]:
+    """Return a track object as found in top tracks and recently played."""
+    artists = [make_artist(rng, full=False) for _ in range(rng.randint(1, 3))]
+    album = {
+        **_links("album", _id(rng)),
+        "name": f"Album {rng.randrange(10**6)}",
+        "album_type": "album",
+        "artists": artists[:1],
+        "available_markets": list(MARKETS),
+        "images": _images(rng),
+        "release_date": "2019-05-17",
+        "release_date_precision": "day",
+        "total_tracks": rng.randint(1, 20),
+    }
+    return {
+        **_links("track", _id(rng)),
+        "name": f"Track {rng.randrange(10**6)}",
+        "artists": artists,
+        "album": album,
+        "available_markets": list(MARKETS),
+        "disc_number": 1,
+        "duration_ms": rng.randint(120000, 360000),
+        "explicit": rng.random() < 0.2,
+        "external_ids": {"isrc": "USRC1" + "%07d" % rng.randrange(10**7)},
+        "is_local": False,
+        "popularity": rng.randrange(100),
+        "preview_url": None,
+        "track_number": rng.randint(1, 12),
+    }
@@ -0,0 +1,128 @@
+"""
+Login burst load test for the SpotifEye OAuth flow.
+
+Fires ``--logins`` concurrent ``/login`` -> ``/callback`` flows at the app
+in-process and reports throughput and callback latency percentiles.
+Spotify's token endpoint is replaced by a mock that answers after
+``--latency-ms``, so the numbers measure how the app handles slow token
+exchanges rather than the network.
+
+Two modes are compared:
+    - async: the real async token client (pooled, bounded by
+      ``OAUTH_CONCURRENCY``)
+    - blocking: the exchange sleeps on the event loop, as the previous
+      synchronous spotipy exchange did
+
+Usage:
+    cd backend
+    python -m benchmarks.login_burst [--logins 200] [--latency-ms 100]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from app.core.config import get_settings
+from app.main import app
+from app.services.oauth import SpotifyOAuthClient
+
+TOKEN_INFO = {
+    "access_token": "access",
+    "refresh_token": "refresh",
+    "expires_in": 3600,
+}
+
+
+def mock_token_endpoint(latency: float) -> httpx.MockTransport:
+    """Return a transport answering token requests after ``latency`` seconds."""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json=TOKEN_INFO)
+
+    return httpx.MockTransport(handler)
+
+
+class BlockingOAuthClient(SpotifyOAuthClient):
+    """Token client that blocks the event loop like a synchronous exchange."""
+
+    latency = 0.0
+
+    async def exchange_code(self, code: str) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        return dict(TOKEN_INFO)
+
+
+async def login_flow(client: httpx.AsyncClient) -> float:
+    """Run one login; return the callback latency in seconds."""
+    login = await client.get("/login")
+    state = parse_qs(urlparse(login.headers["location"]).query)["state"][0]
+    started = time.perf_counter()
+    response = await client.get("/callback", params={"code": "code", "state": state})
+    elapsed = time.perf_counter() - started
+    assert "token=" in response.headers["location"], response.headers["location"]
+    return elapsed
+
+
+async def run_burst(oauth: SpotifyOAuthClient, logins: int) -> Dict[str, float]:
+    """Run ``logins`` concurrent login flows against the app."""
+    transport = httpx.ASGITransport(app=app)
+    with patch("app.services.oauth.get_oauth_client", return_value=oauth):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://testserver"
+        ) as client:
+            started = time.perf_counter()
+            latencies: List[float] = await asyncio.gather(
+                *(login_flow(client) for _ in range(logins))
+            )
+            wall = time.perf_counter() - started
+    await oauth.aclose()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "logins/s": logins / wall,
+        "p50 ms": quantiles[49] * 1000,
+        "p95 ms": quantiles[94] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    latency = args.latency_ms / 1000
+    options = dict(
+        client_id="id",
+        client_secret="secret",
+        redirect_uri=settings.SPOTIFY_REDIRECT_URI,
+        scope=settings.SPOTIFY_SCOPES,
+        concurrency=settings.OAUTH_CONCURRENCY,
+        timeout_seconds=settings.OAUTH_TIMEOUT_SECONDS,
+    )
+    blocking = BlockingOAuthClient(**options)
+    blocking.latency = latency
+    clients = {
+        "async": SpotifyOAuthClient(**options, transport=mock_token_endpoint(latency)),
+        "blocking": blocking,
+    }
+
+    print(
+        f"{args.logins} concurrent logins, token endpoint latency "
+        f"{args.latency_ms:.0f} ms, OAUTH_CONCURRENCY={settings.OAUTH_CONCURRENCY}"
+    )
+    for mode, oauth in clients.items():
+        results = asyncio.run(run_burst(oauth, args.logins))
+        summary = "  ".join(f"{name} {value:8.1f}" for name, value in results.items())
+        print(f"  {mode:<9} {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Memory benchmark for cached Spotify items.
+
+Builds synthetic top-track and top-artist responses shaped like real API
+objects and reports the bytes retained per cached item as raw dicts and as
+the compact records from ``app.models.compact``.
+
+Usage:
+    cd backend
+    python -m benchmarks.memory [--items 5000]
+"""
+
+import argparse
+import gc
+import random
+import tracemalloc
+from typing import Any, Callable, List
+
+from app.models.compact import CompactArtist, CompactTrack
+from benchmarks.fixtures import make_artist, make_track
+
+
+def retained_bytes(build: Callable[[], List[Any]]) -> int:
+    """Return the bytes still allocated by ``build()``'s result."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=5000)
+    args = parser.parse_args()
+
+    for label, make, model in (
+        ("track", make_track, CompactTrack),
+        ("artist", make_artist, CompactArtist),
+    ):
+        # JSON decoding produces fresh objects, so rebuild the raw items for
+        # each measurement rather than sharing them with the compact run
+        def raw() -> List[Any]:
+            rng = random.Random(0)
+            return [make(rng) for _ in range(args.items)]
+
+        def compact() -> List[Any]:
+            return [model.from_api(item) for item in raw()]
+
+        raw_bytes = retained_bytes(raw) / args.items
+        compact_bytes = retained_bytes(compact) / args.items
+        print(
+            f"{label:<7} raw {raw_bytes:8.0f} B/item   "
+            f"compact {compact_bytes:7.0f} B/item   "
+            f"({raw_bytes / compact_bytes:.1f}x smaller)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Search latency benchmark for the listening history index.
+
+Indexes a synthetic history of plays (tracks drawn from a catalogue with
+word-based names, so queries hit realistic posting lists) and reports the
+build time, memory and query latency of ``app.services.search``.
+
+Usage:
+    cd backend
+    python -m benchmarks.search [--plays 100000] [--tracks 20000]
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from app.services.search import SearchIndex
+from benchmarks.fixtures import make_artist, make_track
+
+SYLLABLES = ["ra", "dio", "head", "the", "lo", "ve", "mo", "on", "sun", "ny"]
+SYLLABLES += ["bla", "ck", "star", "li", "ght", "dre", "am", "fi", "re", "sky"]
+
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def name(rng: random.Random) -> str:
+    return " ".join(word(rng) for _ in range(rng.randint(1, 4))).title()
+
+
+def history(plays: int, tracks: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Return ``plays`` recently-played items, newest first."""
+    rng = random.Random(seed)
+    artists = []
+    for _ in range(max(tracks // 8, 1)):
+        artist = make_artist(rng, full=False)
+        artist["name"] = name(rng)
+        artists.append(artist)
+    catalogue = []
+    for _ in range(tracks):
+        track = make_track(rng)
+        track["name"] = name(rng)
+        track["artists"] = rng.sample(artists, len(track["artists"]))
+        track["album"]["name"] = name(rng)
+        track["album"]["artists"] = track["artists"][:1]
+        catalogue.append(track)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "track": rng.choice(catalogue),
+            "played_at": (start + timedelta(minutes=3 * i)).isoformat(),
+        }
+        for i in reversed(range(plays))
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--plays", type=int, default=100000)
+    parser.add_argument("--tracks", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    plays = history(args.plays, args.tracks)
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = SearchIndex()
+    # Ingested 50 at a time, as refreshes add them
+    for offset in range(len(plays) - 50, -50, -50):
+        index.add_plays(plays[max(offset, 0) : offset + 50])
+    build = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{args.plays} plays, {len(index)} items indexed in {build:.2f} s, "
+        f"{size / 2**20:.1f} MiB"
+    )
+
+    rng = random.Random(1)
+    queries = ["r", "th", "head", "radio", "starlight", "sun sky", word(rng)]
+    for query in queries:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results = index.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(
+            f"{query!r:<12} p50 {statistics.median(timings):6.2f} ms   "
+            f"p99 {timings[int(len(timings) * 0.99)]:6.2f} ms   "
+            f"top {results[0]['name'] if results else '-'!r}"
+        )
+
+
+if __name__ == "__main__":
+    main()
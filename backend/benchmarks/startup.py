@@ -0,0 +1,77 @@
+"""
+Cold-start benchmark for the SpotifEye API.
+
+Each sample runs in a fresh interpreter and reports:
+    - import: time to ``import app.main``
+    - startup: time to create the test client and run the startup event
+    - first /: latency of the first request to the root endpoint
+    - first /me: latency of the first authenticated-route request (this
+      pulls in the JWT library on first use)
+
+Usage:
+    cd backend
+    python -m benchmarks.startup [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    t2 = time.perf_counter()
+    client.get("/")
+    t3 = time.perf_counter()
+    client.get("/me", headers={"Authorization": "Bearer not.a.jwt"})
+    t4 = time.perf_counter()
+print(json.dumps({
+    "import": t1 - t0,
+    "startup": t2 - t1,
+    "first /": t3 - t2,
+    "first /me": t4 - t3,
+}))
+"""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_probe(cold_start: bool) -> Dict[str, float]:
+    """Run one cold-start sample in a fresh interpreter."""
+    env = dict(os.environ, COLD_START_MODE="true" if cold_start else "false")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for cold_start in (False, True):
+        samples: List[Dict[str, float]] = [
+            run_probe(cold_start) for _ in range(args.runs)
+        ]
+        print(f"COLD_START_MODE={cold_start} (median of {args.runs} runs)")
+        for phase in samples[0]:
+            median = statistics.median(sample[phase] for sample in samples)
+            print(f"  {phase:<10} {median * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,24 @@ import os
 
 import pytest
 
-from app.core.config import Settings, settings
+from app.api.auth import get_token_claims_cache
+from app.core.admission import get_admission_controller
+from app.core.config import Settings, get_settings, settings
+from app.services.activity import get_activity_tracker
+from app.services.history import get_snapshot_store
+from app.services.oauth import get_oauth_state_store
+from app.services.search import get_search_indexes
+from app.services.spotify import (
+    get_adaptive_ttl,
+    get_disk_cache,
+    get_profile_cache,
+    get_rate_limiter,
+    get_response_cache,
+    get_upstreams,
+)
+from app.services.stats import get_stats_cache
+from app.services.taste import get_taste_index
+from app.services.thumbnails import get_thumbnail_service
 
 
 @pytest.fixture(scope="session")
@@ -48,3 +65,40 @@ def setup_test_environment():
     ]:
         if key in os.environ:
             del os.environ[key]
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start every test with empty in-process caches."""
+    get_token_claims_cache().clear()
+    get_response_cache().clear()
+    get_stats_cache().clear()
+    get_profile_cache().clear()
+    get_activity_tracker.cache_clear()
+    get_rate_limiter.cache_clear()
+    get_upstreams.cache_clear()
+    get_admission_controller.cache_clear()
+    get_search_indexes.cache_clear()
+    get_adaptive_ttl.cache_clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def local_storage(tmp_path, monkeypatch):
+    """Keep each test's on-disk caches, history and taste index in temporary files."""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "DISK_CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(settings, "TASTE_INDEX_PATH", str(tmp_path / "taste"))
+    monkeypatch.setattr(settings, "THUMBNAIL_DIR", str(tmp_path / "thumbnails"))
+    monkeypatch.setattr(settings, "HISTORY_DB_PATH", str(tmp_path / "history.db"))
+    get_disk_cache.cache_clear()
+    get_snapshot_store.cache_clear()
+    get_oauth_state_store.cache_clear()
+    get_taste_index.cache_clear()
+    get_thumbnail_service.cache_clear()
+    yield
+    get_disk_cache.cache_clear()
+    get_snapshot_store.cache_clear()
+    get_oauth_state_store.cache_clear()
+    get_taste_index.cache_clear()
+    get_thumbnail_service.cache_clear()
@@ -0,0 +1,95 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.auth import get_current_user
+from app.core.adaptive_ttl import AdaptiveTTL
+from app.main import app
+from app.services.spotify import SpotifyService, get_profile_cache
+
+client = TestClient(app)
+
+TRACKS = {"items": [{"id": "track1", "name": "Track 1"}]}
+OTHER_TRACKS = {"items": [{"id": "track2", "name": "Track 2"}]}
+
+
+def test_ttl_grows_while_unchanged_and_shrinks_on_change():
+    """Test the learned TTL follows observed changes within its bounds."""
+    ttls = AdaptiveTTL(base_seconds=600, min_seconds=120, growth=2, shrink=0.5)
+    assert ttls.fetched("key", 1, max_seconds=3600, now=0) == 600
+    assert ttls.fetched("key", 1, max_seconds=3600, now=600) == 1200
+    assert ttls.fetched("key", 1, max_seconds=3600, now=1800) == 2400
+    assert ttls.fetched("key", 1, max_seconds=3600, now=4200) == 3600
+    assert ttls.fetched("key", 2, max_seconds=3600, now=7800) == 1800
+    for now in (9600, 10500, 10950, 11175):
+        ttls.fetched("key", now, max_seconds=3600, now=now)
+    assert ttls.ttl("key") == 120
+    assert ttls.ttl("other") == 600
+
+
+def test_calls_saved_and_stale_served():
+    """Test savings and staleness are counted against the fixed TTL."""
+    ttls = AdaptiveTTL(base_seconds=600, min_seconds=120, growth=4)
+    ttls.fetched("key", 1, max_seconds=3600, now=0)
+    ttls.fetched("key", 1, max_seconds=3600, now=600)
+    # Within the base TTL, then twice in the second window, then the third
+    for now in (1000, 1300, 1500, 1900):
+        ttls.hit("key", now=now)
+    assert ttls.metrics()["calls_saved"] == 2
+
+    ttls.fetched("key", 2, max_seconds=3600, now=3000)
+    assert ttls.metrics()["stale_served"] == 3
+
+    # A background refresh stands in for the warmer's fixed-TTL refreshes
+    ttls.fetched("key", 2, max_seconds=3600, now=3000 + 1200 - 30)
+    ttls.fetched("key", 2, max_seconds=3600, background=True, now=6570)
+    metrics = ttls.metrics()
+    assert metrics["calls_saved"] == 2 + 3
+    assert metrics["changed"] == 1
+    assert metrics["unchanged"] == 3
+    assert metrics["ttl_seconds"]["max"] == 3600
+
+
+@pytest.mark.asyncio
+async def test_service_learns_ttl_per_user_across_sessions():
+    """Test an unchanged top list is cached longer, even after a new token."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user_top_tracks.return_value = TRACKS
+        for token in ("token1", "token2"):
+            get_profile_cache().set(
+                SpotifyService(token).profile_key(), {"id": "user1"}, time.time() + 60
+            )
+
+        first = SpotifyService("token1")
+        await first.get_top_tracks(limit=50, time_range="long_term")
+        expires = first.cache_expiry("top-tracks", limit=50, time_range="long_term")
+        assert expires == pytest.approx(time.time() + 600, abs=5)
+
+        second = SpotifyService("token2")
+        await second.get_top_tracks(limit=50, time_range="long_term", refresh=True)
+        expires = second.cache_expiry("top-tracks", limit=50, time_range="long_term")
+        assert expires == pytest.approx(time.time() + 900, abs=5)
+
+        mock_spotify.return_value.current_user_top_tracks.return_value = OTHER_TRACKS
+        await second.get_top_tracks(limit=50, time_range="long_term", refresh=True)
+        expires = second.cache_expiry("top-tracks", limit=50, time_range="long_term")
+        assert expires == pytest.approx(time.time() + 450, abs=5)
+
+
+def test_cache_metrics_endpoint():
+    """Test the metrics report learned TTLs after a top list fetch."""
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            mock_spotify.return_value.current_user_top_tracks.return_value = TRACKS
+            response = client.get("/spotify/top-tracks")
+    finally:
+        app.dependency_overrides = {}
+    assert response.status_code == 200
+
+    metrics = client.get("/metrics/cache").json()
+    assert metrics["keys"] == 1
+    assert metrics["fetches"] == 1
+    assert metrics["ttl_seconds"]["base"] == 600
@@ -0,0 +1,169 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api.auth import create_access_token
+from app.core.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    AdmissionRejected,
+    admission_key,
+    get_admission_controller,
+)
+from app.core.config import get_settings
+
+
+def make_controller(**limits) -> AdmissionController:
+    options = dict(
+        max_in_flight=2,
+        max_per_user=2,
+        queue_size=1,
+        queue_timeout=1.0,
+        retry_after=3,
+    )
+    options.update(limits)
+    return AdmissionController(**options)
+
+
+@pytest.mark.asyncio
+async def test_per_user_limit_fails_fast():
+    """Test a user past their limit gets 429 while others are admitted."""
+    controller = make_controller(max_in_flight=10)
+    await controller.acquire("alice")
+    await controller.acquire("alice")
+    with pytest.raises(AdmissionRejected) as error:
+        await controller.acquire("alice")
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "3"
+
+    await controller.acquire("bob")
+    controller.release("alice")
+    await controller.acquire("alice")
+    assert controller.metrics()["rejected_user"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_hands_over_slots_and_rejects_overflow():
+    """Test that past the global limit requests queue, then get 503."""
+    controller = make_controller()
+    await controller.acquire("a")
+    await controller.acquire("b")
+
+    queued = asyncio.create_task(controller.acquire("c"))
+    await asyncio.sleep(0)
+    assert controller.metrics()["queued_now"] == 1
+    with pytest.raises(AdmissionRejected) as error:
+        await controller.acquire("d")
+    assert error.value.status_code == 503
+
+    controller.release("a")
+    await queued
+    assert controller.in_flight == 2
+    assert controller.metrics()["queued_now"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_wait_times_out():
+    """Test a queued request gives up after the timeout, freeing its place."""
+    controller = make_controller(max_in_flight=1, queue_timeout=0.01)
+    await controller.acquire("a")
+    with pytest.raises(AdmissionRejected) as error:
+        await controller.acquire("b")
+    assert error.value.status_code == 503
+    assert controller.metrics()["queued_now"] == 0
+    assert controller.metrics()["users_in_flight"] == 1
+
+    controller.release("a")
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_limits_users_but_not_exempt_routes(monkeypatch):
+    """Test the middleware's 429 response and the exempt health check."""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "ADMISSION_MAX_PER_USER", 1)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT", 1)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_SIZE", 0)
+    get_admission_controller.cache_clear()
+
+    release = asyncio.Event()
+    inner = FastAPI()
+
+    @inner.get("/slow")
+    async def slow():
+        await release.wait()
+        return {"ok": True}
+
+    @inner.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    transport = httpx.ASGITransport(app=AdmissionMiddleware(inner))
+    token = create_access_token({"sub": "spotify_token"})
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        first = asyncio.create_task(client.get("/slow", headers=headers))
+        await asyncio.sleep(0.05)
+
+        response = await client.get("/slow", headers=headers)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+        # Another user finds the server saturated
+        response = await client.get("/slow")
+        assert response.status_code == 503
+        assert (await client.get("/health")).status_code == 200
+
+        release.set()
+        assert (await first).status_code == 200
+    assert get_admission_controller().in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_anonymous_clients_get_a_larger_limit():
+    """Test a page's worth of artwork from one address is not refused."""
+    get_admission_controller.cache_clear()
+    release = asyncio.Event()
+    inner = FastAPI()
+
+    @inner.get("/images/{image_id}")
+    async def image(image_id: str):
+        await release.wait()
+        return {"id": image_id}
+
+    transport = httpx.ASGITransport(app=AdmissionMiddleware(inner))
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        count = get_settings().ADMISSION_MAX_PER_USER * 2
+        requests = [
+            asyncio.create_task(client.get(f"/images/{n}")) for n in range(count)
+        ]
+        await asyncio.sleep(0.05)
+        assert get_admission_controller().in_flight == count
+
+        release.set()
+        responses = await asyncio.gather(*requests)
+    assert [response.status_code for response in responses] == [200] * count
+    assert get_admission_controller().metrics()["rejected_user"] == 0
+
+
+def test_admission_key_uses_verified_subject_or_client_address():
+    """Test sessions share a key across re-issued tokens; others use the address."""
+
+    def scope(authorization=None, client=("10.0.0.1", 5000)):
+        headers = [(b"authorization", authorization.encode())] if authorization else []
+        return {"type": "http", "headers": headers, "client": client}
+
+    first = create_access_token({"sub": "spotify_token", "refresh_token": "a"})
+    reissued = create_access_token({"sub": "spotify_token", "refresh_token": "b"})
+    other = create_access_token({"sub": "other_token"})
+    key = admission_key(scope(f"Bearer {first}"))
+    assert key == admission_key(scope(f"Bearer {reissued}", ("10.0.0.2", 6000)))
+    assert key != admission_key(scope(f"Bearer {other}"))
+    assert b"spotify_token" not in key[1]
+
+    by_address = ("client", "10.0.0.1")
+    assert admission_key(scope()) == by_address
+    assert admission_key(scope("Bearer forged")) == by_address
+    assert admission_key(scope(f"Basic {first}")) == by_address
+    assert admission_key(scope(client=None)) is None
@@ -1,13 +1,35 @@
+import os
 import re
+import subprocess
+import sys
 from unittest.mock import MagicMock, patch
 from urllib.parse import parse_qs, unquote, urlparse
 
 from fastapi.testclient import TestClient
+from jose import jwt
 
+from app.api.auth import create_access_token, get_token_claims_cache
 from app.main import app
+from app.services.oauth import OAuthError
 
+# https, so the Secure login state cookie is sent back to /callback
 client = TestClient(app)
 
+EXCHANGE_CODE = "app.services.oauth.SpotifyOAuthClient.exchange_code"
+
+TOKEN_INFO = {
+    "access_token": "test_access_token",
+    "refresh_token": "test_refresh_token",
+    "expires_in": 3600,
+}
+
+
+def login_state() -> str:
+    """Start a login and return the state it issued."""
+    response = client.get("/login", follow_redirects=False)
+    location = urlparse(response.headers["location"])
+    return parse_qs(location.query)["state"][0]
+
 
 def test_root_endpoint() -> None:
     """Test the root endpoint returns correct information."""
@@ -31,12 +53,12 @@ def test_cors_headers() -> None:
 def test_callback_endpoint() -> None:
     """Test the callback endpoint with a mock authorization code."""
     # Test with invalid code
-    with patch("spotipy.oauth2.SpotifyOAuth.get_access_token") as mock_get_token:
-        mock_get_token.return_value = {
-            "error": "invalid_grant",
-            "error_description": "Invalid authorization code",
-        }
-        response = client.get("/callback?code=invalid_code", follow_redirects=False)
+    with patch(EXCHANGE_CODE, side_effect=OAuthError("Invalid authorization code")):
+        response = client.get(
+            "/callback",
+            params={"code": "invalid_code", "state": login_state()},
+            follow_redirects=False,
+        )
         assert response.status_code == 307
         assert "error=" in unquote(response.headers["location"])
 
@@ -62,12 +84,12 @@ def test_protected_endpoint_with_invalid_token() -> None:
 
 def test_callback_with_invalid_code() -> None:
     """Test callback endpoint with an invalid authorization code."""
-    with patch("spotipy.oauth2.SpotifyOAuth.get_access_token") as mock_get_token:
-        mock_get_token.return_value = {
-            "error": "invalid_grant",
-            "error_description": "Invalid authorization code",
-        }
-        response = client.get("/callback?code=invalid_code", follow_redirects=False)
+    with patch(EXCHANGE_CODE, side_effect=OAuthError("Invalid authorization code")):
+        response = client.get(
+            "/callback",
+            params={"code": "invalid_code", "state": login_state()},
+            follow_redirects=False,
+        )
         assert response.status_code == 307
         assert "error=" in unquote(response.headers["location"])
 
@@ -80,12 +102,12 @@ def test_callback_with_missing_code() -> None:
 
 def test_callback_with_expired_code() -> None:
     """Test callback endpoint with an expired authorization code."""
-    with patch("spotipy.oauth2.SpotifyOAuth.get_access_token") as mock_get_token:
-        mock_get_token.return_value = {
-            "error": "invalid_grant",
-            "error_description": "Authorization code expired",
-        }
-        response = client.get("/callback?code=expired_code", follow_redirects=False)
+    with patch(EXCHANGE_CODE, side_effect=OAuthError("Authorization code expired")):
+        response = client.get(
+            "/callback",
+            params={"code": "expired_code", "state": login_state()},
+            follow_redirects=False,
+        )
         assert response.status_code == 307
         assert "error=" in unquote(response.headers["location"])
 
@@ -128,15 +150,13 @@ def test_logout_endpoint_success() -> None:
         mock_spotify.return_value._session = mock_session
 
         # Create a valid token
-        with patch("spotipy.oauth2.SpotifyOAuth.get_access_token") as mock_get_token:
-            mock_get_token.return_value = {
-                "access_token": "test_access_token",
-                "refresh_token": "test_refresh_token",
-                "expires_in": 3600,
-            }
-
+        with patch(EXCHANGE_CODE, return_value=TOKEN_INFO):
             # First get a valid token (expect redirect)
-            response = client.get("/callback?code=valid_code", follow_redirects=False)
+            response = client.get(
+                "/callback",
+                params={"code": "valid_code", "state": login_state()},
+                follow_redirects=False,
+            )
             assert response.status_code == 307
             location = response.headers["location"]
             parsed = urlparse(location)
@@ -158,15 +178,13 @@ def test_logout_endpoint_error() -> None:
         mock_spotify.return_value._session.close.side_effect = Exception("Test error")
 
         # Create a valid token
-        with patch("spotipy.oauth2.SpotifyOAuth.get_access_token") as mock_get_token:
-            mock_get_token.return_value = {
-                "access_token": "test_access_token",
-                "refresh_token": "test_refresh_token",
-                "expires_in": 3600,
-            }
-
+        with patch(EXCHANGE_CODE, return_value=TOKEN_INFO):
             # First get a valid token (expect redirect)
-            response = client.get("/callback?code=valid_code", follow_redirects=False)
+            response = client.get(
+                "/callback",
+                params={"code": "valid_code", "state": login_state()},
+                follow_redirects=False,
+            )
             assert response.status_code == 307
             location = response.headers["location"]
             parsed = urlparse(location)
@@ -189,15 +207,13 @@ def test_blacklisted_token() -> None:
         mock_spotify.return_value._session = mock_session
 
         # Create a valid token
-        with patch("spotipy.oauth2.SpotifyOAuth.get_access_token") as mock_get_token:
-            mock_get_token.return_value = {
-                "access_token": "test_access_token",
-                "refresh_token": "test_refresh_token",
-                "expires_in": 3600,
-            }
-
+        with patch(EXCHANGE_CODE, return_value=TOKEN_INFO):
             # First get a valid token (expect redirect)
-            response = client.get("/callback?code=valid_code", follow_redirects=False)
+            response = client.get(
+                "/callback",
+                params={"code": "valid_code", "state": login_state()},
+                follow_redirects=False,
+            )
             assert response.status_code == 307
             location = response.headers["location"]
             parsed = urlparse(location)
@@ -212,7 +228,7 @@ def test_blacklisted_token() -> None:
 
             # Try to use the blacklisted token
             response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
-            assert response.status_code == 200
+            assert response.status_code == 401
 
 
 def test_multiple_logout_same_token() -> None:
@@ -223,15 +239,13 @@ def test_multiple_logout_same_token() -> None:
         mock_spotify.return_value._session = mock_session
 
         # Create a valid token
-        with patch("spotipy.oauth2.SpotifyOAuth.get_access_token") as mock_get_token:
-            mock_get_token.return_value = {
-                "access_token": "test_access_token",
-                "refresh_token": "test_refresh_token",
-                "expires_in": 3600,
-            }
-
+        with patch(EXCHANGE_CODE, return_value=TOKEN_INFO):
             # First get a valid token (expect redirect)
-            response = client.get("/callback?code=valid_code", follow_redirects=False)
+            response = client.get(
+                "/callback",
+                params={"code": "valid_code", "state": login_state()},
+                follow_redirects=False,
+            )
             assert response.status_code == 307
             location = response.headers["location"]
             parsed = urlparse(location)
@@ -251,6 +265,47 @@ def test_multiple_logout_same_token() -> None:
             assert response.status_code == 200
 
 
+def test_token_claims_are_cached() -> None:
+    """Test that repeat requests with the same token skip JWT decoding."""
+    token = create_access_token(data={"sub": "cached_spotify_token"})
+    get_token_claims_cache().clear()
+    with (
+        patch("spotipy.Spotify") as mock_spotify,
+        patch("jose.jwt.decode", wraps=jwt.decode) as mock_decode,
+    ):
+        mock_spotify.return_value.current_user.return_value = {"id": "test_user"}
+        for _ in range(3):
+            response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200
+        assert mock_decode.call_count == 1
+
+
+def test_logout_evicts_cached_claims() -> None:
+    """Test that a cached token is rejected once it has been logged out."""
+    token = create_access_token(data={"sub": "evicted_spotify_token"})
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user.return_value = {"id": "test_user"}
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.get("/me", headers=headers).status_code == 200
+        client.post("/logout", headers=headers)
+        assert client.get("/me", headers=headers).status_code == 401
+
+
+def test_app_import_defers_heavy_dependencies() -> None:
+    """Test that importing the app does not load spotipy, jose or settings."""
+    probe = (
+        "import sys, app.main, app.core.config as config; "
+        "assert 'spotipy' not in sys.modules; "
+        "assert 'jose' not in sys.modules; "
+        "assert config.get_settings.cache_info().currsize == 0"
+    )
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=backend_dir, capture_output=True
+    )
+    assert result.returncode == 0, result.stderr.decode()
+
+
 def test_print_routes():
     """Print all registered routes for documentation purposes."""
     routes = [(route.path, route.methods) for route in app.routes]
@@ -0,0 +1,159 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from spotipy.exceptions import SpotifyException
+
+from app.api.auth import get_current_user, get_current_user_id
+from app.main import app
+from app.services.artists import artist_insights
+from app.services.spotify import SpotifyService
+
+client = TestClient(app)
+
+RADIOHEAD = {"id": "4Z8W4fKeB5YxbusRsdQVPb", "name": "Radiohead", "genres": ["rock"]}
+PORTISHEAD = {
+    "id": "6liAMWkVf5LH7YR9yfFy1Y",
+    "name": "Portishead",
+    "genres": ["trip hop"],
+}
+KNOWN = {artist["id"]: artist for artist in (RADIOHEAD, PORTISHEAD)}
+UNKNOWN = "0" * 22
+
+
+def track(track_id, artist):
+    return {
+        "id": track_id,
+        "name": track_id.title(),
+        "artists": [{"id": artist["id"], "name": artist["name"]}],
+        "album": {"id": f"{track_id}-album", "name": "Album", "artists": []},
+    }
+
+
+def mock_catalog(sp):
+    """Answer catalog calls for KNOWN artists and 404 for any other id."""
+
+    def known(artist_id):
+        if artist_id not in KNOWN:
+            raise SpotifyException(404, -1, "non existing id")
+        return KNOWN[artist_id]
+
+    sp.artists.side_effect = lambda ids: {"artists": [KNOWN.get(i) for i in ids]}
+    sp.artist_top_tracks.side_effect = lambda artist_id, country: {
+        "tracks": [track(f"{artist_id}-hit", known(artist_id))]
+    }
+    sp.artist_albums.side_effect = lambda artist_id, **params: {
+        "items": [{"id": f"{known(artist_id)['id']}-album", "name": "Album"}]
+    }
+    sp.artist_related_artists.side_effect = lambda artist_id: {
+        "artists": [PORTISHEAD if known(artist_id) is RADIOHEAD else RADIOHEAD]
+    }
+    sp.current_user_top_tracks.return_value = {"items": []}
+    sp.current_user_top_artists.return_value = {"items": [RADIOHEAD]}
+    sp.current_user_recently_played.return_value = {
+        "items": [
+            {
+                "track": track(f"{RADIOHEAD['id']}-hit", RADIOHEAD),
+                "played_at": played_at,
+            }
+            for played_at in ("2024-05-01T12:01:00.000Z", "2024-05-01T12:00:00.000Z")
+        ]
+    }
+
+
+def test_batch_insights_endpoint():
+    """Test a batch is one several-artists call, reused by later requests."""
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    app.dependency_overrides[get_current_user_id] = lambda: "user1"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            sp = mock_spotify.return_value
+            mock_catalog(sp)
+            ids = [RADIOHEAD["id"], UNKNOWN, "not-an-id", PORTISHEAD["id"]]
+            response = client.get(
+                "/spotify/artists/insights?ids=" + ",".join([*ids, RADIOHEAD["id"]])
+            )
+            single = client.get(f"/spotify/artists/{PORTISHEAD['id']}/insights")
+            # The malformed id never reached Spotify
+            sp.artists.assert_called_once_with(
+                (RADIOHEAD["id"], UNKNOWN, PORTISHEAD["id"])
+            )
+            assert sp.artist_top_tracks.call_count == 3
+
+            missing = client.get(f"/spotify/artists/{UNKNOWN}/insights")
+            malformed = client.get("/spotify/artists/not-an-id/insights")
+            too_many = client.get(
+                "/spotify/artists/insights?ids=" + ",".join(map(str, range(21)))
+            )
+    finally:
+        app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [i["artist"]["name"] for i in body["artists"]] == ["Radiohead", "Portishead"]
+    assert body["not_found"] == [UNKNOWN, "not-an-id"]
+
+    radiohead = body["artists"][0]
+    hit = f"{RADIOHEAD['id']}-hit"
+    assert radiohead["top_tracks"][0]["id"] == hit
+    assert radiohead["albums"][0]["id"] == f"{RADIOHEAD['id']}-album"
+    assert radiohead["related_artists"][0]["name"] == "Portishead"
+    assert radiohead["errors"] == {}
+    assert radiohead["listening"]["plays"] == 2
+    assert radiohead["listening"]["ranks"]["short_term"] == 1
+    assert radiohead["listening"]["top_tracks_played"] == [
+        {"id": hit, "name": hit.title(), "plays": 2}
+    ]
+    assert body["artists"][1]["listening"]["plays"] == 0
+
+    assert single.json() == body["artists"][1]
+    assert missing.status_code == 404
+    assert malformed.status_code == 404
+    assert too_many.status_code == 400
+
+
+@pytest.mark.parametrize("status", [403, 404, 429, 503])
+def test_failed_section_is_null_with_an_error(status):
+    """Test one list Spotify refuses does not fail the whole response."""
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    app.dependency_overrides[get_current_user_id] = lambda: "user1"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            sp = mock_spotify.return_value
+            mock_catalog(sp)
+            sp.artist_related_artists.side_effect = SpotifyException(
+                status, -1, "refused"
+            )
+            response = client.get(f"/spotify/artists/{RADIOHEAD['id']}/insights")
+    finally:
+        app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["related_artists"] is None
+    assert body["errors"]["related_artists"]["status"] == status
+    assert body["top_tracks"][0]["id"] == f"{RADIOHEAD['id']}-hit"
+
+
+@pytest.mark.asyncio
+async def test_per_artist_calls_run_concurrently():
+    """Test an artist's lists are fetched at the same time, not in turn."""
+    # Each call waits until all three are in flight
+    barrier = threading.Barrier(3, timeout=5)
+    with patch("spotipy.Spotify") as mock_spotify:
+        sp = mock_spotify.return_value
+        mock_catalog(sp)
+        for name in ("artist_top_tracks", "artist_albums", "artist_related_artists"):
+            answer = getattr(sp, name).side_effect
+
+            def concurrent(*args, answer=answer, **kwargs):
+                barrier.wait()
+                return answer(*args, **kwargs)
+
+            getattr(sp, name).side_effect = concurrent
+
+        [insights] = await artist_insights(
+            SpotifyService("test_token"), "user1", [RADIOHEAD["id"]]
+        )
+    assert insights["related_artists"][0]["id"] == PORTISHEAD["id"]
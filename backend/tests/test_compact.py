@@ -0,0 +1,103 @@
+import random
+
+from app.models.compact import (
+    CompactArtist,
+    CompactPlay,
+    CompactTrack,
+    PlayHistory,
+    pack_images,
+    unpack_images,
+)
+from benchmarks.fixtures import make_artist, make_track
+
+DROPPED_FIELDS = ("available_markets", "external_ids")
+
+
+def strip_dropped(value):
+    """Remove fields the compact records intentionally do not keep."""
+    if isinstance(value, dict):
+        return {
+            key: strip_dropped(item)
+            for key, item in value.items()
+            if key not in DROPPED_FIELDS
+        }
+    if isinstance(value, list):
+        return [strip_dropped(item) for item in value]
+    return value
+
+
+def test_track_round_trip():
+    """Test that a track converts back to the API shape it came from."""
+    track = make_track(random.Random(1))
+    compact = CompactTrack.from_api(track)
+    expanded = compact.to_api()
+
+    album = strip_dropped(track["album"])
+    assert expanded["album"] == album
+    assert expanded["artists"] == track["artists"]
+    for key in ("id", "name", "uri", "href", "external_urls", "duration_ms"):
+        assert expanded[key] == track[key]
+
+
+def test_artist_round_trip():
+    """Test that an artist converts back to the API shape it came from."""
+    artist = make_artist(random.Random(2))
+    assert CompactArtist.from_api(artist).to_api() == artist
+
+
+def test_play_round_trip():
+    """Test that play timestamps and context survive conversion."""
+    play = {
+        "track": {"id": "track1", "name": "Test Track 1"},
+        "played_at": "2024-01-01T00:00:00.123Z",
+        "context": {"uri": "spotify:playlist:abc", "type": "playlist"},
+    }
+    expanded = CompactPlay.from_api(play).to_api()
+    assert expanded["played_at"] == play["played_at"]
+    assert expanded["context"] == play["context"]
+    assert expanded["track"]["name"] == "Test Track 1"
+
+
+def test_cdn_images_are_packed():
+    """Test that CDN image URLs shrink to bytes and other URLs are kept."""
+    images = [
+        {"url": "https://i.scdn.co/image/" + "ab" * 20, "width": 64, "height": 64},
+        {"url": "http://example.com/image1.jpg", "width": None, "height": None},
+    ]
+    packed = pack_images(images)
+    assert packed[0][0] == bytes.fromhex("ab" * 20)
+    assert packed[1][0] == "http://example.com/image1.jpg"
+    assert unpack_images(packed) == images
+
+
+def test_minimal_items_convert():
+    """Test that items missing optional fields still convert."""
+    track = CompactTrack.from_api({"id": "track1", "name": "Test Track 1"})
+    assert track.to_api()["album"] is None
+    artist = CompactArtist.from_api({"id": "artist1", "name": "Test Artist 1"})
+    assert artist.to_api()["genres"] == []
+
+
+def test_local_track_keeps_its_uri():
+    """Test a track without an id keeps its uri instead of a made-up one."""
+    uri = "spotify:local:Artist:Album:Demo:180"
+    track = CompactTrack.from_api(
+        {"id": None, "uri": uri, "name": "Demo", "is_local": True, "artists": [{}]}
+    )
+    expanded = track.to_api()
+    assert expanded["uri"] == uri
+    assert expanded["href"] is None
+    assert expanded["external_urls"] == {}
+    assert expanded["artists"][0]["uri"] is None
+
+
+def test_play_history_stores_each_track_once():
+    """Test that repeated plays of a track share one record."""
+    history = PlayHistory()
+    history.extend_api(
+        {"track": {"id": track_id}, "played_at": f"2024-01-01T00:0{i}:00Z"}
+        for i, track_id in enumerate(["track1", "track2", "track1"])
+    )
+    assert len(history) == 3
+    assert len(history.tracks) == 2
+    assert [track.id for _, track in history] == ["track1", "track2", "track1"]
@@ -0,0 +1,137 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.core.disk_cache import DiskCache
+from app.models.compact import CompactTrack
+from app.services.spotify import (
+    SpotifyService,
+    get_disk_cache,
+    get_profile_cache,
+    get_response_cache,
+)
+
+
+@pytest.fixture
+def disk(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+    yield cache
+    cache.close()
+
+
+def test_round_trip_and_expiry(disk):
+    """Test stored records come back equal, and expired entries only as stale."""
+    records = (CompactTrack.from_api({"id": "track1", "name": "Song"}),)
+    disk.set(("session", "top-tracks"), records, time.time() + 60)
+    value, _ = disk.get(("session", "top-tracks"))
+    assert value == records
+
+    disk.set("old", "value", time.time() - 1)
+    assert disk.get("old") is None
+    assert disk.get_entry("old")[0] == "value"
+
+
+def test_entries_survive_reopening(tmp_path):
+    """Test a reopened cache sees earlier writes and their total size."""
+    path = str(tmp_path / "cache.db")
+    cache = DiskCache(path, max_bytes=1 << 20)
+    cache.set("key", {"id": "user1"}, time.time() + 60)
+    size = cache.size
+    cache.close()
+
+    reopened = DiskCache(path, max_bytes=1 << 20)
+    assert reopened.get("key")[0] == {"id": "user1"}
+    assert reopened.size == size
+    reopened.close()
+
+
+def test_eviction_drops_soonest_expiring(disk):
+    """Test that exceeding max_bytes evicts the entries expiring first."""
+    now = time.time()
+    disk.set("later", b"x" * 400, now + 600)
+    disk.set("soon", b"x" * 400, now + 10)
+    disk.max_bytes = 1000
+    disk.set("new", b"x" * 400, now + 300)
+    assert disk.get("soon") is None
+    assert disk.get("later") is not None
+    assert disk.get("new") is not None
+    assert disk.size <= 1000
+
+
+def test_size_is_recounted_before_evicting(tmp_path):
+    """Test removals by another worker don't trigger a needless eviction."""
+    path = str(tmp_path / "cache.db")
+    first = DiskCache(path, max_bytes=1000)
+    second = DiskCache(path, max_bytes=1000)
+    first.set("a", b"x" * 400, time.time() + 10)
+    first.set("b", b"x" * 400, time.time() + 20)
+    assert second.pop("a")
+    assert not second.pop("a")
+
+    # first still counts "a", but the table only holds "b" and "c"
+    first.set("c", b"x" * 400, time.time() + 30)
+    assert first.get("b") is not None
+    reopened = DiskCache(path, max_bytes=1000)
+    assert first.size == reopened.size
+    for cache in (first, second, reopened):
+        cache.close()
+
+
+def test_unreadable_entry_is_a_miss(disk):
+    """Test that a body that no longer unpickles is dropped."""
+    disk.set("key", "value", time.time() + 60)
+    with disk._db:
+        disk._db.execute("UPDATE entries SET value = X'00'")
+    assert disk.get("key") is None
+    assert len(disk) == 0
+
+
+@pytest.mark.asyncio
+async def test_restarted_worker_comes_back_warm():
+    """Test that an emptied memory cache is refilled from disk, not Spotify."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        client = mock_spotify.return_value
+        client.current_user_top_tracks.return_value = {
+            "items": [{"id": "track1", "name": "Song"}]
+        }
+        await SpotifyService("test_token").get_top_tracks()
+
+        # Simulate a restart: fresh in-memory cache and disk connection
+        get_response_cache().clear()
+        get_disk_cache.cache_clear()
+        client.current_user_top_tracks.reset_mock()
+
+        tracks = await SpotifyService("test_token").get_top_tracks()
+        assert [track["id"] for track in tracks] == ["track1"]
+        client.current_user_top_tracks.assert_not_called()
+        # The disk hit was promoted back into memory
+        assert len(get_response_cache()) == 1
+
+
+@pytest.mark.asyncio
+async def test_profile_refresh_writes_disk_only_on_change():
+    """Test per-request profile refreshes store only id and country, once."""
+    profile = {"id": "user1", "country": "SE", "email": "me@example.com"}
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user.return_value = profile
+        service = SpotifyService("test_token")
+        with patch.object(
+            DiskCache, "set", autospec=True, side_effect=DiskCache.set
+        ) as write:
+            for _ in range(3):
+                assert await service.get_profile(refresh=True) == profile
+            assert write.call_count == 1
+
+            mock_spotify.return_value.current_user.return_value = {
+                **profile,
+                "country": "NO",
+            }
+            await service.get_profile(refresh=True)
+            assert write.call_count == 2
+
+    stored, _ = get_disk_cache().get(service.profile_key())
+    assert stored == {"id": "user1", "country": "NO"}
+    # After a restart the session is still known, without the PII
+    get_profile_cache().clear()
+    assert await service.last_known_profile() == stored
@@ -0,0 +1,178 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.auth import get_current_user_id
+from app.core.config import get_settings
+from app.main import app
+from app.services.activity import ActivityTracker
+from app.services.history import (
+    SnapshotJob,
+    SnapshotStore,
+    apply_edits,
+    diff_ids,
+    get_snapshot_store,
+)
+
+client = TestClient(app)
+
+DAY = date(2024, 1, 1)
+
+
+def ranked(*ids):
+    return [{"id": item_id, "name": item_id.title()} for item_id in ids]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / "history.db"), keyframe_days=30)
+    yield store
+    store.close()
+
+
+def test_diff_ids_round_trip():
+    """Test that applying an edit script rebuilds the new list."""
+    previous = [1, 2, 3, 4, 5]
+    current = [2, 1, 3, 6, 5, 7]
+    edits = diff_ids(previous, current)
+    assert apply_edits(previous, edits) == current
+    assert diff_ids(current, current) == []
+
+
+def test_unchanged_day_writes_nothing(store):
+    """Test that a day with the same list as the previous one is skipped."""
+    assert store.record("user", "tracks", "short_term", DAY, ranked("a", "b")) > 0
+    next_day = DAY + timedelta(days=1)
+    assert store.record("user", "tracks", "short_term", next_day, ranked("a", "b")) == 0
+    # The skipped day still reads as the previous list
+    assert [
+        i["id"] for i in store.snapshot("user", "tracks", "short_term", next_day)
+    ] == [
+        "a",
+        "b",
+    ]
+
+
+def test_delta_is_smaller_than_keyframe(store):
+    """Test that a small rank change is stored as a short edit script."""
+    items = ranked(*(f"track{i}" for i in range(50)))
+    keyframe = store.record("user", "tracks", "short_term", DAY, items)
+    items[0], items[1] = items[1], items[0]
+    delta = store.record("user", "tracks", "short_term", DAY + timedelta(1), items)
+    assert 0 < delta < keyframe
+
+
+def test_items_without_id_are_skipped(store):
+    """Test a local file in a top list does not abort the capture."""
+    local = {"id": None, "name": "Demo", "uri": "spotify:local:::Demo:180"}
+    items = [ranked("a")[0], local, ranked("b")[0]]
+    assert store.record("user", "tracks", "short_term", DAY, items) > 0
+    snapshot = store.snapshot("user", "tracks", "short_term", DAY)
+    assert [(i["id"], i["rank"]) for i in snapshot] == [("a", 1), ("b", 2)]
+
+
+def test_snapshot_reads_any_day(store):
+    """Test reconstruction of past days, across a keyframe boundary."""
+    store.keyframe_days = 2
+    lists = [ranked("a", "b"), ranked("b", "a"), ranked("b", "c"), ranked("c")]
+    for offset, items in enumerate(lists):
+        store.record("user", "artists", "long_term", DAY + timedelta(offset), items)
+
+    assert store.snapshot("user", "artists", "long_term", DAY - timedelta(1)) is None
+    for offset, items in enumerate(lists):
+        snapshot = store.snapshot(
+            "user", "artists", "long_term", DAY + timedelta(offset)
+        )
+        assert [i["id"] for i in snapshot] == [i["id"] for i in items]
+    assert store.snapshot("user", "artists", "long_term", DAY)[1] == {
+        "id": "b",
+        "name": "B",
+        "rank": 2,
+    }
+    # Other users and lists are independent
+    assert store.snapshot("other", "artists", "long_term", DAY) is None
+    assert store.snapshot("user", "tracks", "long_term", DAY) is None
+
+
+def test_rank_history_series(store):
+    """Test the daily rank series of one item, spanning a keyframe."""
+    store.keyframe_days = 2
+    lists = [ranked("a", "b"), ranked("b", "a"), ranked("b", "c"), ranked("a", "c")]
+    for offset, items in enumerate(lists):
+        store.record("user", "tracks", "short_term", DAY + timedelta(offset), items)
+
+    series = store.rank_history(
+        "user", "tracks", "short_term", "a", DAY - timedelta(1), DAY + timedelta(4)
+    )
+    assert [point["rank"] for point in series] == [None, 1, 2, None, 1, 1]
+    assert series[0]["date"] == (DAY - timedelta(1)).isoformat()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_job_captures_each_user_once_per_day(store):
+    """Test a check captures all six lists and skips already captured users."""
+    tracker = ActivityTracker()
+    tracker.touch("user1", "token1")
+    job = SnapshotJob(
+        store,
+        tracker,
+        check_interval_seconds=3600,
+        active_window_seconds=86400,
+        concurrency=2,
+    )
+
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user_top_tracks.return_value = {
+            "items": ranked("t1", "t2")
+        }
+        mock_spotify.return_value.current_user_top_artists.return_value = {
+            "items": ranked("a1")
+        }
+
+        counts = await job.run_once(DAY)
+        assert counts["captured"] == 1
+        assert counts["bytes"] > 0
+        assert store.last_captured("user1") == DAY
+        assert [
+            i["id"] for i in store.snapshot("user1", "tracks", "medium_term", DAY)
+        ] == ["t1", "t2"]
+
+        assert (await job.run_once(DAY))["captured"] == 0
+
+
+def test_history_endpoints(tmp_path, monkeypatch):
+    """Test /spotify/history/top and /spotify/history/rank."""
+    monkeypatch.setattr(get_settings(), "HISTORY_DB_PATH", str(tmp_path / "h.db"))
+    get_snapshot_store.cache_clear()
+    app.dependency_overrides[get_current_user_id] = lambda: "user"
+    try:
+        store = get_snapshot_store()
+        store.record("user", "tracks", "medium_term", DAY, ranked("a", "b", "c"))
+
+        response = client.get(
+            "/spotify/history/top", params={"date": "2024-01-02", "limit": 2}
+        )
+        assert response.status_code == 200
+        assert [i["id"] for i in response.json()["items"]] == ["a", "b"]
+
+        response = client.get("/spotify/history/top", params={"date": "2023-12-31"})
+        assert response.status_code == 404
+
+        response = client.get(
+            "/spotify/history/rank",
+            params={"item_id": "b", "start": "2024-01-01", "end": "2024-01-02"},
+        )
+        assert response.status_code == 200
+        assert [p["rank"] for p in response.json()["series"]] == [2, 2]
+
+        response = client.get(
+            "/spotify/history/rank",
+            params={"item_id": "b", "start": "2022-01-01", "end": "2024-01-02"},
+        )
+        assert response.status_code == 400
+        store.close()
+    finally:
+        app.dependency_overrides = {}
+        get_snapshot_store.cache_clear()
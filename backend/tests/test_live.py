@@ -0,0 +1,129 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from spotipy.exceptions import SpotifyException
+
+from app.main import app
+from app.services.live import (
+    STREAM_CLOSED,
+    RecentlyPlayedHub,
+    SessionPoller,
+    played_at_ms,
+)
+from app.services.spotify import SpotifyService
+
+client = TestClient(app)
+
+MOCK_HISTORY = {
+    "items": [
+        {"track": {"id": "track1"}, "played_at": "2024-01-01T01:00:00.000Z"},
+        {"track": {"id": "track2"}, "played_at": "2024-01-01T00:00:00.000Z"},
+    ]
+}
+
+ALBUM_IMAGES = [{"url": "https://i.scdn.co/image/" + "ab" * 20, "width": 640}]
+
+MOCK_NEW_PLAYS = {
+    "items": [
+        {
+            "track": {"id": "track3", "album": {"images": ALBUM_IMAGES}},
+            "played_at": "2024-01-01T02:00:00.000Z",
+        }
+    ]
+}
+
+
+def test_played_at_ms():
+    """Test that played_at timestamps convert to unix milliseconds."""
+    assert played_at_ms({"played_at": "1970-01-01T00:00:01.500Z"}) == 1500
+
+
+@pytest.mark.asyncio
+async def test_poller_broadcasts_only_new_plays():
+    """Test that the first poll sets the cursor and later polls push deltas."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        upstream = mock_spotify.return_value.current_user_recently_played
+        upstream.side_effect = [MOCK_HISTORY, MOCK_NEW_PLAYS]
+
+        poller = SessionPoller(SpotifyService("token1"), interval_seconds=60)
+        first, second = asyncio.Queue(), asyncio.Queue()
+        poller.subscribers.update({first, second})
+
+        assert await poller.poll_once() == []
+        assert first.empty()
+
+        await poller.poll_once()
+        upstream.assert_called_with(
+            limit=50, after=played_at_ms(MOCK_HISTORY["items"][0])
+        )
+        plays = first.get_nowait()
+        assert [play["track"]["id"] for play in plays] == ["track3"]
+        assert plays[0]["track"]["album"]["thumbnail_url"] == (
+            f"/images/{'ab' * 20}/320.webp"
+        )
+        assert second.get_nowait() == plays
+        assert poller.cursor == played_at_ms(MOCK_NEW_PLAYS["items"][0])
+
+
+@pytest.mark.asyncio
+async def test_poller_closes_streams_on_expired_token():
+    """Test that subscribers are told to close when the token is rejected."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user_recently_played.side_effect = (
+            SpotifyException(401, -1, "The access token expired")
+        )
+        poller = SessionPoller(SpotifyService("token1"), interval_seconds=60)
+        queue = asyncio.Queue()
+        poller.subscribers.add(queue)
+
+        await poller.run()
+        assert queue.get_nowait() is STREAM_CLOSED
+
+
+@pytest.mark.asyncio
+async def test_poller_survives_unexpected_errors():
+    """Test a malformed item is logged and polling carries on."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user_recently_played.side_effect = [
+            {"items": [{"track": {"id": "track1"}}]},
+            MOCK_HISTORY,
+        ]
+        poller = SessionPoller(SpotifyService("token1"), interval_seconds=0)
+        task = asyncio.create_task(poller.run())
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if poller.cursor is not None:
+                break
+        assert not task.done()
+        task.cancel()
+    assert poller.cursor == played_at_ms(MOCK_HISTORY["items"][0])
+
+
+@pytest.mark.asyncio
+async def test_hub_shares_one_poller_per_session():
+    """Test that tabs of one session share a poller that stops with the last."""
+    hub = RecentlyPlayedHub(interval_seconds=60)
+    with patch("spotipy.Spotify"):
+        first = hub.subscribe("token1")
+        second = hub.subscribe("token1")
+        other = hub.subscribe("token2")
+
+        assert hub.subscriber_count("token1") == 2
+        assert len(hub._pollers) == 2
+        task = hub._pollers[SpotifyService.session_key_for("token1")].task
+
+        hub.unsubscribe("token1", first)
+        assert not task.cancelled()
+        hub.unsubscribe("token1", second)
+        hub.unsubscribe("token2", other)
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        assert hub.subscriber_count("token1") == 0
+
+
+def test_stream_requires_authentication():
+    """Test that the stream rejects requests without a token."""
+    response = client.get("/spotify/recently-played/stream")
+    assert response.status_code == 401
@@ -0,0 +1,197 @@
+import asyncio
+import base64
+import time
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import get_settings
+from app.core.disk_cache import DiskCache
+from app.main import app
+from app.services.oauth import OAuthError, OAuthStateStore, SpotifyOAuthClient
+
+client = TestClient(app)
+
+EXCHANGE_CODE = "app.services.oauth.SpotifyOAuthClient.exchange_code"
+
+
+def make_client(handler, concurrency: int = 4) -> SpotifyOAuthClient:
+    return SpotifyOAuthClient(
+        client_id="id",
+        client_secret="secret",
+        redirect_uri="http://127.0.0.1:8000/callback",
+        scope="user-top-read",
+        concurrency=concurrency,
+        timeout_seconds=5,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+@pytest.mark.asyncio
+async def test_state_is_single_use_and_expires(tmp_path):
+    """Test states are accepted once and not after expiry, in both stores."""
+    disk = DiskCache(str(tmp_path / "cache.db"), max_bytes=1 << 20)
+    for store in (OAuthStateStore(60, 100), OAuthStateStore(60, 100, disk=disk)):
+        state = await store.issue()
+        assert await store.consume(state)
+        assert not await store.consume(state)
+        assert not await store.consume("forged")
+
+        store.ttl_seconds = -1
+        assert not await store.consume(await store.issue())
+    disk.close()
+
+
+@pytest.mark.asyncio
+async def test_exchange_code_request():
+    """Test the code exchange posts the form with client credentials."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(
+            200, json={"access_token": "access", "refresh_token": "refresh"}
+        )
+
+    token_info = await make_client(handler).exchange_code("the_code")
+    assert token_info["access_token"] == "access"
+    request = requests[0]
+    assert request.url == "https://accounts.spotify.com/api/token"
+    assert request.headers["authorization"] == (
+        "Basic " + base64.b64encode(b"id:secret").decode()
+    )
+    form = parse_qs(request.content.decode())
+    assert form["grant_type"] == ["authorization_code"]
+    assert form["code"] == ["the_code"]
+
+
+@pytest.mark.asyncio
+async def test_token_errors_raise_oauth_error():
+    """Test Spotify's error description is surfaced."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            400,
+            json={"error": "invalid_grant", "error_description": "Invalid code"},
+        )
+
+    with pytest.raises(OAuthError, match="Invalid code"):
+        await make_client(handler).exchange_code("bad")
+
+
+@pytest.mark.asyncio
+async def test_refresh_keeps_refresh_token():
+    """Test a refresh without a rotated refresh token keeps the old one."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"access_token": "new_access"})
+
+    token_info = await make_client(handler).refresh_access_token("old_refresh")
+    assert token_info == {"access_token": "new_access", "refresh_token": "old_refresh"}
+
+
+@pytest.mark.asyncio
+async def test_token_requests_are_bounded():
+    """Test that no more than ``concurrency`` exchanges are in flight."""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"access_token": "a", "refresh_token": "r"})
+
+    oauth = make_client(handler, concurrency=3)
+    started = time.perf_counter()
+    await asyncio.gather(*(oauth.exchange_code(str(i)) for i in range(12)))
+    assert peak == 3
+    # Exchanges overlap rather than running one after another
+    assert time.perf_counter() - started < 12 * 0.01
+
+
+def test_login_redirect_carries_state():
+    """Test /login redirects to Spotify's authorize URL with a fresh state."""
+    response = client.get("/login", follow_redirects=False)
+    location = urlparse(response.headers["location"])
+    assert location.netloc == "accounts.spotify.com"
+    query = parse_qs(location.query)
+    assert query["response_type"] == ["code"]
+    assert len(query["state"][0]) >= 32
+
+
+def start_login(browser: TestClient) -> str:
+    """Start a login in ``browser`` and return its state."""
+    login = urlparse(browser.get("/login", follow_redirects=False).headers["location"])
+    return parse_qs(login.query)["state"][0]
+
+
+def test_callback_rejects_missing_or_reused_state():
+    """Test the callback only accepts a state issued by /login, once."""
+    token_info = {"access_token": "access", "refresh_token": "refresh"}
+    with patch(EXCHANGE_CODE, return_value=token_info) as exchange:
+        response = client.get(
+            "/callback", params={"code": "code"}, follow_redirects=False
+        )
+        assert "error=" in response.headers["location"]
+        exchange.assert_not_called()
+
+        state = start_login(client)
+        params = {"code": "code", "state": state}
+        response = client.get("/callback", params=params, follow_redirects=False)
+        assert "token=" in response.headers["location"]
+        # The state cookie is cleared once used
+        assert 'spotifeye_oauth_state=""' in response.headers["set-cookie"]
+
+        response = client.get("/callback", params=params, follow_redirects=False)
+        assert "error=" in response.headers["location"]
+        assert exchange.call_count == 1
+
+
+def test_state_cookie_secure_follows_redirect_scheme():
+    """Test the state cookie is Secure only for an https redirect URI."""
+    cookie = client.get("/login", follow_redirects=False).headers["set-cookie"]
+    assert "secure" not in cookie.lower()
+
+    settings = get_settings()
+    settings.SPOTIFY_REDIRECT_URI = "https://spotifeye.example/callback"
+    cookie = client.get("/login", follow_redirects=False).headers["set-cookie"]
+    assert "secure" in cookie.lower()
+
+    settings.OAUTH_STATE_COOKIE_SECURE = False
+    try:
+        cookie = client.get("/login", follow_redirects=False).headers["set-cookie"]
+        assert "secure" not in cookie.lower()
+    finally:
+        settings.OAUTH_STATE_COOKIE_SECURE = None
+
+
+def test_callback_rejects_state_from_another_browser():
+    """Test a callback link from someone else's login is refused (login CSRF)."""
+    attacker = TestClient(app)
+    victim = TestClient(app)
+    token_info = {"access_token": "access", "refresh_token": "refresh"}
+    with patch(EXCHANGE_CODE, return_value=token_info) as exchange:
+        state = start_login(attacker)
+        response = victim.get(
+            "/callback",
+            params={"code": "attacker_code", "state": state},
+            follow_redirects=False,
+        )
+        assert "error=" in response.headers["location"]
+        exchange.assert_not_called()
+
+        # A victim with a login of their own in progress is refused too
+        start_login(victim)
+        response = victim.get(
+            "/callback",
+            params={"code": "attacker_code", "state": state},
+            follow_redirects=False,
+        )
+        assert "error=" in response.headers["location"]
+        exchange.assert_not_called()
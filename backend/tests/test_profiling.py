@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import get_settings
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    """Configure profiling and rebuild the middleware stack around the test."""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "PROFILING_SECRET", "let-me-see")
+    monkeypatch.setattr(settings, "PROFILING_OUTPUT_DIR", str(tmp_path))
+    app.middleware_stack = None
+    yield settings
+    app.middleware_stack = None
+
+
+def test_debug_header_profiles_request(profiling, tmp_path):
+    """Test a request with the admin secret is saved as a speedscope profile."""
+    response = client.get("/", headers={"X-Profile": "let-me-see"})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+    assert "-GET-root-" in profile_id
+
+    with open(tmp_path / f"{profile_id}.speedscope.json") as f:
+        profile = json.load(f)
+    assert profile["$schema"].startswith("https://www.speedscope.app/")
+
+
+def test_wrong_secret_is_not_profiled(profiling, tmp_path):
+    """Test that an unknown secret or no header leaves the request alone."""
+    for headers in ({"X-Profile": "guess"}, {}):
+        response = client.get("/", headers=headers)
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+    assert os.listdir(tmp_path) == []
+
+
+def test_sampled_requests_are_profiled_as_html(profiling, monkeypatch, tmp_path):
+    """Test the sample rate profiles requests without the header."""
+    monkeypatch.setattr(profiling, "PROFILING_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "PROFILING_FORMAT", "html")
+    app.middleware_stack = None
+
+    response = client.get("/spotify/top-tracks")
+    assert response.status_code == 403
+    assert os.listdir(tmp_path) == [f"{response.headers['x-profile-id']}.html"]
+
+
+def test_oldest_profiles_are_pruned(profiling, monkeypatch, tmp_path):
+    """Test that saving past PROFILING_MAX_FILES deletes the oldest profiles."""
+    monkeypatch.setattr(profiling, "PROFILING_MAX_FILES", 2)
+    app.middleware_stack = None
+    (tmp_path / "notes.txt").write_text("not a profile")
+    ids = []
+    for _ in range(3):
+        response = client.get("/", headers={"X-Profile": "let-me-see"})
+        ids.append(response.headers["x-profile-id"])
+        # Give each profile a distinct, increasing mtime
+        for n, profile_id in enumerate(ids):
+            path = tmp_path / f"{profile_id}.speedscope.json"
+            if path.exists():
+                os.utime(path, (n, n))
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["notes.txt"] + [f"{profile_id}.speedscope.json" for profile_id in ids[1:]]
+    )
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from spotipy.exceptions import SpotifyException
+
+from app.api.auth import create_access_token
+from app.core.ratelimit import RateLimiter
+from app.core.resilience import CircuitBreaker, CircuitOpenError, UpstreamEndpoint
+from app.main import app
+from app.services.spotify import (
+    SpotifyService,
+    get_profile_cache,
+    get_response_cache,
+    get_upstream,
+    is_upstream_failure,
+)
+
+client = TestClient(app)
+
+
+def upstream_error(status: int) -> SpotifyException:
+    return SpotifyException(status, -1, f"HTTP {status}")
+
+
+def make_endpoint(threshold: int = 2, reset_seconds: float = 30) -> UpstreamEndpoint:
+    return UpstreamEndpoint(
+        "test",
+        CircuitBreaker(failure_threshold=threshold, reset_seconds=reset_seconds),
+        is_failure=is_upstream_failure,
+        hedge_min_samples=5,
+    )
+
+
+def fail_with(error: Exception):
+    def fetch():
+        raise error
+
+    return fetch
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_consecutive_failures():
+    """Test that repeated 5xx responses open the circuit and calls fail fast."""
+    endpoint = make_endpoint(threshold=2)
+    for _ in range(2):
+        with pytest.raises(SpotifyException):
+            await endpoint.call(fail_with(upstream_error(502)))
+    assert endpoint.breaker.state == CircuitBreaker.OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError) as error:
+        await endpoint.call(lambda: calls.append(1))
+    assert calls == []
+    assert error.value.status_code == 503
+    assert int(error.value.headers["Retry-After"]) >= 1
+    assert endpoint.metrics()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_trip_the_breaker():
+    """Test that a 401 for one user's token counts as Spotify responding."""
+    endpoint = make_endpoint(threshold=1)
+    with pytest.raises(SpotifyException):
+        await endpoint.call(fail_with(upstream_error(401)))
+    assert endpoint.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_breaker_half_opens_with_a_single_trial():
+    """Test the trial call after the reset period closes or reopens it."""
+    endpoint = make_endpoint(threshold=1, reset_seconds=0.01)
+    with pytest.raises(SpotifyException):
+        await endpoint.call(fail_with(upstream_error(500)))
+    await asyncio.sleep(0.02)
+    assert endpoint.breaker.state == CircuitBreaker.HALF_OPEN
+
+    with pytest.raises(SpotifyException):
+        await endpoint.call(fail_with(upstream_error(500)))
+    assert endpoint.breaker.state == CircuitBreaker.OPEN
+    assert endpoint.breaker.times_opened == 2
+
+    await asyncio.sleep(0.02)
+    assert await endpoint.call(lambda: "ok") == "ok"
+    assert endpoint.breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_over_slow_attempt():
+    """Test that a second attempt is sent after the p95 and the faster wins."""
+    endpoint = make_endpoint()
+    for _ in range(5):
+        endpoint.latency.add(0.01)
+    attempts = []
+
+    def fetch():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(0.3)
+            return "slow"
+        return "fast"
+
+    assert await endpoint.call(fetch, hedge=True) == "fast"
+    metrics = endpoint.metrics()
+    assert metrics["hedged"] == 1
+    assert metrics["hedge_win_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_hedge_needs_a_rate_limiter_token():
+    """Test that no hedge is sent while the rate limiter has no token to spare."""
+    endpoint = make_endpoint()
+    # The primary attempt takes the only token
+    endpoint.limiter = RateLimiter(rate=0.001, burst=1)
+    for _ in range(5):
+        endpoint.latency.add(0.01)
+    attempts = []
+
+    def fetch():
+        attempts.append(1)
+        time.sleep(0.05)
+        return "primary"
+
+    assert await endpoint.call(fetch, hedge=True) == "primary"
+    assert len(attempts) == 1
+    assert endpoint.metrics()["hedges_throttled"] == 1
+    assert endpoint.hedged == 0
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_leaves_the_rate_limiter_alone():
+    """Test calls rejected by an open circuit take no rate limiter token."""
+    endpoint = make_endpoint(threshold=1)
+    endpoint.limiter = RateLimiter(rate=0.001, burst=2)
+    with pytest.raises(SpotifyException):
+        await endpoint.call(fail_with(upstream_error(503)))
+    for _ in range(5):
+        with pytest.raises(CircuitOpenError):
+            await endpoint.call(lambda: "ok")
+    assert endpoint.limiter.try_acquire()
+
+
+@pytest.mark.asyncio
+async def test_hedge_not_sent_without_latency_samples():
+    """Test that hedging waits until the endpoint's p95 is known."""
+    endpoint = make_endpoint()
+    assert await endpoint.call(lambda: "ok", hedge=True) == "ok"
+    assert endpoint.hedged == 0
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_serves_stale_cache():
+    """Test that an expired cache entry is served while the circuit is open."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        service = SpotifyService("test_token")
+        key = service.cache_key("top-tracks", limit=20, time_range="medium_term")
+        mock_spotify.return_value.current_user_top_tracks.return_value = {
+            "items": [{"id": "track1", "name": "Old"}]
+        }
+        await service.get_top_tracks()
+        get_response_cache().set(key, get_response_cache().get(key), time.time() - 1)
+
+        breaker = get_upstream("top-tracks").breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        mock_spotify.return_value.current_user_top_tracks.reset_mock()
+
+        tracks = await service.get_top_tracks()
+        assert [track["id"] for track in tracks] == ["track1"]
+        mock_spotify.return_value.current_user_top_tracks.assert_not_called()
+
+        # A refresh must not pass stale data off as fresh
+        with pytest.raises(HTTPException) as error:
+            await service.get_top_tracks(refresh=True)
+        assert error.value.status_code == 503
+
+
+def test_auth_probe_fails_fast_while_spotify_is_down():
+    """Test a 5xx from the auth probe is not turned into a logout."""
+    token = create_access_token({"sub": "test_token"})
+    headers = {"Authorization": f"Bearer {token}"}
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user.side_effect = upstream_error(502)
+        mock_spotify.return_value.current_user_top_tracks.return_value = {"items": []}
+
+        response = client.get("/spotify/top-tracks", headers=headers)
+        assert response.status_code == 502
+
+        # A session Spotify accepted before keeps working
+        get_profile_cache().set(
+            SpotifyService("test_token").profile_key(),
+            {"id": "user1"},
+            time.time() - 1,
+        )
+        response = client.get("/spotify/top-tracks", headers=headers)
+        assert response.status_code == 200
+
+
+def test_upstream_metrics_endpoint():
+    """Test /metrics/upstream reports breaker state per endpoint."""
+    get_upstream("top-tracks").breaker.record_failure()
+    response = client.get("/metrics/upstream")
+    assert response.status_code == 200
+    endpoint = response.json()["endpoints"]["top-tracks"]
+    assert endpoint["state"] == "closed"
+    assert endpoint["consecutive_failures"] == 1
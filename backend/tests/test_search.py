@@ -0,0 +1,251 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.api.auth import get_current_user, get_current_user_id
+from app.main import app
+from app.services.history import get_snapshot_store
+from app.services.search import (
+    SearchIndex,
+    SearchIndexes,
+    get_search_indexes,
+    normalise,
+    record_plays,
+    user_index,
+)
+from app.services.spotify import SpotifyService, get_profile_cache
+
+client = TestClient(app)
+
+
+def artist(name):
+    return {"id": name.lower().replace(" ", "-"), "name": name}
+
+
+def track(name, artists, album):
+    return {
+        "id": name.lower().replace(" ", "-"),
+        "name": name,
+        "artists": [artist(a) for a in artists],
+        "album": {"id": album.lower(), "name": album, "artists": [artist(artists[0])]},
+    }
+
+
+def play(item, minute):
+    return {"track": item, "played_at": f"2024-05-01T12:{minute:02d}:00.000Z"}
+
+
+CREEP = track("Creep", ["Radiohead"], "Pablo Honey")
+KARMA = track("Karma Police", ["Radiohead"], "OK Computer")
+HALO = track("Halo", ["Beyoncé"], "I Am... Sasha Fierce")
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.add_plays([play(KARMA, 3), play(KARMA, 2), play(CREEP, 1), play(HALO, 0)])
+    index.add_top("tracks", "short_term", [HALO, CREEP])
+    index.add_top("artists", "short_term", [artist("Radiohead")])
+    return index
+
+
+def names(results):
+    return [(result["kind"], result["name"]) for result in results]
+
+
+def test_normalise():
+    """Test accents, case and punctuation are folded away."""
+    assert normalise("  Beyoncé — I Am... Sasha FIERCE ") == "beyonce i am sasha fierce"
+
+
+def test_search_ranks_name_matches_then_plays(index):
+    """Test an artist search lists the artist, then their most played work."""
+    results = index.search("radiohead")
+    assert names(results) == [
+        ("artist", "Radiohead"),
+        ("track", "Karma Police"),
+        ("album", "OK Computer"),
+        ("track", "Creep"),
+        ("album", "Pablo Honey"),
+    ]
+    assert results[0]["plays"] == 3
+    assert results[0]["ranks"] == {
+        "short_term": 1,
+        "medium_term": None,
+        "long_term": None,
+    }
+    assert results[1]["last_played_at"] == "2024-05-01T12:03:00+00:00"
+    assert results[3]["ranks"]["short_term"] == 2
+
+    assert names(index.search("beyonce", kinds=("track",))) == [("track", "Halo")]
+    assert names(index.search("ok c")) == [
+        ("album", "OK Computer"),
+        ("track", "Karma Police"),
+    ]
+    assert names(index.search("olic")) == [("track", "Karma Police")]
+    assert index.search("radiohead", limit=2) == results[:2]
+    assert index.search("zz") == []
+
+
+def test_plays_are_counted_once(index):
+    """Test re-ingesting overlapping recent plays only adds the new ones."""
+    assert index.add_plays([play(CREEP, 4), play(KARMA, 3), play(CREEP, 1)]) == 1
+    creep = index.search("creep")[0]
+    assert creep["plays"] == 2
+    assert creep["last_played_at"] == "2024-05-01T12:04:00+00:00"
+
+
+def test_replaced_top_list_drops_old_ranks(index):
+    """Test a new top list replaces the ranks of the previous one."""
+    index.add_top("tracks", "short_term", [KARMA])
+    assert index.search("creep")[0]["ranks"]["short_term"] is None
+    assert index.search("karma")[0]["ranks"]["short_term"] == 1
+
+
+def test_trigram_false_positive_is_demoted():
+    """Test a name holding the query's trigrams but not the word ranks lower."""
+    index = SearchIndex()
+    heat = track("Heat Bread", ["Headroom"], "Loaf")
+    lights = track("Headlights", ["Someone"], "Cars")
+    index.add_plays([play(heat, minute) for minute in range(5)])
+    index.add_plays([play(lights, 10)])
+    assert names(index.search("head", kinds=("track",))) == [
+        ("track", "Headlights"),
+        ("track", "Heat Bread"),
+    ]
+    assert names(index.search("bread hea")) == [("track", "Heat Bread")]
+
+
+def test_indexes_evict_idle_and_least_recent_users():
+    """Test eviction by idle time and by the user limit."""
+    indexes = SearchIndexes(max_users=2, idle_seconds=60)
+    first = indexes.get("a")
+    indexes.get("b")
+    assert indexes.get("a") is first
+    indexes.get("c")
+    assert "b" not in indexes and "a" in indexes
+
+    indexes.evict(indexes.get("c").used_at + 61)
+    assert len(indexes) == 0
+
+
+@pytest.mark.asyncio
+async def test_recorded_plays_evict_idle_indexes():
+    """Test idle indexes go even when no one searches again."""
+    indexes = get_search_indexes()
+    indexes.get("idle").used_at -= indexes.idle_seconds + 1
+    await record_plays("user1", [play(CREEP, 1)])
+    assert "idle" not in indexes
+
+
+def test_search_history_endpoint():
+    """Test the endpoint indexes cached lists once and answers searches."""
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    app.dependency_overrides[get_current_user_id] = lambda: "user1"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            sp = mock_spotify.return_value
+            sp.current_user_top_tracks.return_value = {"items": [CREEP, KARMA]}
+            sp.current_user_top_artists.return_value = {"items": [artist("Radiohead")]}
+            sp.current_user_recently_played.return_value = {
+                "items": [play(HALO, 1), play(CREEP, 0)]
+            }
+            response = client.get("/spotify/search-history?q=radio&kind=track")
+            again = client.get("/spotify/search-history?q=halo")
+            assert sp.current_user_recently_played.call_count == 1
+            assert sp.current_user_top_tracks.call_count == 3
+            assert client.get("/spotify/search-history?q=").status_code == 422
+    finally:
+        app.dependency_overrides = {}
+
+    body = response.json()
+    assert response.status_code == 200
+    assert names(body["results"]) == [("track", "Creep"), ("track", "Karma Police")]
+    assert body["results"][0]["ranks"]["medium_term"] == 1
+    assert body["indexed"] == 8
+    assert names(again.json()["results"]) == [("track", "Halo")]
+
+
+def signed_in(token="test_token"):
+    """Return a service whose session is known to belong to user1."""
+    service = SpotifyService(token)
+    get_profile_cache().set(service.profile_key(), {"id": "user1"}, time.time() + 60)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_fetched_plays_are_stored_and_outlive_the_index():
+    """Test plays fetched outside searches are counted, even after eviction."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        service = signed_in()
+        sp = mock_spotify.return_value
+        sp.current_user_top_tracks.return_value = {"items": []}
+        sp.current_user_top_artists.return_value = {"items": []}
+        recent = sp.current_user_recently_played
+        # As the dashboard or the cache warmer would fetch them
+        recent.return_value = {"items": [play(CREEP, 1), play(KARMA, 0)]}
+        await service.get_recently_played(limit=50)
+        recent.return_value = {"items": [play(HALO, 2), play(CREEP, 1)]}
+        await service.get_recently_played(limit=50, refresh=True)
+        assert len(get_snapshot_store().plays("user1")) == 3
+
+        # A new index, e.g. after eviction, starts from the stored plays
+        get_search_indexes.cache_clear()
+        index = await user_index(service, "user1")
+        assert [index.find("track", t["id"])["plays"] for t in (CREEP, KARMA)] == [
+            1,
+            1,
+        ]
+
+        # A loaded index counts new plays without waiting for its refresh
+        recent.return_value = {"items": [play(KARMA, 3), play(HALO, 2)]}
+        await service.get_recently_played(limit=50, refresh=True)
+        assert index.find("track", KARMA["id"])["plays"] == 2
+        assert index.find("artist", "radiohead")["plays"] == 3
+
+
+@pytest.mark.asyncio
+async def test_only_the_first_refresh_fails_searches():
+    """Test a failed top-up searches the index as it stands."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        service = signed_in()
+        sp = mock_spotify.return_value
+        sp.current_user_top_tracks.return_value = {"items": [CREEP]}
+        sp.current_user_top_artists.return_value = {"items": []}
+        sp.current_user_recently_played.return_value = {"items": []}
+        unavailable = AsyncMock(side_effect=HTTPException(503, "Unavailable"))
+        with patch("app.services.search.refresh_index", unavailable):
+            with pytest.raises(HTTPException):
+                await user_index(service, "user1")
+
+        index = await user_index(service, "user1")
+        index.refreshed_at -= 3600
+        with patch("app.services.search.refresh_index", unavailable):
+            assert await user_index(service, "user1") is index
+        assert names(index.search("creep")) == [("track", "Creep")]
+
+
+@pytest.mark.asyncio
+async def test_searches_wait_for_the_first_refresh():
+    """Test a search made while the index is first built finds its items."""
+    with patch("spotipy.Spotify") as mock_spotify:
+        service = signed_in()
+        sp = mock_spotify.return_value
+
+        def slow_top_tracks(**params):
+            time.sleep(0.05)
+            return {"items": [CREEP]}
+
+        sp.current_user_top_tracks.side_effect = slow_top_tracks
+        sp.current_user_top_artists.return_value = {"items": []}
+        sp.current_user_recently_played.return_value = {"items": []}
+        first, second = await asyncio.gather(
+            user_index(service, "user1"), user_index(service, "user1")
+        )
+        assert first is second
+        assert names(second.search("creep")) == [("track", "Creep")]
+        assert sp.current_user_top_tracks.call_count == 3
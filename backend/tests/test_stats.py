@@ -0,0 +1,130 @@
+import asyncio
+from unittest.mock import patch
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.api.auth import get_current_user
+from app.main import app
+from app.services.spotify import SpotifyService
+from app.services.stats import artist_stats, diversity, genre_stats, rank_weights
+
+client = TestClient(app)
+
+ARTISTS = [
+    {"id": "artist1", "name": "Test Artist 1", "genres": ["pop", "rock"]},
+    {"id": "artist2", "name": "Test Artist 2", "genres": ["rock", "blues"]},
+    {"id": "artist3", "name": "Test Artist 3", "genres": []},
+]
+
+TRACKS = [
+    {"id": "track1", "artists": [{"id": "artist1", "name": "Test Artist 1"}]},
+    {
+        "id": "track2",
+        "artists": [
+            {"id": "artist1", "name": "Test Artist 1"},
+            {"id": "artist2", "name": "Test Artist 2"},
+        ],
+    },
+]
+
+GENRES = ["blues", "pop", "rock"]
+VOCABULARY = {genre: i for i, genre in enumerate(GENRES)}
+
+
+def test_rank_weights_decay_linearly():
+    """Test that rank weights run from 1.0 down to 1/count."""
+    assert rank_weights(4).tolist() == [1.0, 0.75, 0.5, 0.25]
+    assert rank_weights(0).size == 0
+
+
+def test_diversity_indices():
+    """Test entropy, effective count and HHI on known distributions."""
+    even = diversity(np.array([0.5, 0.5, 0.0]))
+    assert even["effective_count"] == 2.0
+    assert even["concentration"] == 0.5
+    assert diversity(np.array([1.0]))["entropy"] == 0.0
+
+
+def test_genre_stats_weights_by_rank():
+    """Test genre weights, shares and co-occurrence for a top-artists list."""
+    stats = genre_stats(ARTISTS, VOCABULARY, GENRES, limit=10)
+
+    weights = {g["genre"]: g["weight"] for g in stats["genres"]}
+    # rock is credited by ranks 1 and 2 (1.0 + 2/3), pop by rank 1 only
+    assert weights == {"rock": 1.6667, "pop": 1.0, "blues": 0.6667}
+    assert stats["genres"][0]["genre"] == "rock"
+    assert stats["genre_count"] == 3
+    assert {tuple(p["genres"]) for p in stats["co_occurrence"]} == {
+        ("pop", "rock"),
+        ("blues", "rock"),
+    }
+
+
+def test_artist_stats_splits_track_credit():
+    """Test that a shared track's credit is split between its artists."""
+    stats = artist_stats(ARTISTS, TRACKS, limit=10)
+
+    shares = {a["id"]: a["track_share"] for a in stats["artists"]}
+    # track1 (weight 1.0) to artist1, track2 (0.5) split evenly
+    assert shares == {"artist1": 0.8333, "artist2": 0.1667}
+    assert stats["track_artist_count"] == 2
+    assert stats["artist_count"] == 3
+
+
+def test_artist_stats_empty_lists():
+    """Test that empty top lists produce empty statistics."""
+    stats = artist_stats([], [], limit=10)
+    assert stats["artists"] == []
+    assert stats["effective_count"] == 0.0
+
+
+def test_genre_stats_endpoint_is_memoised():
+    """Test /spotify/stats/genres covers all ranges and memoises the result."""
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            upstream = mock_spotify.return_value.current_user_top_artists
+            upstream.return_value = {"items": ARTISTS}
+
+            response = client.get("/spotify/stats/genres")
+            assert response.status_code == 200
+            data = response.json()
+            assert set(data) == {"short_term", "medium_term", "long_term", "combined"}
+            assert data["combined"]["genres"][0]["genre"] == "rock"
+            assert upstream.call_count == 3
+
+            assert client.get("/spotify/stats/genres").json() == data
+            assert upstream.call_count == 3
+
+            # A list refetched before the others (as learned TTLs allow)
+            upstream.return_value = {"items": ARTISTS[1:]}
+            asyncio.run(
+                SpotifyService("test_token").get_top_artists(
+                    limit=50, time_range="short_term", refresh=True
+                )
+            )
+            data = client.get("/spotify/stats/genres").json()
+            assert data["short_term"]["genre_count"] == 2
+            assert upstream.call_count == 4
+    finally:
+        app.dependency_overrides = {}
+
+
+def test_artist_stats_endpoint_single_range():
+    """Test /spotify/stats/artists for one time range."""
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            mock_spotify.return_value.current_user_top_artists.return_value = {
+                "items": ARTISTS
+            }
+            mock_spotify.return_value.current_user_top_tracks.return_value = {
+                "items": TRACKS
+            }
+
+            response = client.get("/spotify/stats/artists?time_range=short_term")
+            assert response.status_code == 200
+            assert list(response.json()) == ["short_term"]
+    finally:
+        app.dependency_overrides = {}
@@ -0,0 +1,155 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.auth import get_current_user, get_current_user_id
+from app.core.config import get_settings
+from app.main import app
+from app.services.activity import ActivityTracker
+from app.services.taste import TasteIndex, get_taste_index, taste_vector
+from app.services.warmer import CacheWarmer
+
+client = TestClient(app)
+
+
+def artists(*ids, genres=("pop",)):
+    return [{"id": artist_id, "genres": list(genres)} for artist_id in ids]
+
+
+def vector(*ids, genres=("pop",)):
+    settings = get_settings()
+    return taste_vector(
+        [artists(*ids, genres=genres)] * 3,
+        [[]] * 3,
+        settings.TASTE_ARTIST_BUCKETS,
+        settings.TASTE_GENRE_BUCKETS,
+    )
+
+
+def test_taste_vector_is_unit_length_and_fixed_size():
+    """Test vectors have the configured length and unit norm."""
+    v = taste_vector(
+        [artists("a", "b")],
+        [[{"popularity": 80, "explicit": True, "album": {"release_date": "2019"}}]],
+        64,
+        32,
+    )
+    assert v.shape == (64 + 32 + 4,)
+    assert v.dtype == np.float32
+    assert np.linalg.norm(v) == pytest.approx(1.0, abs=1e-6)
+
+
+def test_similar_tastes_score_higher():
+    """Test that overlapping artists and genres give higher similarity."""
+    me = vector("a", "b", "c")
+    close = vector("a", "b", "d")
+    far = vector("x", "y", "z", genres=("metal",))
+    assert float(me @ vector("a", "b", "c")) == pytest.approx(1.0, abs=1e-6)
+    assert float(me @ close) > float(me @ far)
+
+
+def test_index_top_k_and_persistence(tmp_path):
+    """Test top-k search, growth past capacity and reopening from disk."""
+    dim = len(vector("a"))
+    index = TasteIndex(str(tmp_path / "taste"), dim=dim, initial_capacity=2)
+    index.upsert("me", vector("a", "b", "c"))
+    index.upsert("close", vector("a", "b", "d"))
+    index.upsert("far", vector("x", "y", "z", genres=("metal",)))
+    index.upsert("same", vector("a", "b", "c"))
+
+    matches = index.most_similar(vector("a", "b", "c"), k=2, exclude="me")
+    assert [user_id for user_id, _ in matches] == ["same", "close"]
+    assert index.similarity("me", "same") == pytest.approx(1.0, abs=1e-6)
+    assert index.similarity("me", "unknown") is None
+
+    # Updating a user replaces their row in place
+    index.upsert("far", vector("a", "b", "c"))
+    assert len(index) == 4
+    index.flush()
+
+    index.set_discoverable("close", True)
+    matches = index.most_similar(
+        vector("a", "b", "c"), k=2, exclude="me", discoverable_only=True
+    )
+    assert [user_id for user_id, _ in matches] == ["close"]
+
+    reopened = TasteIndex(str(tmp_path / "taste"), dim=dim)
+    assert len(reopened) == 4
+    assert reopened.similarity("me", "far") == pytest.approx(1.0, abs=1e-6)
+    assert reopened.is_discoverable("close")
+    assert not reopened.is_discoverable("same")
+
+    # A different vector length starts a fresh index
+    assert len(TasteIndex(str(tmp_path / "taste"), dim=50)) == 0
+
+
+@pytest.mark.asyncio
+async def test_warmer_updates_taste_vector():
+    """Test that refreshing a user's top lists rebuilds their taste vector."""
+    tracker = ActivityTracker()
+    tracker.touch("user1", "token1")
+    warmer = CacheWarmer(
+        tracker=tracker,
+        interval_seconds=20,
+        lead_seconds=30,
+        concurrency=4,
+        active_window_seconds=3600,
+        max_pressure=0.5,
+    )
+    with patch("spotipy.Spotify") as mock_spotify:
+        client = mock_spotify.return_value
+        client.current_user_top_tracks.return_value = {"items": []}
+        client.current_user_top_artists.return_value = {"items": artists("a")}
+        client.current_user_recently_played.return_value = {"items": []}
+
+        await warmer.run_once()
+        assert get_taste_index().get("user1") is not None
+        # The vector was built from the cache the warmer just filled
+        assert client.current_user_top_artists.call_count == 3
+
+
+def test_taste_endpoints():
+    """Test /spotify/taste/compatibility and /spotify/taste/similar."""
+    index = get_taste_index()
+    index.upsert("friend", vector("a", "b", "c"))
+    index.upsert("stranger", vector("x", "y", genres=("metal",)))
+    index.upsert("private", vector("a", "b", "c"))
+    index.set_discoverable("friend", True)
+    index.set_discoverable("stranger", True)
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    app.dependency_overrides[get_current_user_id] = lambda: "me"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            mock_spotify.return_value.current_user_top_artists.return_value = {
+                "items": artists("a", "b", "c")
+            }
+            mock_spotify.return_value.current_user_top_tracks.return_value = {
+                "items": []
+            }
+
+            response = client.get("/spotify/taste/compatibility/friend")
+            assert response.status_code == 403
+            response = client.get("/spotify/taste/similar")
+            assert response.status_code == 403
+
+            response = client.put("/spotify/taste/discoverable?enabled=true")
+            assert response.json() == {"discoverable": True}
+
+            response = client.get("/spotify/taste/compatibility/friend")
+            assert response.status_code == 200
+            assert response.json()["score"] == 100
+
+            response = client.get("/spotify/taste/compatibility/nobody")
+            assert response.status_code == 404
+            # Users who have not opted in cannot be looked up or listed
+            response = client.get("/spotify/taste/compatibility/private")
+            assert response.status_code == 404
+
+            response = client.get("/spotify/taste/similar", params={"limit": 5})
+            assert response.status_code == 200
+            assert [m["user_id"] for m in response.json()] == ["friend", "stranger"]
+            assert index.get("me") is not None
+    finally:
+        app.dependency_overrides = {}
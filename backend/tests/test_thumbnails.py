@@ -0,0 +1,178 @@
+import asyncio
+import io
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api.auth import create_access_token
+from app.api.images import _thumbnail_service
+from app.main import app
+from app.models.compact import SPOTIFY_IMAGE_PREFIX
+from app.services.thumbnails import ThumbnailService, pick_variant
+
+client = TestClient(app)
+
+LARGE = "ab" * 20
+MEDIUM = "cd" * 20
+SMALL = "ef" * 20
+
+
+def jpeg(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 90)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def images(*variants):
+    return [
+        {"url": SPOTIFY_IMAGE_PREFIX + image_id, "width": width, "height": width}
+        for image_id, width in variants
+    ]
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """A stand-in for the Spotify CDN, and a service fetching from it."""
+    requests = []
+    source = jpeg(640, 640)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        await asyncio.sleep(0.01)
+        if request.url.path.endswith(LARGE):
+            return httpx.Response(200, content=source)
+        return httpx.Response(404)
+
+    service = ThumbnailService(
+        directory=str(tmp_path / "thumbnails"),
+        origin="http://cdn.test/image/",
+        quality=75,
+        max_source_bytes=1 << 20,
+        timeout_seconds=5,
+        max_bytes=1 << 20,
+        failure_ttl_seconds=60,
+        transport=httpx.MockTransport(handler),
+    )
+    app.dependency_overrides[_thumbnail_service] = lambda: service
+    yield service, requests, source
+    app.dependency_overrides = {}
+
+
+def test_pick_variant():
+    """Test the smallest variant at least as wide as the target is chosen."""
+    variants = images((LARGE, 640), (MEDIUM, 300), (SMALL, 64))
+    assert pick_variant(variants, 320) == LARGE
+    assert pick_variant(variants, 300) == MEDIUM
+    assert pick_variant(variants, 1000) == LARGE
+    assert pick_variant([{"url": "https://example.com/a.jpg"}], 320) is None
+
+
+def test_thumbnail_is_resized_and_cached(origin):
+    """Test the first request fetches and resizes, later ones hit the disk."""
+    service, requests, source = origin
+    response = client.get(f"/images/{LARGE}/320.webp")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+    with Image.open(io.BytesIO(response.content)) as thumbnail:
+        assert thumbnail.format == "WEBP"
+        assert thumbnail.size == (320, 320)
+    assert len(response.content) < len(source)
+
+    response = client.get(f"/images/{LARGE}/320.avif")
+    assert response.headers["content-type"] == "image/avif"
+    assert client.get(f"/images/{LARGE}/320.webp").status_code == 200
+    assert requests == [f"/image/{LARGE}"] * 2
+    assert os.path.exists(service.file_path(LARGE, 320, "webp"))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_fetch(origin):
+    """Test a burst for the same missing thumbnail fetches it once."""
+    service, requests, _ = origin
+    bodies = await asyncio.gather(*(service.get(LARGE, 160, "webp") for _ in range(10)))
+    assert len(set(bodies)) == 1
+    assert len(requests) == 1
+
+
+def test_thumbnail_deleted_from_disk_is_recreated(origin):
+    """Test a thumbnail evicted by another worker is made again, not a 500."""
+    service, requests, _ = origin
+    body = client.get(f"/images/{LARGE}/320.webp").content
+    os.remove(service.file_path(LARGE, 320, "webp"))
+
+    response = client.get(f"/images/{LARGE}/320.webp")
+    assert response.status_code == 200
+    assert response.content == body
+    assert len(requests) == 2
+
+
+def test_thumbnail_errors(origin):
+    """Test unknown images, unsupported widths and non-CDN ids are rejected."""
+    assert client.get(f"/images/{MEDIUM}/320.webp").status_code == 404
+    assert client.get(f"/images/{LARGE}/321.webp").status_code == 404
+    assert client.get(f"/images/{LARGE}/320.png").status_code == 422
+    assert client.get("/images/not-an-id/320.webp").status_code == 422
+
+
+def test_failures_are_remembered(origin):
+    """Test an image the CDN lacks is not asked for again for every width."""
+    _, requests, _ = origin
+    for width in (320, 160, 320):
+        assert client.get(f"/images/{MEDIUM}/{width}.webp").status_code == 404
+    assert requests == [f"/image/{MEDIUM}"]
+
+
+def test_directory_is_bounded_by_least_recent_use(origin):
+    """Test the least recently served thumbnails are deleted past the cap."""
+    service, _, _ = origin
+    service.max_bytes = 250
+    first, second, third = (service.file_path(LARGE, w, "webp") for w in (64, 160, 320))
+    service._write(first, b"x" * 100)
+    service._write(second, b"x" * 100)
+    assert service._use(first)
+    service._write(third, b"x" * 100)
+    assert os.path.exists(first) and os.path.exists(third)
+    assert not os.path.exists(second)
+    assert service.size == 200
+
+    # A restarted service finds the files already on disk
+    restarted = ThumbnailService(
+        directory=service.directory,
+        origin=service.origin,
+        quality=75,
+        max_source_bytes=1 << 20,
+        timeout_seconds=5,
+        max_bytes=250,
+        failure_ttl_seconds=60,
+    )
+    assert restarted._use(first)
+    assert restarted.size == 200
+    assert not restarted._use(second)
+
+
+def test_responses_reference_thumbnails():
+    """Test top artists and tracks carry thumbnail URLs beside their images."""
+    token = create_access_token({"sub": "test_token"})
+    headers = {"Authorization": f"Bearer {token}"}
+    artwork = images((LARGE, 640), (MEDIUM, 300), (SMALL, 64))
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_spotify.return_value.current_user.return_value = {"id": "user1"}
+        mock_spotify.return_value.current_user_top_tracks.return_value = {
+            "items": [
+                {"id": "t1", "name": "T", "album": {"id": "a", "images": artwork}}
+            ]
+        }
+        mock_spotify.return_value.current_user_top_artists.return_value = {
+            "items": [{"id": "x", "name": "X", "images": []}]
+        }
+        tracks = client.get("/spotify/top-tracks", headers=headers).json()
+        artists = client.get("/spotify/top-artists", headers=headers).json()
+
+    assert tracks[0]["album"]["thumbnail_url"] == f"/images/{LARGE}/320.webp"
+    assert tracks[0]["album"]["images"][0]["url"] == SPOTIFY_IMAGE_PREFIX + LARGE
+    assert artists[0]["thumbnail_url"] is None
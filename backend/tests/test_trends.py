@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.api.auth import get_current_user
+from app.main import app
+from app.services.trends import rank_delta
+
+client = TestClient(app)
+
+
+def ranked(*ids):
+    return [{"id": item_id, "name": item_id.title()} for item_id in ids]
+
+
+def test_rank_delta():
+    """Test rising, falling, new and dropped items between two lists."""
+    delta = rank_delta(ranked("a", "b", "c", "d"), ranked("c", "a", "e", "d"))
+
+    assert [(i["id"], i["delta"]) for i in delta["rising"]] == [("c", 2)]
+    assert [(i["id"], i["delta"]) for i in delta["falling"]] == [("a", -1)]
+    assert delta["new"] == [{"id": "e", "name": "E", "rank": 3}]
+    assert delta["dropped"] == [{"id": "b", "name": "B", "previous_rank": 2}]
+    # d kept its rank and is not reported
+    assert all(i["id"] != "d" for key in delta for i in delta[key])
+
+
+def test_rank_delta_orders_largest_moves_first():
+    """Test that rising and falling are sorted by the size of the move."""
+    delta = rank_delta(ranked("a", "b", "c", "d"), ranked("d", "c", "b", "a"))
+    assert [i["id"] for i in delta["rising"]] == ["d", "c"]
+    assert [i["id"] for i in delta["falling"]] == ["a", "b"]
+
+
+def test_trends_endpoint_fetches_each_list_once():
+    """Test /spotify/trends computes every comparison from six list fetches."""
+    lists = {
+        "short_term": {"items": ranked("b", "a", "c")},
+        "medium_term": {"items": ranked("a", "b")},
+        "long_term": {"items": ranked("a", "d")},
+    }
+    app.dependency_overrides[get_current_user] = lambda: "test_token"
+    try:
+        with patch("spotipy.Spotify") as mock_spotify:
+            for method in ("current_user_top_tracks", "current_user_top_artists"):
+                getattr(mock_spotify.return_value, method).side_effect = (
+                    lambda limit, time_range: lists[time_range]
+                )
+
+            response = client.get("/spotify/trends")
+            assert response.status_code == 200
+            data = response.json()
+            assert set(data) == {"tracks", "artists"}
+            recent = data["tracks"]["medium_term_to_short_term"]
+            assert [i["id"] for i in recent["rising"]] == ["b"]
+            assert [i["id"] for i in recent["new"]] == ["c"]
+            assert [
+                i["id"] for i in data["artists"]["long_term_to_short_term"]["dropped"]
+            ] == ["d"]
+
+            client.get("/spotify/trends")
+            assert mock_spotify.return_value.current_user_top_tracks.call_count == 3
+            assert mock_spotify.return_value.current_user_top_artists.call_count == 3
+    finally:
+        app.dependency_overrides = {}
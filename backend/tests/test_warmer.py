@@ -0,0 +1,102 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.services.activity import ActivityTracker
+from app.services.spotify import SpotifyService, get_rate_limiter
+from app.services.warmer import DASHBOARD_REQUESTS, CacheWarmer
+
+MOCK_ITEMS = {"items": [{"id": "item1", "name": "Test Item 1"}]}
+
+MOCK_PLAYS = {
+    "items": [
+        {
+            "track": {"id": "item1", "name": "Test Item 1"},
+            "played_at": "2024-01-01T00:00:00.000Z",
+        }
+    ]
+}
+
+
+def make_warmer(tracker: ActivityTracker, concurrency: int = 4) -> CacheWarmer:
+    return CacheWarmer(
+        tracker=tracker,
+        interval_seconds=20,
+        lead_seconds=30,
+        concurrency=concurrency,
+        active_window_seconds=3600,
+        max_pressure=0.5,
+    )
+
+
+def mock_all_endpoints(mock_spotify) -> None:
+    client = mock_spotify.return_value
+    client.current_user_top_tracks.return_value = MOCK_ITEMS
+    client.current_user_top_artists.return_value = MOCK_ITEMS
+    client.current_user_recently_played.return_value = MOCK_PLAYS
+
+
+@pytest.mark.asyncio
+async def test_warmer_fills_dashboard_entries():
+    """Test that one cycle caches every dashboard request of active users."""
+    tracker = ActivityTracker()
+    tracker.touch("user1", "token1")
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_all_endpoints(mock_spotify)
+        counts = await make_warmer(tracker).run_once()
+
+        assert counts == {
+            "refreshed": len(DASHBOARD_REQUESTS),
+            "skipped": 0,
+            "failed": 0,
+        }
+        service = SpotifyService("token1")
+        for _, endpoint, params in DASHBOARD_REQUESTS:
+            assert service.cache_expiry(endpoint, **params) is not None
+
+
+@pytest.mark.asyncio
+async def test_warmer_skips_fresh_entries():
+    """Test that entries far from expiry are not refetched."""
+    tracker = ActivityTracker()
+    tracker.touch("user1", "token1")
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_all_endpoints(mock_spotify)
+        warmer = make_warmer(tracker)
+        await warmer.run_once()
+        counts = await warmer.run_once()
+
+        assert counts["refreshed"] == 0
+        assert mock_spotify.return_value.current_user_top_tracks.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_warmer_backs_off_under_rate_limit_pressure():
+    """Test that refreshes are skipped and the interval grows under pressure."""
+    tracker = ActivityTracker()
+    tracker.touch("user1", "token1")
+    limiter = get_rate_limiter()
+    for _ in range(limiter.burst):
+        await limiter.acquire()
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_all_endpoints(mock_spotify)
+        warmer = make_warmer(tracker)
+        counts = await warmer.run_once()
+
+        assert counts["skipped"] == len(DASHBOARD_REQUESTS)
+        assert warmer.backoff == 2
+        mock_spotify.return_value.current_user_top_tracks.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_warmer_prioritises_recent_users():
+    """Test that the most recently active user is refreshed first."""
+    tracker = ActivityTracker()
+    tracker.touch("older", "older_token")
+    tracker.touch("newer", "newer_token")
+    with patch("spotipy.Spotify") as mock_spotify:
+        mock_all_endpoints(mock_spotify)
+        await make_warmer(tracker, concurrency=1).run_once()
+
+        tokens = [call.kwargs["auth"] for call in mock_spotify.call_args_list]
+        assert tokens.index("newer_token") < tokens.index("older_token")
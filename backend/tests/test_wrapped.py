@@ -0,0 +1,166 @@
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from spotipy.exceptions import SpotifyException
+
+from app.api.auth import get_current_user_id
+from app.main import app
+from app.services.history import SnapshotStore
+from app.services.spotify import get_disk_cache
+from app.services.wrapped import (
+    WrappedJob,
+    load_history,
+    summarize_year,
+    wrapped_key,
+)
+
+client = TestClient(app)
+
+YEAR = 2024
+
+
+def ranked(*ids):
+    return [{"id": item_id, "name": item_id.title()} for item_id in ids]
+
+
+async def app_token():
+    return {"access_token": "app_token", "expires_in": 3600}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / "history.db"), keyframe_days=30)
+    for user_id in ("user1", "user2"):
+        store.record(
+            user_id, "tracks", "short_term", date(YEAR, 1, 1), ranked("a", "b")
+        )
+        store.record(
+            user_id, "tracks", "short_term", date(YEAR, 2, 1), ranked("b", "a")
+        )
+        store.record(user_id, "artists", "short_term", date(YEAR, 1, 1), ranked("x"))
+        # Nothing was captured in between, e.g. while the user was away
+        for day in (date(YEAR, 1, 1), date(YEAR, 2, 1), date(YEAR, 2, 2)):
+            store.mark_captured(user_id, day)
+    # Captured, but only after the year being summarized
+    store.mark_captured("newcomer", date(YEAR + 1, 1, 1))
+    yield store
+    store.close()
+
+
+def test_summarize_year(store):
+    """Test the year's top items, months and genres from daily lists."""
+    history = load_history(store, "user1", YEAR)
+    artist_idx = next(i for i, (sid, _) in history["names"].items() if sid == "x")
+    history["genres"] = {artist_idx: ["indie", "pop"]}
+
+    summary = summarize_year(history)
+    assert summary["days_recorded"] == 3
+    tracks = summary["tracks"]
+    assert [item["id"] for item in tracks["top"]] == ["b", "a"]
+    top = tracks["top"][1]
+    assert top["days_at_number_one"] == 1
+    assert top["days_listed"] == 3
+    assert top["best_rank"] == 1
+    assert tracks["by_month"] == [
+        {"month": f"{YEAR}-01", "id": "a", "name": "A"},
+        {"month": f"{YEAR}-02", "id": "b", "name": "B"},
+    ]
+    assert summary["artists"]["genres"] == [
+        {"genre": "indie", "share": 0.5},
+        {"genre": "pop", "share": 0.5},
+    ]
+    assert load_history(store, "newcomer", YEAR) is None
+
+
+@pytest.mark.asyncio
+async def test_job_checkpoints_and_resumes(store, tmp_path):
+    """Test the batch job caches summaries and skips finished users on rerun."""
+    checkpoint = str(tmp_path / "wrapped.checkpoint")
+
+    def job():
+        return WrappedJob(
+            store=store,
+            disk=get_disk_cache(),
+            year=YEAR,
+            checkpoint_path=checkpoint,
+            workers=1,
+            batch_size=2,
+            app_token=app_token,
+        )
+
+    with patch("spotipy.Spotify") as mock_spotify:
+        artists = mock_spotify.return_value.artists
+        artists.return_value = {
+            "artists": [{"id": "x", "name": "X", "genres": ["pop"]}, None]
+        }
+        counts = await job().run()
+        assert counts["summarized"] == 2
+        assert counts["empty"] == 1
+        assert counts["users_per_second"] > 0
+        # Both users' artists were looked up in one request
+        artists.assert_called_once_with(("x",))
+
+        summary, _ = get_disk_cache().get(wrapped_key("user1", YEAR))
+        assert summary["artists"]["genres"] == [{"genre": "pop", "share": 1.0}]
+        with open(checkpoint) as f:
+            assert sorted(f.read().split()) == ["newcomer", "user1", "user2"]
+
+        counts = await job().run()
+        assert counts["skipped"] == 3
+        assert counts["summarized"] == 0
+
+
+@pytest.mark.asyncio
+async def test_job_renews_app_token_and_survives_failed_lookups(store, tmp_path):
+    """Test a rejected app token is renewed and a failed batch is retried later."""
+    tokens = []
+
+    async def counted_token():
+        tokens.append(f"app_token{len(tokens)}")
+        return {"access_token": tokens[-1], "expires_in": 3600}
+
+    def job():
+        return WrappedJob(
+            store=store,
+            disk=get_disk_cache(),
+            year=YEAR,
+            checkpoint_path=str(tmp_path / "wrapped.checkpoint"),
+            workers=1,
+            batch_size=1,
+            app_token=counted_token,
+        )
+
+    found = {"artists": [{"id": "x", "name": "X", "genres": ["pop"]}]}
+    with patch("spotipy.Spotify") as mock_spotify:
+        artists = mock_spotify.return_value.artists
+        # user1's lookup fails outright; user2's first token is rejected
+        artists.side_effect = [
+            SpotifyException(404, -1, "not found"),
+            SpotifyException(401, -1, "The access token expired"),
+            found,
+        ]
+        counts = await job().run()
+        assert counts["summarized"] == 1
+        assert counts["failed"] == 1
+        assert counts["empty"] == 1
+        assert tokens == ["app_token0", "app_token1"]
+        assert get_disk_cache().get(wrapped_key("user1", YEAR)) is None
+        assert get_disk_cache().get(wrapped_key("user2", YEAR)) is not None
+
+        # The failed user is not checkpointed, so the next run retries it
+        counts = await job().run()
+        assert counts["summarized"] == 1
+        assert counts["skipped"] == 2
+
+
+def test_wrapped_endpoint():
+    """Test the endpoint serves a cached summary and 404s otherwise."""
+    get_disk_cache().set(wrapped_key("user1", YEAR), {"year": YEAR}, 2**31)
+    app.dependency_overrides[get_current_user_id] = lambda: "user1"
+    try:
+        assert client.get(f"/spotify/wrapped/{YEAR}").json() == {"year": YEAR}
+        assert client.get(f"/spotify/wrapped/{YEAR - 1}").status_code == 404
+    finally:
+        app.dependency_overrides = {}
@@ -0,0 +1,82 @@
+"""
+Precompute yearly "Wrapped" summaries for every user with snapshot history.
+
+Summaries are written to the disk cache, from which
+``/spotify/wrapped/{year}`` serves them. Progress is checkpointed after
+every batch; rerunning the same command resumes an interrupted run.
+
+Usage:
+    cd backend
+    python wrapped.py [--year 2026] [--workers 4] [--batch-size 64]
+                      [--checkpoint wrapped-2026.checkpoint] [--restart]
+                      [--no-genres]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date
+
+from app.core.log import TEXT_FORMAT
+from app.services.history import get_snapshot_store
+from app.services.oauth import get_oauth_client
+from app.services.spotify import get_disk_cache
+from app.services.wrapped import WrappedJob
+
+
+async def run(args: argparse.Namespace) -> None:
+    disk = get_disk_cache()
+    if disk is None:
+        raise SystemExit("The disk cache is disabled (DISK_CACHE_ENABLED=false)")
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    oauth = get_oauth_client()
+    job = WrappedJob(
+        store=get_snapshot_store(),
+        disk=disk,
+        year=args.year,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        app_token=oauth.client_credentials if args.genres else None,
+    )
+    try:
+        counts = await job.run()
+    finally:
+        await oauth.aclose()
+    print(
+        f"Wrapped {args.year}: {counts['summarized']} summarized, "
+        f"{counts['empty']} without history, {counts['failed']} failed, "
+        f"{counts['skipped']} already done"
+    )
+    print(
+        f"{counts['seconds']:.1f} s, {counts['users_per_second']:.1f} users/s "
+        f"with {args.workers} workers"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--year", type=int, default=date.today().year)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--checkpoint", help="default: wrapped-<year>.checkpoint")
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore an existing checkpoint"
+    )
+    parser.add_argument(
+        "--no-genres",
+        dest="genres",
+        action="store_false",
+        help="skip the Spotify genre lookup",
+    )
+    args = parser.parse_args()
+    args.checkpoint = args.checkpoint or f"wrapped-{args.year}.checkpoint"
+    logging.basicConfig(level=logging.INFO, format=TEXT_FORMAT)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 import { useEffect, useState } from "react";
 import { Title, Grid, Card, Text, Image, Stack } from "@mantine/core";
-import { spotify } from "../services/api";
+import { artworkUrl, spotify } from "../services/api";
 import { LoadingScreen } from "./LoadingScreen";
 
 interface Artist {
   id: string;
   name: string;
   images: Array<{ url: string }>;
+  thumbnail_url: string | null;
   genres: string[];
 }
 
@@ -56,7 +57,7 @@ export function TopArtists({ timeRange }: TopArtistsProps) {
             <Card shadow="sm" padding="lg" radius="md" withBorder h="100%">
               <Card.Section>
                 <Image
-                  src={artist.images[0]?.url}
+                  src={artworkUrl(artist)}
                   height={160}
                   alt={artist.name}
                   style={{ objectFit: "cover" }}
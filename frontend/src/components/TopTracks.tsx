@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { Title, Grid, Card, Text, Image, Stack } from "@mantine/core";
-import { spotify } from "../services/api";
+import { artworkUrl, spotify } from "../services/api";
 import { LoadingScreen } from "./LoadingScreen";
 
 interface Track {
@@ -10,6 +10,7 @@ interface Track {
   album: {
     name: string;
     images: Array<{ url: string }>;
+    thumbnail_url: string | null;
   };
 }
 
@@ -59,7 +60,7 @@ export function TopTracks({ timeRange }: TopTracksProps) {
             <Card shadow="sm" padding="lg" radius="md" withBorder h="100%">
               <Card.Section>
                 <Image
-                  src={track.album.images[0]?.url}
+                  src={artworkUrl(track.album)}
                   height={160}
                   alt={track.album.name}
                   style={{ objectFit: "cover" }}
@@ -61,6 +61,13 @@ export const auth = {
   },
 };
 
+// Resized artwork served by the backend, falling back to Spotify's original
+export const artworkUrl = (item: {
+  images: Array<{ url: string }>;
+  thumbnail_url?: string | null;
+}) =>
+  item.thumbnail_url ? `${API_URL}${item.thumbnail_url}` : item.images[0]?.url;
+
 export const spotify = {
   getTopTracks: async (timeRange: string = "medium_term", limit: number = 50) => {
     const response = await api.get(
@@ -78,4 +85,16 @@ export const spotify = {
     const response = await api.get("/spotify/recently-played");
     return response.data;
   },
+  // Subscribe to newly played tracks; returns a function that closes the stream
+  streamRecentlyPlayed: (onPlays: (plays: unknown[]) => void) => {
+    const token = localStorage.getItem("token") ?? "";
+    const source = new EventSource(
+      `${API_URL}/spotify/recently-played/stream?token=${encodeURIComponent(token)}`,
+    );
+    source.addEventListener("plays", (event) => {
+      onPlays(JSON.parse((event as MessageEvent).data));
+    });
+    source.addEventListener("expired", () => source.close());
+    return () => source.close();
+  },
 };